@@ -0,0 +1,174 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import math
+import os
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Lower values are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class AdmissionRejected(Exception):
+    """Raised when the upstream wait queue is full; retry_after is in seconds"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Upstream is overloaded, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Permit:
+    """One admitted upstream call; `mark()` records latency early (e.g. first streamed chunk)"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.latency: Optional[float] = None
+
+    def mark(self):
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with a priority wait queue in front of upstream calls.
+
+    A call that finishes within `latency_target` seconds raises the limit by
+    roughly one per limit's worth of calls; an error or a slow call cuts it by
+    `backoff` (at most once per `latency_target`). Waiters are admitted by
+    priority, then arrival order. When `max_queue` callers are already
+    waiting, new callers are rejected immediately with AdmissionRejected.
+    """
+
+    def __init__(self, initial_limit: int = 8, min_limit: int = 1, max_limit: int = 64,
+                 max_queue: int = 128, latency_target: float = 5.0, backoff: float = 0.7):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+        self.max_queue = max_queue
+        self.latency_target = latency_target
+        self.backoff = backoff
+
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._waiting = 0
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+        self.avg_latency = 0.0
+
+        self.admitted = 0
+        self.queued_total = 0
+        self.rejected = 0
+        self.errors = 0
+        self.slow_calls = 0
+
+    @property
+    def saturated(self) -> bool:
+        """True when a new call would be rejected"""
+        return self._waiting >= self.max_queue
+
+    def retry_after(self) -> int:
+        """Rough seconds until the current queue drains"""
+        per_call = self.avg_latency or self.latency_target
+        return max(1, math.ceil((self._waiting + 1) / max(int(self.limit), 1) * per_call))
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        if self.in_flight < int(self.limit) and not self._waiting:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if self.saturated:
+            self.rejected += 1
+            raise AdmissionRejected(self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._waiting += 1
+        self.queued_total += 1
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as the caller went away: hand the slot on
+                self._release_slot()
+            else:
+                self._waiting -= 1
+            raise
+
+    def release(self, latency: Optional[float], failed: bool = False):
+        """Free a slot and adapt the limit; latency None means no signal (e.g. cancelled)"""
+        if latency is not None:
+            self.avg_latency = latency if not self.avg_latency else 0.8 * self.avg_latency + 0.2 * latency
+            slow = latency > self.latency_target
+            if failed or slow:
+                self.errors += failed
+                self.slow_calls += slow
+                now = time.monotonic()
+                if now - self._last_decrease >= self.latency_target:
+                    self._last_decrease = now
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    logger.info(f"Upstream concurrency limit lowered to {int(self.limit)}")
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._release_slot()
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+            future.set_result(None)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[Permit]:
+        """Hold one admitted slot for the duration of the block"""
+        await self.acquire(priority)
+        permit = Permit()
+        try:
+            yield permit
+        except Exception:
+            permit.mark()
+            self.release(permit.latency, failed=True)
+            raise
+        except BaseException:
+            self.release(None)
+            raise
+        else:
+            permit.mark()
+            self.release(permit.latency)
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": self._waiting,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queued_total": self.queued_total,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "slow_calls": self.slow_calls,
+            "avg_latency_ms": self.avg_latency * 1000
+        }
+
+
+def limiter_from_env() -> AdaptiveLimiter:
+    """Build the shared upstream limiter from UPSTREAM_* environment variables"""
+    return AdaptiveLimiter(
+        initial_limit=int(os.getenv('UPSTREAM_CONCURRENCY_INITIAL', '8')),
+        min_limit=int(os.getenv('UPSTREAM_CONCURRENCY_MIN', '1')),
+        max_limit=int(os.getenv('UPSTREAM_CONCURRENCY_MAX', '64')),
+        max_queue=int(os.getenv('UPSTREAM_QUEUE_SIZE', '128')),
+        latency_target=float(os.getenv('UPSTREAM_LATENCY_TARGET_MS', '5000')) / 1000
+    )
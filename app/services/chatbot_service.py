@@ -2,9 +2,9 @@ from typing import Optional
 from fastapi import UploadFile
 import PyPDF2
 from io import BytesIO
-from deep_translator import GoogleTranslator
 import google.generativeai as genai
 from app.services.db_service import DatabaseService
+from services.transliterator import get_transliterator
 import os
 import asyncio
 import logging
@@ -39,7 +39,8 @@ class ChatbotService:
             )
             
             self.chat_history = []
-            self.translator = GoogleTranslator(source='auto', target='bn')
+            # Local phonetic transliteration, shared with BanglishService
+            self.transliterator = get_transliterator()
             self.db_service = None
             self.current_conversation = None
             logger.info("ChatbotService initialized successfully")
@@ -87,8 +88,7 @@ class ChatbotService:
     async def convert_banglish_to_bangla(self, text: str) -> str:
         """Convert Banglish text to Bangla"""
         try:
-            translation = self.translator.translate(text)
-            return translation
+            return self.transliterator.transliterate(text)
         except Exception as e:
             print(f"Translation error: {e}")
             return text
@@ -0,0 +1,175 @@
+import logging
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Phonetic scheme (an Avro-style subset for lowercase Banglish).
+# Vowels map to (independent letter, dependent sign after a consonant);
+# "o" is the inherent vowel, so after a consonant it adds nothing.
+VOWELS: Dict[str, Tuple[str, str]] = {
+    "o": ("অ", ""),
+    "a": ("আ", "া"),
+    "aa": ("আ", "া"),
+    "i": ("ই", "ি"),
+    "ee": ("ঈ", "ী"),
+    "u": ("উ", "ু"),
+    "oo": ("উ", "ু"),
+    "rri": ("ঋ", "ৃ"),
+    "e": ("এ", "ে"),
+    "oi": ("ঐ", "ৈ"),
+    "ou": ("ঔ", "ৌ"),
+    "w": ("ও", "ো"),
+}
+
+CONSONANTS: Dict[str, str] = {
+    "k": "ক", "kh": "খ", "g": "গ", "gh": "ঘ",
+    "c": "চ", "ch": "ছ", "chh": "ছ", "j": "জ", "jh": "ঝ",
+    "t": "ত", "th": "থ", "d": "দ", "dh": "ধ", "n": "ন",
+    "p": "প", "ph": "ফ", "f": "ফ", "b": "ব", "bh": "ভ", "v": "ভ", "m": "ম",
+    "z": "য", "r": "র", "l": "ল", "sh": "শ", "s": "স", "h": "হ",
+    "y": "য়", "q": "ক", "x": "ক্স", "kkh": "ক্ষ",
+}
+
+# Signs that attach to the preceding letter and never start a conjunct
+SIGNS: Dict[str, str] = {
+    "ng": "ং",
+    "nng": "ঙ",
+}
+
+DIGITS = str.maketrans("0123456789", "০১২৩৪৫৬৭৮৯")
+
+HASANTA = "্"
+
+# Common words whose spelling the phonetic rules get wrong (or only nearly right)
+KNOWN_WORDS: Dict[str, str] = {
+    "ami": "আমি",
+    "tumi": "তুমি",
+    "apni": "আপনি",
+    "kemon": "কেমন",
+    "acho": "আছো",
+    "achen": "আছেন",
+    "bhalo": "ভালো",
+    "kothay": "কোথায়",
+    "ki": "কি",
+    "korcho": "করছো",
+    "korchen": "করছেন",
+    "bolo": "বলো",
+    "bolun": "বলুন",
+    "dhaka": "ঢাকা",
+    "bangla": "বাংলা",
+    "english": "ইংরেজি",
+    "shikhi": "শিখি",
+    "shikhbo": "শিখবো",
+    "jani": "জানি",
+    "janina": "জানিনা",
+    "bujhi": "বুঝি",
+    "bujhina": "বুঝিনা",
+    "khub": "খুব",
+    "onek": "অনেক",
+    "sundor": "সুন্দর",
+    "kotha": "কথা",
+    "keno": "কেন",
+    "hobe": "হবে",
+    "koro": "করো",
+    "korun": "করুন",
+    "habijabi": "হাবিজাবি"
+}
+
+WORD_PATTERN = re.compile(r"[a-z]+")
+
+
+class Transliterator:
+    """Banglish -> Bangla script by longest match over a trie of Latin clusters.
+
+    Known words are looked up whole first; anything else is spelled out
+    phonetically, so out-of-vocabulary words still come out in Bangla script.
+    Consecutive consonants are joined with a hasanta into a conjunct, and a
+    word-final "o" after a consonant is written as the o-sign, the way
+    Banglish spells verb endings ("koro", "bolo").
+    """
+
+    def __init__(self, known_words: Optional[Dict[str, str]] = None, cache_size: int = 65536):
+        self._known_words = dict(KNOWN_WORDS if known_words is None else known_words)
+        self._trie = self._compile()
+        self.transliterate_word = lru_cache(maxsize=cache_size)(self._transliterate_word)
+
+    @staticmethod
+    def _compile() -> dict:
+        """Trie of every Latin cluster; a node's None key holds (kind, output)"""
+        trie: dict = {}
+        entries = [(latin, ("vowel", forms)) for latin, forms in VOWELS.items()]
+        entries += [(latin, ("consonant", letter)) for latin, letter in CONSONANTS.items()]
+        entries += [(latin, ("sign", sign)) for latin, sign in SIGNS.items()]
+        for latin, value in entries:
+            node = trie
+            for char in latin:
+                node = node.setdefault(char, {})
+            node[None] = value
+        return trie
+
+    def _longest_match(self, word: str, start: int) -> Tuple[int, Optional[tuple]]:
+        node = self._trie
+        end, value = start, None
+        for i in range(start, len(word)):
+            node = node.get(word[i])
+            if node is None:
+                break
+            if None in node:
+                end, value = i + 1, node[None]
+        return end, value
+
+    def _transliterate_word(self, word: str) -> str:
+        known = self._known_words.get(word)
+        if known is not None:
+            return known
+
+        output = []
+        previous = None
+        i = 0
+        while i < len(word):
+            end, value = self._longest_match(word, i)
+            if value is None:
+                output.append(word[i])
+                previous = None
+                i += 1
+                continue
+            kind, letter = value
+            if kind == "consonant":
+                output.append(HASANTA + letter if previous == "consonant" else letter)
+            elif kind == "vowel":
+                independent, dependent = letter
+                if previous != "consonant":
+                    output.append(independent)
+                elif word[i:end] == "o" and end == len(word):
+                    output.append("ো")
+                else:
+                    output.append(dependent)
+            else:
+                output.append(letter)
+            previous = kind
+            i = end
+        return "".join(output)
+
+    def transliterate(self, text: str) -> str:
+        """Transliterate every Latin word in `text`, keeping spacing and punctuation"""
+        return WORD_PATTERN.sub(
+            lambda match: self.transliterate_word(match.group()), text.lower()
+        ).translate(DIGITS)
+
+
+_shared: Optional[Transliterator] = None
+_shared_lock = threading.Lock()
+
+
+def get_transliterator() -> Transliterator:
+    """The process-wide Transliterator, compiled on first use"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = Transliterator()
+                logger.info("Transliterator compiled")
+    return _shared
@@ -0,0 +1,82 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class BlockingExecutor:
+    """Runs upstream calls without blocking the event loop.
+
+    Synchronous callables go to a bounded thread pool (`run`); native
+    coroutines are awaited directly but still counted (`track`). Queue depth
+    is the number of pool submissions waiting for a free worker.
+    """
+
+    def __init__(self, max_workers: int = 16, name: str = "upstream"):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running_threads = 0
+        self.running_async = 0
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self.running_threads + self.running_async
+
+    def _call(self, fn: Callable, args, kwargs):
+        with self._lock:
+            self.queued -= 1
+            self.running_threads += 1
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.running_threads -= 1
+                self.completed += 1
+        return result
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking callable in the pool and await its result"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.queued += 1
+        return await loop.run_in_executor(
+            self._pool, functools.partial(self._call, fn, args, kwargs)
+        )
+
+    async def track(self, awaitable: Awaitable) -> Any:
+        """Await a native async SDK call, counting it as in flight"""
+        self.running_async += 1
+        try:
+            return await awaitable
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.running_async -= 1
+            self.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "queue_depth": self.queued,
+            "in_flight": self.in_flight,
+            "in_flight_threads": self.running_threads,
+            "in_flight_async": self.running_async,
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import logging
+import numpy as np
+import google.generativeai as genai
+from typing import AsyncIterator, List, Optional, Union
+
+from async_executor import BlockingExecutor
+from embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyDistribution:
+    """Simulated upstream latency, parsed from a spec in milliseconds.
+
+    Specs: "constant:50", "uniform:20:80" or "lognormal:50:0.5" (median and
+    sigma, for a long right tail). `sample()` returns seconds.
+    """
+
+    KINDS = ("constant", "uniform", "lognormal")
+
+    def __init__(self, kind: str = "constant", params: Optional[List[float]] = None, seed: int = 0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution {kind!r}, expected one of {self.KINDS}")
+        self.kind = kind
+        self.params = list(params or [0.0])
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def parse(cls, spec: Union[str, float, "LatencyDistribution"], seed: int = 0) -> "LatencyDistribution":
+        """Build from a spec string, or from a number of seconds (constant)"""
+        if isinstance(spec, LatencyDistribution):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls("constant", [spec * 1000], seed)
+        kind, *params = spec.split(":")
+        return cls(kind, [float(p) for p in params], seed)
+
+    def sample(self) -> float:
+        if self.kind == "constant":
+            ms = self.params[0]
+        elif self.kind == "uniform":
+            ms = self._rng.uniform(self.params[0], self.params[1])
+        else:
+            ms = self.params[0] * float(np.exp(self._rng.normal(0.0, self.params[1])))
+        return max(0.0, ms) / 1000
+
+    def __bool__(self) -> bool:
+        return any(self.params)
+
+    def __repr__(self) -> str:
+        return f"{self.kind}:{':'.join(f'{p:g}' for p in self.params)}"
+
+
+class EmbeddingBackend:
+    """Turns a batch of texts into embeddings, one per text, in order"""
+
+    async def embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        raise NotImplementedError
+
+
+class GeminiEmbeddingBackend(EmbeddingBackend):
+    """Batched genai.embed_content calls, kept off the event loop.
+
+    Uses the SDK's embed_content_async when available and `native_async` is
+    set; otherwise the blocking call runs on the executor's thread pool.
+    """
+
+    def __init__(self, model: str, executor: Optional[BlockingExecutor] = None,
+                 native_async: bool = True):
+        self.model = model
+        self.executor = executor or BlockingExecutor()
+        self.native_async = native_async and hasattr(genai, "embed_content_async")
+
+    async def embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        if self.native_async:
+            result = await self.executor.track(genai.embed_content_async(
+                model=self.model,
+                content=texts,
+                task_type=task_type
+            ))
+        else:
+            result = await self.executor.run(
+                genai.embed_content,
+                model=self.model,
+                content=texts,
+                task_type=task_type
+            )
+        return result["embedding"]
+
+
+class FakeEmbeddingBackend(EmbeddingBackend):
+    """Deterministic offline embeddings with simulated latency.
+
+    Each token of the normalized text contributes a pseudo-random vector
+    seeded by its hash, so identical texts embed identically and texts that
+    share words score as similar. Batch sizes are recorded for inspection.
+    """
+
+    def __init__(self, dim: int = 768,
+                 latency: Union[float, str, LatencyDistribution] = 0.05):
+        self.dim = dim
+        self.latency = LatencyDistribution.parse(latency)
+        self.calls = 0
+        self.batch_sizes: List[int] = []
+
+    def _token_vector(self, token: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(token.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim)
+
+    def embed_text(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim)
+        for token in normalize_text(text).split() or [""]:
+            vec += self._token_vector(token)
+        vec /= np.linalg.norm(vec)
+        return vec.astype(np.float32).tolist()
+
+    async def embed_batch(self, texts: List[str], task_type: str) -> List[List[float]]:
+        self.calls += 1
+        self.batch_sizes.append(len(texts))
+        if self.latency:
+            await asyncio.sleep(self.latency.sample())
+        return [self.embed_text(text) for text in texts]
+
+
+class ChatBackend:
+    """Generates a reply to a prompt given the conversation's history"""
+
+    async def generate(self, prompt: str, history: List[dict]) -> str:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str, history: List[dict]) -> AsyncIterator[str]:
+        """Yield the reply in chunks; defaults to one chunk"""
+        yield await self.generate(prompt, history)
+
+
+class GeminiChatBackend(ChatBackend):
+    """Gemini chat sessions, kept off the event loop like GeminiEmbeddingBackend"""
+
+    def __init__(self, model: genai.GenerativeModel, executor: Optional[BlockingExecutor] = None,
+                 native_async: bool = True):
+        self.model = model
+        self.executor = executor or BlockingExecutor()
+        self.native_async = native_async and hasattr(genai.ChatSession, "send_message_async")
+
+    async def generate(self, prompt: str, history: List[dict]) -> str:
+        chat = self.model.start_chat(history=history)
+        if self.native_async:
+            response = await self.executor.track(chat.send_message_async(prompt))
+        else:
+            response = await self.executor.run(chat.send_message, prompt)
+        return response.text if response else ""
+
+    async def stream(self, prompt: str, history: List[dict]) -> AsyncIterator[str]:
+        chat = self.model.start_chat(history=history)
+        if self.native_async:
+            response = await self.executor.track(chat.send_message_async(prompt, stream=True))
+            async for chunk in response:
+                yield chunk.text
+        else:
+            # Pull each chunk of the blocking iterator on the thread pool
+            chunks = iter(await self.executor.run(chat.send_message, prompt, stream=True))
+            while True:
+                chunk = await self.executor.run(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk.text
+
+
+class FakeChatBackend(ChatBackend):
+    """Deterministic offline replies with simulated latency.
+
+    The reply is derived from a hash of the prompt, so the same prompt always
+    gets the same answer. Streaming spreads the sampled latency over
+    `chunks` pieces.
+    """
+
+    def __init__(self, latency: Union[float, str, LatencyDistribution] = 0.5,
+                 reply_words: int = 40, chunks: int = 8):
+        self.latency = LatencyDistribution.parse(latency)
+        self.reply_words = reply_words
+        self.chunks = max(1, chunks)
+        self.calls = 0
+
+    def reply_for(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        words = [digest[(i * 4) % len(digest):][:4] for i in range(self.reply_words)]
+        return "উত্তর " + " ".join(words)
+
+    async def generate(self, prompt: str, history: List[dict]) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency.sample())
+        return self.reply_for(prompt)
+
+    async def stream(self, prompt: str, history: List[dict]) -> AsyncIterator[str]:
+        self.calls += 1
+        words = self.reply_for(prompt).split(" ")
+        step = -(-len(words) // self.chunks)
+        delay = self.latency.sample() / self.chunks if self.latency else 0.0
+        for i in range(0, len(words), step):
+            if delay:
+                await asyncio.sleep(delay)
+            yield " ".join(words[i:i + step]) + (" " if i + step < len(words) else "")
@@ -1,24 +1,117 @@
 import logging
-from typing import List, Optional, Dict, Tuple
+import os
+import threading
+import time
+from collections.abc import Mapping
+from typing import Iterable, Iterator, List, Optional, Dict, Set, Tuple
+import numpy as np
 from rapidfuzz import fuzz, process
 from pathlib import Path
 import json
+from compiled_dictionary import CompiledDictionary, compile_dictionary
+from symspell import DeletionIndex
+from token_memo import TokenMemo
+from app.services.transliterator import get_transliterator
 
 logger = logging.getLogger(__name__)
 
+# Minimum share of a batched cdist matrix that must be real token/candidate pairs
+CDIST_MIN_FILL = 0.9
+
+CORRECTION_THRESHOLD = 80
+# Lower threshold for suggestions
+SUGGESTION_THRESHOLD = 65
+SUGGESTIONS_PER_WORD = 3
+
+# (correction or None, its score, fuzzy suggestions as (word, score) best first,
+# or None until they have been asked for)
+TokenCorrection = Tuple[Optional[str], float, Optional[Tuple[Tuple[str, float], ...]]]
+
+
+class CorrectionTable(Mapping):
+    """Compiled misspelling -> word mapping with learned corrections layered on top"""
+
+    def __init__(self, compiled: CompiledDictionary):
+        self.compiled = compiled
+        self.learned: Dict[str, str] = {}
+
+    def __getitem__(self, misspelling: str) -> str:
+        correction = self.learned.get(misspelling)
+        return correction if correction is not None else self.compiled[misspelling]
+
+    def __contains__(self, misspelling) -> bool:
+        return misspelling in self.learned or misspelling in self.compiled
+
+    def __iter__(self) -> Iterator[str]:
+        yield from list(self.learned)
+        for misspelling in self.compiled:
+            if misspelling not in self.learned:
+                yield misspelling
+
+    def __len__(self) -> int:
+        return len(self.compiled) + sum(1 for m in self.learned if m not in self.compiled)
+
+
+class DictionarySnapshot:
+    """One version of the dictionary, swapped in whole on reload"""
+
+    def __init__(self, compiled: CompiledDictionary, correction_index: DeletionIndex):
+        self.corrections = CorrectionTable(compiled)
+        self.correct_words: Set[str] = set(compiled.words())
+        self.correction_index = correction_index
+        # Bytes of the learned-corrections log applied so far
+        self.learned_offset = 0
+
+    def learn(self, misspelling: str, correction: str) -> bool:
+        """Apply one learned correction; True if it introduced a new correct word"""
+        self.corrections.learned[misspelling] = correction
+        if correction in self.correct_words:
+            return False
+        self.correct_words.add(correction)
+        self.correction_index.add(correction)
+        return True
+
+
 class BanglishService:
-    def __init__(self):
+    def __init__(self, mapping_file: Optional[Path] = None):
         try:
-            self.mapping_file = Path("data/banglish_mapping.json")
-            # Dictionary to store misspelled -> correct mappings
-            self.spelling_corrections = self._load_spelling_corrections()
-            # Set of correct Banglish words
-            self.correct_words = set(self.spelling_corrections.values())
+            # Source of truth, compiled into a memory-mapped file that all
+            # workers share, plus an append-only log of learned corrections
+            self.mapping_file = Path(mapping_file or "data/banglish_mapping.json")
+            self.compiled_file = self.mapping_file.with_suffix(".bin")
+            self.learned_file = self.mapping_file.with_suffix(".learned.jsonl")
+            # Batched scoring: max cdist matrix size per call, and its thread count
+            self.cdist_cells = int(os.getenv('BANGLISH_CDIST_CELLS', '262144'))
+            self.cdist_workers = int(os.getenv('BANGLISH_CDIST_WORKERS', '1'))
+            # Per-token results; invalidated whenever the dictionary changes
+            self.token_memo: TokenMemo[TokenCorrection] = TokenMemo(
+                int(os.getenv('BANGLISH_MEMO_SIZE', '10000'))
+            )
+            self._reload_lock = threading.Lock()
+            self._reload_thread: Optional[threading.Thread] = None
+            self.reloads = 0
+            self._dictionary = self._load_dictionary()
+            self.reload_check_interval = float(os.getenv('BANGLISH_RELOAD_CHECK_INTERVAL', '1'))
+            self._next_reload_check = time.monotonic() + self.reload_check_interval
             logger.info("BanglishService initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing BanglishService: {e}")
             raise
 
+    @property
+    def spelling_corrections(self) -> CorrectionTable:
+        """Misspelling -> correct word"""
+        return self._dictionary.corrections
+
+    @property
+    def correct_words(self) -> Set[str]:
+        return self._dictionary.correct_words
+
+    @property
+    def correction_index(self) -> DeletionIndex:
+        """Fuzzy lookups only score words within a few edits of the input"""
+        return self._dictionary.correction_index
+
     def _load_spelling_corrections(self) -> Dict[str, str]:
         """Load or create Banglish spelling corrections"""
         default_corrections = {
@@ -89,23 +182,309 @@ class BanglishService:
             logger.error(f"Error loading spelling corrections: {e}")
             return default_corrections
 
-    def _find_best_match(self, word: str, threshold: int = 80) -> Tuple[Optional[str], int]:
+    @staticmethod
+    def _file_signature(path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            stat = path.stat()
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _open_compiled(self) -> CompiledDictionary:
+        """Map the compiled dictionary, (re)compiling it if the JSON changed since"""
+        # Taken before reading the JSON so a write racing the compile is picked up later
+        source_signature = self._file_signature(self.mapping_file)
+        if source_signature is None:
+            # The load creates the file with the defaults
+            self._load_spelling_corrections()
+            source_signature = self._file_signature(self.mapping_file)
+        try:
+            compiled = CompiledDictionary(self.compiled_file)
+            if compiled.source_signature == source_signature:
+                return compiled
+        except (OSError, ValueError) as e:
+            logger.info(f"Compiled dictionary unusable, rebuilding: {e}")
+        compile_dictionary(self._load_spelling_corrections(), self.compiled_file, source_signature)
+        return CompiledDictionary(self.compiled_file)
+
+    def _load_dictionary(self) -> DictionarySnapshot:
+        compiled = self._open_compiled()
+        snapshot = DictionarySnapshot(compiled, self._build_correction_index(compiled.words()))
+        self._apply_learned_log(snapshot)
+        logger.info(f"Loaded Banglish dictionary: {len(snapshot.corrections)} corrections, "
+                    f"{len(snapshot.corrections.learned)} learned")
+        return snapshot
+
+    def _apply_learned_log(self, snapshot: DictionarySnapshot) -> Tuple[List[str], bool]:
+        """Apply the log's new lines; returns the misspellings and whether a word was added"""
+        try:
+            with open(self.learned_file, 'rb') as f:
+                f.seek(snapshot.learned_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], False
+        # A line still being appended by another worker is left for next time
+        end = data.rfind(b"\n") + 1
+        misspellings = []
+        new_words = False
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+                new_words |= snapshot.learn(entry["misspelling"], entry["correction"])
+                misspellings.append(entry["misspelling"])
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Skipping invalid learned correction: {e}")
+        snapshot.learned_offset += end
+        return misspellings, new_words
+
+    def _invalidate(self, misspellings: List[str], new_words: bool):
+        """A new correct word can change any fuzzy result; otherwise only exact lookups change"""
+        if new_words:
+            self.token_memo.clear()
+        else:
+            for misspelling in misspellings:
+                self.token_memo.discard(misspelling)
+
+    def _is_stale(self, snapshot: DictionarySnapshot) -> bool:
+        """True if the JSON or the compiled file changed since the snapshot was loaded"""
+        compiled = snapshot.corrections.compiled
+        return (self._file_signature(self.mapping_file) != compiled.source_signature
+                or self._file_signature(self.compiled_file) != compiled.file_signature)
+
+    def reload(self):
+        """Load the dictionary again and swap it in atomically"""
+        with self._reload_lock:
+            self._swap_dictionary()
+
+    def _swap_dictionary(self):
+        """Caller holds _reload_lock"""
+        self._dictionary = self._load_dictionary()
+        self.token_memo.clear()
+        self.reloads += 1
+
+    def _background_reload(self):
+        """Rebuild off the request path; the caller has acquired _reload_lock"""
+        try:
+            # Another thread may have reloaded since the staleness check
+            if self._is_stale(self._dictionary):
+                self._swap_dictionary()
+        except Exception as e:
+            logger.error(f"Error reloading Banglish dictionary: {e}")
+        finally:
+            self._reload_lock.release()
+
+    def wait_for_reload(self, timeout: Optional[float] = None):
+        """Block until a background reload that has started is done"""
+        thread = self._reload_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _reload_if_changed(self):
+        """Start a background reload for changed files; apply new learned corrections"""
+        now = time.monotonic()
+        if now < self._next_reload_check:
+            return
+        self._next_reload_check = now + self.reload_check_interval
+        if self._is_stale(self._dictionary):
+            if self._reload_lock.acquire(blocking=False):
+                self._reload_thread = threading.Thread(
+                    target=self._background_reload, name="banglish-reload", daemon=True
+                )
+                self._reload_thread.start()
+            return
+        learned = self._file_signature(self.learned_file)
+        if learned and learned[1] > self._dictionary.learned_offset:
+            if self._reload_lock.acquire(blocking=False):
+                try:
+                    self._invalidate(*self._apply_learned_log(self._dictionary))
+                finally:
+                    self._reload_lock.release()
+
+    def add_correction(self, misspelling: str, correction: str):
+        """Learn a one-word correction now and log it for other workers; ValueError otherwise"""
+        misspelling = misspelling.strip().lower()
+        correction = correction.strip().lower()
+        if len(misspelling.split()) != 1 or len(correction.split()) != 1:
+            raise ValueError("A correction maps one word to one word")
+        if misspelling == correction:
+            raise ValueError("Misspelling and correction are the same word")
+
+        line = json.dumps({
+            "misspelling": misspelling,
+            "correction": correction,
+            "learned_at": time.time()
+        }, ensure_ascii=False) + "\n"
+        with self._reload_lock:
+            self.learned_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.learned_file, 'ab') as f:
+                f.write(line.encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            # The log replay will apply it again later; learning is idempotent
+            new_word = self._dictionary.learn(misspelling, correction)
+            self._invalidate([misspelling], new_word)
+        logger.info(f"Learned Banglish correction {misspelling} -> {correction}")
+
+    def dictionary_stats(self) -> dict:
+        dictionary = self._dictionary
+        return {
+            "corrections": len(dictionary.corrections),
+            "learned": len(dictionary.corrections.learned),
+            "correct_words": len(dictionary.correct_words),
+            "compiled_file": str(self.compiled_file),
+            "compiled_bytes": dictionary.corrections.compiled.nbytes,
+            "reloads": self.reloads
+        }
+
+    def _build_correction_index(self, words: Iterable[str]) -> DeletionIndex:
+        """Deletion index over the correct words, built once per dictionary load"""
+        return DeletionIndex(
+            words,
+            max_distance=int(os.getenv('BANGLISH_MAX_EDIT_DISTANCE', '2')),
+            prefix_length=int(os.getenv('BANGLISH_INDEX_PREFIX', '7'))
+        )
+
+    def _candidate_chunks(self, tokens: Iterable[str],
+                          index: DeletionIndex) -> Iterator[Tuple[List[str], List[str], List[List[int]]]]:
+        """Group tokens into (tokens, choices, per-token choice columns) score matrices.
+
+        Each chunk's choices are the sorted union of its tokens' index
+        candidates, so ties break alphabetically however tokens are chunked.
+        Cells outside a token's own candidates are wasted work, so a token
+        starts a new chunk when adding it would leave the matrix less than
+        CDIST_MIN_FILL full, or the matrix would exceed cdist_cells.
+        """
+        chunk, candidate_sets, union, used = [], [], set(), 0
+        for token in tokens:
+            candidates = index.candidates(token)
+            if not candidates:
+                continue
+            if chunk:
+                # Cheap lower bound on the new matrix size first: with large
+                # dictionaries most tokens fail it and never build the union
+                cells = (len(chunk) + 1) * max(len(union), len(candidates))
+                if used + len(candidates) >= CDIST_MIN_FILL * cells:
+                    cells = (len(chunk) + 1) * len(union | candidates)
+                if cells > self.cdist_cells or used + len(candidates) < CDIST_MIN_FILL * cells:
+                    yield self._chunk_matrix(chunk, candidate_sets, union)
+                    chunk, candidate_sets, union, used = [], [], set(), 0
+            chunk.append(token)
+            candidate_sets.append(candidates)
+            union |= candidates
+            used += len(candidates)
+        if chunk:
+            yield self._chunk_matrix(chunk, candidate_sets, union)
+
+    @staticmethod
+    def _chunk_matrix(chunk: List[str], candidate_sets: List[set],
+                      union: set) -> Tuple[List[str], List[str], List[List[int]]]:
+        choices = sorted(union)
+        if len(chunk) == 1:
+            return chunk, choices, []
+        column = {word: i for i, word in enumerate(choices)}
+        return chunk, choices, [[column[word] for word in candidates] for candidates in candidate_sets]
+
+    def _match_tokens(self, tokens: Iterable[str], threshold: int, limit: int = 1,
+                      index: Optional[DeletionIndex] = None) -> Dict[str, List[Tuple[str, float]]]:
+        """Up to `limit` WRatio matches per distinct token, best first.
+
+        Tokens whose candidates overlap are scored together with one
+        process.cdist call per chunk; scores outside a token's own index
+        candidates are masked out, so each token ranks exactly the words a
+        single-word lookup would. A token left alone in its chunk goes through
+        process.extract, which prunes with the best score found so far.
+        """
+        matches = {}
+        index = index or self.correction_index
+        for chunk, choices, columns in self._candidate_chunks(dict.fromkeys(tokens), index):
+            if len(chunk) == 1:
+                if limit == 1:
+                    best = process.extractOne(chunk[0], choices, scorer=fuzz.WRatio,
+                                              score_cutoff=threshold)
+                    found = [best] if best else []
+                else:
+                    found = process.extract(chunk[0], choices, scorer=fuzz.WRatio,
+                                            limit=limit, score_cutoff=threshold)
+                if found:
+                    matches[chunk[0]] = [(match, score) for match, score, _ in found]
+                continue
+            # float64 like process.extract: float32 rounding would reorder near-ties
+            scores = process.cdist(chunk, choices, scorer=fuzz.WRatio, score_cutoff=threshold,
+                                   dtype=np.float64, workers=self.cdist_workers)
+            mask = np.zeros(scores.shape, dtype=bool)
+            for row, cols in enumerate(columns):
+                mask[row, cols] = True
+            scores[~mask] = 0
+            ranked = np.argsort(-scores, axis=1, kind="stable")[:, :limit]
+            for row, token in enumerate(chunk):
+                found = [(choices[col], float(scores[row, col]))
+                         for col in ranked[row] if scores[row, col] >= threshold]
+                if found:
+                    matches[token] = found
+        return matches
+
+    def _lookup_tokens(self, tokens: Iterable[str],
+                       with_suggestions: bool = False) -> Dict[str, TokenCorrection]:
+        """Correction for each distinct token, memoized per token.
+
+        Suggestions are only computed when asked for (they need a wider,
+        slower search); until then a memo entry holds None for them.
+        """
+        self._reload_if_changed()
+        # One snapshot for the whole call, even if a reload swaps it meanwhile
+        dictionary = self._dictionary
+        corrections = dictionary.corrections
+        generation = self.token_memo.generation
+        results = {}
+        corrections_needed = []
+        suggestions_needed = []
+        # Entries without suggestions are misses when suggestions are needed
+        accept = (lambda entry: entry[2] is not None) if with_suggestions else None
+        for token in dict.fromkeys(tokens):
+            entry = self.token_memo.get(token, accept)
+            if entry is not None:
+                results[token] = entry
+            elif with_suggestions:
+                suggestions_needed.append(token)
+            else:
+                corrections_needed.append(token)
+        
+        fuzzy = self._match_tokens(
+            [token for token in corrections_needed if token not in corrections],
+            CORRECTION_THRESHOLD,
+            index=dictionary.correction_index
+        )
+        for token in corrections_needed:
+            if token in corrections:
+                entry = (corrections[token], 100, None)
+            elif token in fuzzy:
+                entry = (*fuzzy[token][0], None)
+            else:
+                entry = (None, 0, None)
+            self.token_memo.put(token, entry, generation)
+            results[token] = entry
+        
+        fuzzy = self._match_tokens(suggestions_needed, SUGGESTION_THRESHOLD, SUGGESTIONS_PER_WORD,
+                                   index=dictionary.correction_index)
+        for token in suggestions_needed:
+            suggestions = tuple(fuzzy.get(token, ()))
+            # Exact mappings first, then the best fuzzy match if it is close enough
+            if token in corrections:
+                entry = (corrections[token], 100, suggestions)
+            elif suggestions and suggestions[0][1] >= CORRECTION_THRESHOLD:
+                entry = (*suggestions[0], suggestions)
+            else:
+                entry = (None, 0, suggestions)
+            self.token_memo.put(token, entry, generation)
+            results[token] = entry
+        return results
+
+    def _find_best_match(self, word: str) -> Tuple[Optional[str], float]:
         """Find best matching correct word using fuzzy matching"""
         try:
-            # First check exact matches in spelling corrections
-            if word in self.spelling_corrections:
-                return self.spelling_corrections[word], 100
-            
-            # Then try fuzzy matching with correct words
-            match = process.extractOne(
-                word,
-                self.correct_words,
-                scorer=fuzz.WRatio,
-                score_cutoff=threshold
-            )
-            
-            if match:
-                return match[0], match[1]
+            correction, score, _ = self._lookup_tokens([word])[word]
+            if correction:
+                return correction, score
             return None, 0
             
         except Exception as e:
@@ -114,56 +493,59 @@ class BanglishService:
 
     async def get_correction(self, text: str) -> Optional[str]:
         """Get spelling correction for Banglish text"""
+        return self.correct_text(text)
+
+    def correct_text(self, text: str) -> Optional[str]:
+        """Synchronous get_correction, safe to run in a worker thread"""
+        return self.correct_texts([text])[0]
+
+    def correct_texts(self, texts: List[str]) -> List[Optional[str]]:
+        """Correct many texts at once; each distinct word across them is looked up once.
+
+        Returns one entry per text: the corrected text, or None if unchanged.
+        """
         try:
-            words = text.lower().split()
-            corrected_words = []
-            
-            for word in words:
-                best_match, score = self._find_best_match(word)
-                if best_match:
-                    corrected_words.append(best_match)
-                else:
-                    corrected_words.append(word)
+            tokenized = [text.lower().split() for text in texts]
+            lookups = self._lookup_tokens(word for words in tokenized for word in words)
+            replacements = {word: entry[0] for word, entry in lookups.items() if entry[0]}
             
-            corrected_text = ' '.join(corrected_words)
-            return corrected_text if corrected_text != text else None
+            corrections = []
+            for text, words in zip(texts, tokenized):
+                corrected_text = ' '.join(replacements.get(word, word) for word in words)
+                corrections.append(corrected_text if corrected_text != text else None)
+            return corrections
             
         except Exception as e:
             logger.error(f"Error getting correction: {e}")
-            return None
+            return [None] * len(texts)
 
     async def get_suggestions(self, text: str) -> List[str]:
         """Get possible spelling suggestions using fuzzy matching"""
         try:
             words = text.lower().split()
-            suggestions = set()
+            lookups = self._lookup_tokens(words, with_suggestions=True)
             
-            for word in words:
-                # Get multiple close matches for each word
-                matches = process.extract(
-                    word,
-                    self.correct_words,
-                    scorer=fuzz.WRatio,
-                    limit=3,
-                    score_cutoff=65  # Lower threshold for suggestions
-                )
-                
-                if matches:
-                    # Create suggestions by replacing the word
-                    for match, score in matches:
-                        new_words = words.copy()
-                        new_words[words.index(word)] = match
-                        suggestion = ' '.join(new_words)
-                        suggestions.add(suggestion)
-                
+            # (score, position, replacement); positions keep repeated words apart
+            replacements = []
+            for position, word in enumerate(words):
+                correction, score, suggestions = lookups[word]
+                for match, match_score in suggestions:
+                    if match != word:
+                        replacements.append((match_score, position, match))
                 # Also add exact mapping if available
                 if word in self.spelling_corrections:
-                    new_words = words.copy()
-                    new_words[words.index(word)] = self.spelling_corrections[word]
-                    suggestion = ' '.join(new_words)
-                    suggestions.add(suggestion)
+                    replacements.append((100, position, self.spelling_corrections[word]))
+            replacements.sort(key=lambda r: (-r[0], r[1]))
             
-            return list(suggestions)[:5]  # Return top 5 unique suggestions
+            # Only the top 5 unique suggestions are ever materialized
+            suggestions = []
+            for score, position, replacement in replacements:
+                suggestion = ' '.join(words[:position] + [replacement] + words[position + 1:])
+                if suggestion not in suggestions:
+                    suggestions.append(suggestion)
+                    if len(suggestions) == 5:
+                        break
+            return suggestions
             
         except Exception as e:
             logger.error(f"Error getting suggestions: {e}")
@@ -172,48 +554,7 @@ class BanglishService:
     def get_bangla_for_suggestion(self, suggestion: str) -> str:
         """Get Bangla translation for a suggestion"""
         try:
-            # Load Bangla translations
-            bangla_map = {
-                "ami": "আমি",
-                "tumi": "তুমি",
-                "apni": "আপনি",
-                "kemon": "কেমন",
-                "acho": "আছো",
-                "achen": "আছেন",
-                "bhalo": "ভালো",
-                "kothay": "কোথায়",
-                "ki": "কি",
-                "korcho": "করছো",
-                "korchen": "করছেন",
-                "bolo": "বলো",
-                "bolun": "বলুন",
-                "dhaka": "ঢাকা",
-                "bangla": "বাংলা",
-                "english": "ইংরেজি",
-                "shikhi": "শিখি",
-                "shikhbo": "শিখবো",
-                "jani": "জানি",
-                "janina": "জানিনা",
-                "bujhi": "বুঝি",
-                "bujhina": "বুঝিনা",
-                "khub": "খুব",
-                "onek": "অনেক",
-                "sundor": "সুন্দর",
-                "kotha": "কথা",
-                "keno": "কেন",
-                "hobe": "হবে",
-                "koro": "করো",
-                "korun": "করুন",
-                "habijabi": "হাবিজাবি"
-            }
-            
-            words = suggestion.split()
-            bangla_words = []
-            
-            for word in words:
-                bangla_words.append(bangla_map.get(word, word))
-            
-            return ' '.join(bangla_words)
+            return get_transliterator().transliterate(suggestion)
         except Exception as e:
             logger.error(f"Error getting Bangla translation: {e}")
-            return suggestion
\ No newline at end of file
+            return suggestion
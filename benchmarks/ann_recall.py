@@ -0,0 +1,85 @@
+"""Recall/latency benchmark: IVFIndex against exact VectorIndex search.
+
+Run from the repository root:
+
+    python -m benchmarks.ann_recall --size 50000 --nprobe 1 2 4 8 16 32
+"""
+import argparse
+import time
+import numpy as np
+from vector_index import IVFIndex, VectorIndex
+
+
+def make_dataset(size: int, dim: int, topics: int, noise: float, seed: int):
+    """Clustered unit vectors, roughly shaped like sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(topics, dim)).astype(np.float32)
+    labels = rng.integers(0, topics, size=size)
+    data = centers[labels] + rng.normal(scale=noise, size=(size, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    return data, centers, rng
+
+
+def make_queries(centers: np.ndarray, count: int, noise: float, rng: np.random.Generator):
+    labels = rng.integers(0, len(centers), size=count)
+    queries = centers[labels] + rng.normal(scale=noise, size=(count, centers.shape[1]))
+    return queries.astype(np.float32)
+
+
+def timed_search(index, queries, **kwargs):
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(index.search(query, **kwargs))
+    elapsed = (time.perf_counter() - start) / len(queries)
+    return results, elapsed * 1000
+
+
+def recall(truth, found) -> float:
+    hits = total = 0
+    for expected, got in zip(truth, found):
+        expected_ids = {item_id for item_id, _ in expected}
+        hits += len(expected_ids & {item_id for item_id, _ in got})
+        total += len(expected_ids)
+    return hits / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=2.0,
+                        help="per-dimension noise around each topic centre")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data, centers, rng = make_dataset(args.size, args.dim, args.topics, args.noise, args.seed)
+    queries = make_queries(centers, args.queries, args.noise, rng)
+    embeddings = {f"cache_{i}": row for i, row in enumerate(data)}
+
+    start = time.perf_counter()
+    exact = VectorIndex.from_embeddings(embeddings)
+    print(f"exact build: {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    approx = IVFIndex.from_embeddings(embeddings, min_train_size=1)
+    print(f"ivf build:   {time.perf_counter() - start:.2f}s "
+          f"({len(approx._cells)} lists)")
+
+    truth_k, exact_ms = timed_search(exact, queries, k=args.k)
+    truth_t, _ = timed_search(exact, queries, threshold=args.threshold)
+    print(f"\nexact search: {exact_ms:.3f} ms/query")
+    print(f"{'nprobe':>6} {'recall@k':>9} {'recall@thr':>11} {'ms/query':>9} {'speedup':>8}")
+    for nprobe in args.nprobe:
+        found_k, approx_ms = timed_search(approx, queries, k=args.k, nprobe=nprobe)
+        found_t, _ = timed_search(approx, queries, threshold=args.threshold, nprobe=nprobe)
+        print(f"{nprobe:>6} {recall(truth_k, found_k):>9.3f} {recall(truth_t, found_t):>11.3f} "
+              f"{approx_ms:>9.3f} {exact_ms / approx_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
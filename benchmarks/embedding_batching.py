@@ -0,0 +1,57 @@
+"""Batch-size/latency benchmark for EmbeddingBatcher on the fake backend.
+
+Run from the repository root:
+
+    python -m benchmarks.embedding_batching --requests 1000 --concurrency 64
+"""
+import argparse
+import asyncio
+import time
+import numpy as np
+from backends import FakeEmbeddingBackend
+from embedding_batcher import EmbeddingBatcher
+
+
+async def run(args, max_batch_size: int):
+    backend = FakeEmbeddingBackend(latency=args.backend_latency_ms / 1000)
+    batcher = EmbeddingBatcher(backend, max_batch_size=max_batch_size,
+                               max_wait=args.max_wait_ms / 1000)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await batcher.embed(f"message number {i % args.distinct}", "RETRIEVAL_DOCUMENT")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    sizes = np.array(backend.batch_sizes)
+    print(f"{max_batch_size:>9} {backend.calls:>7} {sizes.mean():>9.1f} {sizes.max():>6} "
+          f"{np.percentile(latencies_ms, 50):>8.1f} {np.percentile(latencies_ms, 99):>8.1f} "
+          f"{args.requests / elapsed:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--distinct", type=int, default=10000,
+                        help="number of distinct texts cycled through")
+    parser.add_argument("--backend-latency-ms", type=float, default=50)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128])
+    args = parser.parse_args()
+
+    print(f"{'max_batch':>9} {'calls':>7} {'avg_batch':>9} {'max':>6} "
+          f"{'p50_ms':>8} {'p99_ms':>8} {'req/s':>9}")
+    for max_batch_size in args.batch_sizes:
+        asyncio.run(run(args, max_batch_size))
+
+
+if __name__ == "__main__":
+    main()
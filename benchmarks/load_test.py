@@ -0,0 +1,158 @@
+"""Offline load test of the FastAPI app on the fake chat/embedding backends.
+
+Requests are driven straight into the ASGI app (no sockets), so numbers
+reflect the service itself. Run from the repository root:
+
+    python -m benchmarks.load_test --concurrency 1 8 32 --store-sizes 0 1000 10000
+
+Upstream latency is simulated with specs such as "lognormal:800:0.5"
+(see backends.LatencyDistribution).
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, urlencode
+
+import numpy as np
+
+WORDS = ["ami", "tumi", "kemon", "acho", "bhalo", "achi", "ki", "korcho", "khabar", "kheyecho",
+         "kothay", "jaccho", "bari", "school", "kaj", "ajke", "kalke", "boi", "porchi", "gaan",
+         "shunbo", "bristi", "hocche", "dhonnobad", "shubho", "shokal", "ratri", "bondhu", "chai"]
+
+
+def make_message(rng: random.Random, words: int = 5) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + f" {rng.randrange(10 ** 6)}"
+
+
+async def asgi_request(app, method: str, path: str,
+                       form: Optional[Dict[str, str]] = None) -> int:
+    """Send one HTTP request through the ASGI interface and return its status"""
+    body = urlencode(form).encode() if form else b""
+    headers = [(b"host", b"loadtest")]
+    if form:
+        headers.append((b"content-type", b"application/x-www-form-urlencoded"))
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path,
+        "raw_path": quote(path).encode(), "query_string": query.encode(),
+        "root_path": "", "headers": headers,
+        "client": ("127.0.0.1", 0), "server": ("loadtest", 80)
+    }
+    finished = asyncio.Event()
+    request_sent = False
+    status = 0
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            finished.set()
+
+    await app(scope, receive, send)
+    return status
+
+
+def endpoint_request(endpoint: str, message: str) -> Tuple[str, str, Optional[Dict[str, str]]]:
+    if endpoint == "chat":
+        return "POST", "/chat", {"message": message}
+    if endpoint == "similar":
+        return "GET", f"/similar-conversations/{message}", None
+    if endpoint == "banglish":
+        return "POST", "/check-banglish", {"text": message}
+    raise ValueError(f"unknown endpoint {endpoint}")
+
+
+async def run_level(app, endpoint: str, concurrency: int, requests: int,
+                    rng: random.Random) -> Tuple[np.ndarray, Counter, float]:
+    messages = [make_message(rng) for _ in range(requests)]
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    queue = iter(messages)
+
+    async def worker():
+        for message in queue:
+            method, path, form = endpoint_request(endpoint, message)
+            start = time.perf_counter()
+            statuses[await asgi_request(app, method, path, form)] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return np.array(latencies) * 1000, statuses, time.perf_counter() - start
+
+
+async def seed_store(embedding_service, target: int, rng: random.Random):
+    """Add synthetic conversations until the store holds `target` entries"""
+    backend = embedding_service.embedding_backend
+    while len(embedding_service.cache_storage) < target:
+        text = f"User: {make_message(rng)}\nBot: {make_message(rng, 12)}"
+        await embedding_service.cache_conversation(text, embedding=backend.embed_text(text))
+
+
+async def run(args, app_module):
+    app = app_module.app
+    chat_service = app_module.chat_service
+    rng = random.Random(args.seed)
+
+    print(f"{'store':>7} {'endpoint':>9} {'conc':>5} {'p50_ms':>8} {'p95_ms':>8} "
+          f"{'p99_ms':>8} {'req/s':>8}  statuses")
+    for store_size in sorted(args.store_sizes):
+        await seed_store(chat_service.embedding_service, store_size, rng)
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                latencies, statuses, elapsed = await run_level(
+                    app, endpoint, concurrency, args.requests, rng
+                )
+                p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+                print(f"{store_size:>7} {endpoint:>9} {concurrency:>5} {p50:>8.1f} {p95:>8.1f} "
+                      f"{p99:>8.1f} {args.requests / elapsed:>8.1f}  {dict(statuses)}")
+                # Let cache write-backs from /chat settle before the next level
+                await chat_service.write_back.drain()
+    await chat_service.write_back.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--endpoints", nargs="+", default=["chat", "similar", "banglish"],
+                        choices=["chat", "similar", "banglish"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per level")
+    parser.add_argument("--store-sizes", type=int, nargs="+", default=[0, 1000, 10000])
+    parser.add_argument("--chat-latency", default="lognormal:800:0.5")
+    parser.add_argument("--embedding-latency", default="lognormal:80:0.4")
+    parser.add_argument("--data-dir", help="store directory (default: a fresh temp dir)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Configure the app before it is imported: fakes, latencies and a scratch store
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_CHAT_LATENCY"] = args.chat_latency
+    os.environ["FAKE_EMBEDDING_LATENCY"] = args.embedding_latency
+    os.environ["DATA_DIR"] = args.data_dir or tempfile.mkdtemp(prefix="loadtest-")
+    app_module = importlib.import_module("main")
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"data dir {os.environ['DATA_DIR']}, chat latency {args.chat_latency}, "
+          f"embedding latency {args.embedding_latency}")
+    asyncio.run(run(args, app_module))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""Microbenchmarks for the CPU-bound hot paths, with JSON baselines.
+
+Covers similarity search, store append/load and service startup at several
+store sizes, Banglish correction/suggestions/transliteration over long inputs,
+bulk correction, large dictionaries and their startup/learning, and
+/all-conversations parsing and paging. Everything runs offline on synthetic
+data. Run from the repository root:
+
+    python -m benchmarks.microbench --save baseline.json
+    python -m benchmarks.microbench --compare baseline.json --fail-on-regression
+    python -m benchmarks.microbench --sizes 1000 10000 --only "find_similar|store"
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from backends import FakeEmbeddingBackend
+from banglish_service import BanglishService
+from embedding_service import EmbeddingService, parse_conversation_messages
+from embedding_store import EmbeddingStore
+from app.services.transliterator import Transliterator
+
+DIM = 768
+SYLLABLES = ["a", "ba", "bha", "cha", "da", "dha", "ga", "ha", "ja", "ka", "kha", "la", "ma",
+             "na", "o", "pa", "ra", "sha", "sho", "ta", "tha", "u", "i", "e", "bo", "ko", "no"]
+
+
+def measure(fn: Callable[[], object], repeat: int, min_time: float = 0.05) -> Dict[str, float]:
+    """Median/min seconds per call over `repeat` rounds of auto-sized call counts"""
+    start = time.perf_counter()
+    fn()
+    single = time.perf_counter() - start
+    number = max(1, int(min_time / single)) if single > 0 else 1000
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+        "calls": number * repeat
+    }
+
+
+def synthetic_records(size: int, rng: np.random.Generator) -> Tuple[Dict[str, dict], Dict[str, np.ndarray]]:
+    now = datetime.datetime.now()
+    expire_at = now + datetime.timedelta(days=30)
+    records, embeddings = {}, {}
+    vectors = rng.standard_normal((size, DIM)).astype(np.float32)
+    for i in range(size):
+        cache_id = f"cache_bench_{i:07d}"
+        records[cache_id] = {
+            "text": f"User: question number {i}\nBot: answer number {i} " + "lorem " * 20,
+            "display_name": f"Conversation_{i}",
+            "create_time": (now - datetime.timedelta(seconds=i)).isoformat(),
+            "expire_time": expire_at.isoformat(),
+            "expire_ts": expire_at.timestamp(),
+            "hit_count": 0
+        }
+        embeddings[cache_id] = vectors[i]
+    return records, embeddings
+
+
+def build_store(data_dir: Path, size: int, seed: int) -> Dict[str, dict]:
+    """Write a one-generation store of `size` synthetic conversations"""
+    records, embeddings = synthetic_records(size, np.random.default_rng(seed))
+    store = EmbeddingStore(data_dir / "embedding_store")
+    store.load()
+    store.compact(records, embeddings)
+    store.close()
+    return records
+
+
+def make_service(data_dir: Path, search_mode: str) -> EmbeddingService:
+    os.environ["DATA_DIR"] = str(data_dir)
+    return EmbeddingService(search_mode=search_mode,
+                            embedding_backend=FakeEmbeddingBackend(latency=0))
+
+
+def store_cases(size: int, args, workdir: Path) -> Iterator[Tuple[str, Callable, int]]:
+    data_dir = workdir / f"store_{size}"
+    records = build_store(data_dir, size, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    loop = asyncio.new_event_loop()
+
+    for mode in ("exact", "approximate"):
+        service = make_service(data_dir, mode)
+        queries = itertools.cycle(rng.standard_normal((64, DIM)).astype(np.float32))
+        yield (f"find_similar/{mode}/{size}",
+               lambda: loop.run_until_complete(
+                   service.find_similar_conversations(next(queries), threshold=0.8, limit=5)),
+               args.repeat)
+        service.store.close()
+
+    yield f"service/startup/{size}", lambda: make_service(data_dir, "exact").store.close(), 3
+
+    store = EmbeddingStore(data_dir / "embedding_store")
+    yield f"store/load/{size}", store.load, 3
+
+    sample = next(iter(records.values()))
+    vector = rng.standard_normal(DIM).astype(np.float32)
+    counter = itertools.count()
+    yield (f"store/append/{size}",
+           lambda: store.put(f"cache_append_{next(counter)}", sample, vector),
+           args.repeat)
+    store.close()
+    loop.close()
+
+    texts = [(record["text"], record["create_time"]) for record in records.values()]
+
+    def parse_all():
+        conversations = [{"created_at": created, "messages": parse_conversation_messages(text, created)}
+                         for text, created in texts]
+        conversations.sort(key=lambda c: c["created_at"], reverse=True)
+
+    yield f"all_conversations/parse/{size}", parse_all, args.repeat
+
+    service = make_service(data_dir, "exact")
+    loop = asyncio.new_event_loop()
+    yield (f"all_conversations/page/{size}",
+           lambda: loop.run_until_complete(service.list_conversations(limit=50)),
+           args.repeat)
+    service.store.close()
+    loop.close()
+
+
+def synthetic_dictionary(size: int, rng: random.Random) -> Dict[str, str]:
+    """Misspelling -> word pairs built from Banglish-like syllables"""
+    corrections = {}
+    while len(corrections) < size:
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        misspelling = re.sub(r"[aeiou]", "", word, count=1) or word + "h"
+        if misspelling != word:
+            corrections[misspelling] = word
+    return corrections
+
+
+def banglish_cases(dict_size: int, args, workdir: Path) -> Iterator[Tuple[str, Callable, int]]:
+    rng = random.Random(args.seed)
+    mapping_file = workdir / f"banglish_{dict_size}.json"
+    if dict_size:
+        with open(mapping_file, "w", encoding="utf-8") as f:
+            json.dump(synthetic_dictionary(dict_size, rng), f)
+    service = BanglishService(mapping_file=mapping_file)
+    label = dict_size or len(service.spelling_corrections)
+
+    vocabulary = list(service.spelling_corrections) + list(service.correct_words) + ["xyzzy", "hello"]
+    text = " ".join(rng.choice(vocabulary) for _ in range(args.words))
+    loop = asyncio.new_event_loop()
+
+    def cold(fn: Callable[[], object]) -> Callable[[], object]:
+        """Measure matching itself: start every call with an empty token memo"""
+        return lambda: (service.token_memo.clear(), fn())
+
+    yield (f"banglish/correct_text/dict{label}/words{args.words}",
+           cold(lambda: service.correct_text(text)), args.repeat)
+    yield (f"banglish/correct_text_memo/dict{label}/words{args.words}",
+           lambda: service.correct_text(text), args.repeat)
+    yield (f"banglish/get_suggestions/dict{label}/words{args.words}",
+           cold(lambda: loop.run_until_complete(service.get_suggestions(text))), args.repeat)
+    transliterator = Transliterator()
+    yield (f"banglish/transliterate/dict{label}/words{args.words}",
+           lambda: (transliterator.transliterate_word.cache_clear(), transliterator.transliterate(text)),
+           args.repeat)
+    lines = [" ".join(rng.choice(vocabulary) for _ in range(10)) for _ in range(args.lines)]
+    yield (f"banglish/correct_texts/dict{label}/lines{args.lines}",
+           cold(lambda: service.correct_texts(lines)), 3)
+    # Startup maps the already compiled dictionary instead of parsing the JSON
+    yield f"banglish/startup/dict{label}", lambda: BanglishService(mapping_file=mapping_file), 3
+    counter = itertools.count()
+    yield (f"banglish/add_correction/dict{label}",
+           lambda: service.add_correction(f"learnt{next(counter)}", rng.choice(vocabulary)),
+           args.repeat)
+    loop.close()
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            result["status"] = "new"
+            continue
+        ratio = result["median_ms"] / previous["median_ms"]
+        result["baseline_ms"] = previous["median_ms"]
+        result["ratio"] = ratio
+        if ratio > 1 + tolerance:
+            result["status"] = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - tolerance:
+            result["status"] = "faster"
+        else:
+            result["status"] = "ok"
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dict-sizes", type=int, nargs="+", default=[0, 10000],
+                        help="synthetic Banglish dictionary sizes (0 = built-in mapping)")
+    parser.add_argument("--words", type=int, default=500, help="words per Banglish input")
+    parser.add_argument("--lines", type=int, default=10000, help="10-word texts per bulk correction")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--only", help="regex; run only matching benchmarks")
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="relative slowdown that counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    only = re.compile(args.only) if args.only else None
+    results: Dict[str, dict] = {}
+    with tempfile.TemporaryDirectory(prefix="microbench-") as tmp:
+        workdir = Path(tmp)
+        generators = [store_cases(size, args, workdir) for size in args.sizes]
+        generators += [banglish_cases(size, args, workdir) for size in args.dict_sizes]
+        for cases in generators:
+            for name, fn, repeat in cases:
+                if only and not only.search(name):
+                    continue
+                results[name] = measure(fn, repeat)
+                print(f"{name:<48} {results[name]['median_ms']:>10.3f} ms", flush=True)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        print(f"\n{'benchmark':<48} {'median_ms':>10} {'baseline':>10} {'ratio':>7}  status")
+        for name, result in results.items():
+            baseline_ms = result.get("baseline_ms")
+            print(f"{name:<48} {result['median_ms']:>10.3f} "
+                  f"{baseline_ms if baseline_ms is not None else float('nan'):>10.3f} "
+                  f"{result.get('ratio', float('nan')):>7.2f}  {result['status']}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "created": datetime.datetime.now().isoformat(),
+                    "python": platform.python_version(),
+                    "numpy": np.__version__,
+                    "machine": platform.machine(),
+                    "sizes": args.sizes,
+                    "dict_sizes": args.dict_sizes,
+                    "words": args.words
+                },
+                "results": results
+            }, f, indent=2)
+        print(f"Saved {len(results)} results to {args.save}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
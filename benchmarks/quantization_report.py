@@ -0,0 +1,88 @@
+"""Accuracy report for quantized (float16/int8) index storage vs float32.
+
+Scores the same queries against each storage mode and reports score error,
+top-1 agreement and, for each similarity threshold the service uses, how
+many above-threshold matches each mode keeps (recall) or adds (precision)
+compared with float32. Run from the repository root:
+
+    python -m benchmarks.quantization_report
+    python -m benchmarks.quantization_report --store data/embedding_store
+"""
+import argparse
+import numpy as np
+from embedding_store import EmbeddingStore
+from vector_index import VectorIndex, normalize_vector
+
+# find_similar_conversations default and the get_response context threshold
+THRESHOLDS = [0.8, 0.85]
+
+
+def synthetic_embeddings(size: int, dim: int, rng: np.random.Generator):
+    data = rng.standard_normal((size, dim)).astype(np.float32)
+    return {f"cache_{i}": row for i, row in enumerate(data)}
+
+
+def near_queries(embeddings, count: int, rng: np.random.Generator):
+    """Perturbed copies of stored vectors, spread over the 0.7-1.0 similarity band"""
+    ids = list(embeddings)
+    queries = []
+    for _ in range(count):
+        base = normalize_vector(embeddings[ids[rng.integers(len(ids))]])
+        noise = normalize_vector(rng.standard_normal(base.shape[0]))
+        target = rng.uniform(0.7, 1.0)
+        queries.append(target * base + np.sqrt(1 - target ** 2) * noise)
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--store", help="report on a real embedding store directory")
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.store:
+        _, embeddings = EmbeddingStore(args.store).load()
+        embeddings = dict(embeddings)
+    else:
+        embeddings = synthetic_embeddings(args.size, args.dim, rng)
+    queries = near_queries(embeddings, args.queries, rng)
+
+    indexes = {dtype: VectorIndex.from_embeddings(embeddings, dtype=dtype)
+               for dtype in ("float32", "float16", "int8")}
+    baseline = [dict(indexes["float32"].search(q)) for q in queries]
+    baseline_top = [indexes["float32"].search(q, k=1)[0][0] for q in queries]
+
+    print(f"{len(embeddings)} vectors, {len(queries)} queries\n")
+    print(f"{'dtype':>8} {'bytes/vec':>10} {'max_err':>9} {'mean_err':>9} {'top1':>6}  "
+          + "  ".join(f"recall@{t:<4} prec@{t:<4}" for t in THRESHOLDS))
+    for dtype, index in indexes.items():
+        errors, top1 = [], 0
+        kept = {t: [0, 0, 0] for t in THRESHOLDS}  # both, baseline only, quantized only
+        for q, expected, expected_top in zip(queries, baseline, baseline_top):
+            scores = dict(index.search(q))
+            errors.extend(abs(scores[item_id] - score) for item_id, score in expected.items())
+            top1 += index.search(q, k=1)[0][0] == expected_top
+            for t in THRESHOLDS:
+                base_set = {i for i, s in expected.items() if s > t}
+                quant_set = {i for i, s in scores.items() if s > t}
+                kept[t][0] += len(base_set & quant_set)
+                kept[t][1] += len(base_set - quant_set)
+                kept[t][2] += len(quant_set - base_set)
+
+        cells = []
+        for t in THRESHOLDS:
+            both, missed, extra = kept[t]
+            recall = both / (both + missed) if both + missed else 1.0
+            precision = both / (both + extra) if both + extra else 1.0
+            cells.append(f"{recall:>11.4f} {precision:>9.4f}")
+        print(f"{dtype:>8} {index.nbytes / max(1, index._capacity):>10.0f} "
+              f"{max(errors):>9.5f} {np.mean(errors):>9.5f} {top1 / len(queries):>6.3f}  "
+              + "  ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
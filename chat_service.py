@@ -3,8 +3,19 @@ from dotenv import load_dotenv
 import os
 import logging
 import uuid
+import asyncio
+import functools
+from typing import AsyncIterator, List, Optional, Tuple
+from admission import PRIORITY_BACKGROUND, AdmissionRejected, limiter_from_env
+from async_executor import BlockingExecutor
+from backends import ChatBackend, EmbeddingBackend, FakeChatBackend, GeminiChatBackend
+from deadlines import Deadline, DeadlineExceeded
 from embedding_service import EmbeddingService
 from banglish_service import BanglishService
+from embedding_cache import normalize_text
+from session_manager import SessionManager
+from single_flight import SingleFlight
+from write_back import WriteBackQueue
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -13,128 +24,397 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+ERROR_MESSAGE = "দুঃখিত, একটি ত্রুটি ঘটেছে। আবার চেষ্টা করুন।"
+EMPTY_RESPONSE_MESSAGE = "দুঃখিত, কোনো উত্তর পাওয়া যায়নি। আবার চেষ্টা করুন।"
+
 class ChatService:
-    def __init__(self):
+    def __init__(self, chat_backend: Optional[ChatBackend] = None,
+                 embedding_backend: Optional[EmbeddingBackend] = None):
         try:
+            # LLM_BACKEND=fake runs fully offline on deterministic fakes; their
+            # latency comes from FAKE_CHAT_LATENCY / FAKE_EMBEDDING_LATENCY
+            # (e.g. "lognormal:800:0.5", see backends.LatencyDistribution)
+            self.backend_mode = os.getenv('LLM_BACKEND', 'gemini').lower()
+            fake = self.backend_mode == 'fake'
             api_key = os.getenv('GOOGLE_API_KEY')
-            if not api_key:
+            if api_key:
+                genai.configure(api_key=api_key)
+            elif not fake and not (chat_backend and embedding_backend):
                 raise ValueError("GOOGLE_API_KEY not found")
             
-            genai.configure(api_key=api_key)
+            # Chat history is kept per conversation, bounded and LRU-evicted
+            self.sessions = SessionManager(
+                max_sessions=int(os.getenv('CHAT_MAX_SESSIONS', '1000')),
+                max_turns=int(os.getenv('CHAT_HISTORY_TURNS', '10')),
+                max_bytes=int(os.getenv('CHAT_HISTORY_MAX_BYTES', str(32 * 1024 * 1024))),
+                idle_ttl=float(os.getenv('CHAT_SESSION_IDLE_SECONDS', '1800'))
+            )
+            logger.info("ChatService initialized successfully")
             
-            # Configure model with simple settings
-            generation_config = {
-                "temperature": 0.7,
-                "top_p": 1,
-                "top_k": 1,
-                "max_output_tokens": 2048,
-            }
+            # Shared pool for blocking SDK calls; native async is used where available
+            self.executor = BlockingExecutor(max_workers=int(os.getenv('BLOCKING_POOL_SIZE', '16')))
+            native_async = os.getenv('GEMINI_ASYNC_MODE', 'native') == 'native'
             
-            self.model = genai.GenerativeModel(
-                model_name='gemini-2.0-flash-exp',
-                generation_config=generation_config
-            )
+            if chat_backend is None and fake:
+                chat_backend = FakeChatBackend(latency=os.getenv('FAKE_CHAT_LATENCY', 'lognormal:800:0.5'))
+            if chat_backend is None:
+                # Configure model with simple settings
+                generation_config = {
+                    "temperature": 0.7,
+                    "top_p": 1,
+                    "top_k": 1,
+                    "max_output_tokens": 2048,
+                }
+                
+                model = genai.GenerativeModel(
+                    model_name='gemini-2.0-flash-exp',
+                    generation_config=generation_config
+                )
+                chat_backend = GeminiChatBackend(model, executor=self.executor, native_async=native_async)
+            self.chat_backend = chat_backend
             
-            self.chat = self.model.start_chat(history=[])
-            logger.info("ChatService initialized successfully")
+            # One adaptive limiter gates every Gemini call, chat and embedding alike
+            self.limiter = limiter_from_env()
             
-            self.embedding_service = EmbeddingService()
+            self.embedding_service = EmbeddingService(
+                embedding_backend=embedding_backend, executor=self.executor, limiter=self.limiter
+            )
             self.banglish_service = BanglishService()
             
+            # Thresholds: context_threshold adds a similar past conversation as
+            # context; above response_cache_threshold the past answer is returned
+            # directly without calling Gemini
+            self.context_threshold = float(os.getenv('CONTEXT_SIMILARITY_THRESHOLD', '0.85'))
+            self.response_cache_enabled = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+            self.response_cache_threshold = float(os.getenv('RESPONSE_CACHE_THRESHOLD', '0.97'))
+            
+            # Conversation embedding + cache write happen after the reply
+            self.write_back = WriteBackQueue(
+                workers=int(os.getenv('WRITE_BACK_WORKERS', '2')),
+                max_pending=int(os.getenv('WRITE_BACK_QUEUE_SIZE', '256'))
+            )
+            
+            # Identical in-flight messages share one embedding + Gemini call
+            self.single_flight = SingleFlight()
+            self.single_flight_per_session = os.getenv('SINGLE_FLIGHT_PER_SESSION', 'false').lower() == 'true'
+            
+            # Time budgets: the whole request, and the query embedding stage within it.
+            # A late embedding means answering without semantic context.
+            self.request_budget = float(os.getenv('CHAT_DEADLINE_MS', '30000')) / 1000
+            self.embedding_budget = float(os.getenv('EMBEDDING_TIMEOUT_MS', '2000')) / 1000
+            
         except Exception as e:
             logger.error(f"Error initializing ChatService: {e}")
             raise
 
-    async def get_response(self, message: str) -> dict:
+    async def get_response(self, message: str, session_id: Optional[str] = None,
+                           background_cache: bool = True,
+                           deadline: Optional[Deadline] = None) -> dict:
+        """Answer a message; caching runs on the write-back queue unless background_cache is False.
+
+        Concurrent identical messages share one upstream computation (and the
+        first caller's deadline); the followers get the leader's answer
+        recorded into their own sessions. Raises DeadlineExceeded when the
+        budget runs out before Gemini answers.
+        """
+        # The conversation ID doubles as the chat session ID
+        conversation_id = session_id or str(uuid.uuid4())
+        deadline = deadline or Deadline(self.request_budget)
+        result, coalesced = await self.single_flight.do(
+            self._flight_key(message, conversation_id, background_cache),
+            functools.partial(self._answer, message, conversation_id, background_cache, deadline)
+        )
+        result = dict(result, coalesced=coalesced)
+        if "error" in result:
+            return result
+        result["conversation_id"] = conversation_id
+        if result["response"] not in (ERROR_MESSAGE, EMPTY_RESPONSE_MESSAGE):
+            self.sessions.record_turn(conversation_id, message, result["response"])
+        return result
+
+    def _flight_key(self, message: str, conversation_id: str, background_cache: bool) -> tuple:
+        """Single-flight key: the normalized message, plus the session when its history
+        shapes the answer (or when SINGLE_FLIGHT_PER_SESSION is set)"""
+        session_key = None
+        if self.single_flight_per_session or conversation_id in self.sessions:
+            session_key = conversation_id
+        return normalize_text(message), background_cache, session_key
+
+    async def _answer(self, message: str, conversation_id: str, background_cache: bool,
+                      deadline: Deadline) -> dict:
+        banglish_task = None
         try:
-            # Check for Banglish and get correction suggestions
-            banglish_correction = None
+            # Banglish correction is only reported back, so it runs in a worker
+            # thread alongside the rest of the pipeline
             if any(ord(c) < 128 for c in message):  # Check if contains ASCII (likely Banglish)
-                banglish_correction = await self.banglish_service.get_correction(message)
-            
-            # Create embedding for the query
-            query_embedding = await self.embedding_service.create_embedding(message)
-            
-            if query_embedding:
-                # Find similar cached conversations
-                similar_conversations = await self.embedding_service.find_similar_conversations(
-                    query_embedding, threshold=0.85
+                banglish_task = asyncio.create_task(
+                    asyncio.to_thread(self.banglish_service.correct_text, message)
                 )
-                
-                # If similar conversations found, use the most similar one for context
-                if similar_conversations:
-                    cache_id, similarity = similar_conversations[0]
-                    cached_conv = await self.embedding_service.get_cached_conversation(cache_id)
-                    if cached_conv:
-                        # Add cached conversation as context
-                        context = f"""Previous relevant conversation:
-                        {cached_conv['text']}
-                        
-                        Current question: {message}
-                        """
-                        response = await self._get_gemini_response(context)
-                    else:
-                        response = await self._get_gemini_response(message)
-                else:
-                    response = await self._get_gemini_response(message)
-            else:
-                response = await self._get_gemini_response(message)
             
-            # Create a unique conversation ID
-            conversation_id = str(uuid.uuid4())
-            
-            # Format conversation text properly
-            conversation_text = f"User: {message}\nBot: {response}"
+            # Create embedding for the query (None if it misses its budget)
+            query_embedding = await self.embedding_service.create_embedding(
+                message, timeout=deadline.timeout(self.embedding_budget)
+            )
             
-            # Create embedding for the conversation
-            conv_embedding = await self.embedding_service.create_embedding(conversation_text)
+            # Near-identical question asked before: reuse its answer directly.
+            # Not once the session has history: the answer may depend on it.
+            history = self.sessions.history(conversation_id)
+            cached = None if history else await self._find_cached_response(query_embedding)
+            if cached:
+                cache_id, similarity, cache_data = cached
+                return {
+                    "response": cache_data["response"],
+                    "conversation_id": conversation_id,
+                    "cache_name": cache_id,
+                    "has_embedding": True,
+                    "used_cache": True,
+                    "response_from_cache": True,
+                    "cache_hit_similarity": similarity,
+                    "cache_hit_count": cache_data["hit_count"],
+                    "banglish_correction": await self._await_correction(banglish_task, deadline)
+                }
             
-            # Cache the conversation with its embedding
-            if conv_embedding:
-                cache_name = await self.embedding_service.cache_conversation(
-                    conversation_text,
-                    embedding=conv_embedding,
-                    display_name=f"Conversation_{conversation_id[:8]}"  # Use shorter ID in display name
+            prompt_message, similar_conversations = await self._build_prompt_message(
+                message, query_embedding
+            )
+            try:
+                response = await asyncio.wait_for(
+                    self._get_gemini_response(prompt_message, history),
+                    deadline.timeout()
                 )
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"No answer within {deadline.budget:.1f}s")
+            
+            # Reserve the cache ID up front
+            cache_id = self.embedding_service.new_cache_id()
+            cache_job = functools.partial(
+                self._cache_turn, cache_id, conversation_id, message, response, query_embedding,
+                reusable=not history
+            )
+            if background_cache:
+                await self.write_back.submit(cache_job)
+                has_embedding = None
             else:
-                cache_name = None
+                cache_id = await cache_job()
+                has_embedding = cache_id is not None
             
             return {
                 "response": response,
                 "conversation_id": conversation_id,
-                "cache_name": cache_name,
-                "has_embedding": conv_embedding is not None,
+                "cache_name": cache_id,
+                "cache_pending": background_cache,
+                "has_embedding": has_embedding,
                 "used_cache": bool(similar_conversations),
-                "banglish_correction": banglish_correction
+                "response_from_cache": False,
+                "cache_hit_similarity": similar_conversations[0][1] if similar_conversations else None,
+                "banglish_correction": await self._await_correction(banglish_task, deadline)
             }
             
+        except (AdmissionRejected, DeadlineExceeded):
+            if banglish_task:
+                banglish_task.cancel()
+            raise
         except Exception as e:
             logger.error(f"Error in get_response: {e}")
+            if banglish_task:
+                banglish_task.cancel()
             return {
-                "response": "দুঃখিত, একটি ত্রুটি ঘটেছে। আবার চেষ্টা করুন।",
+                "response": ERROR_MESSAGE,
                 "error": str(e)
             }
 
-    async def _get_gemini_response(self, message: str) -> str:
+    async def stream_response(self, message: str,
+                              session_id: Optional[str] = None) -> AsyncIterator[dict]:
+        """Answer a message as a stream of events: "token" chunks, then "done".
+
+        Caching runs on the write-back queue once the stream has finished.
+        """
+        banglish_task = None
+        conversation_id = session_id or str(uuid.uuid4())
         try:
-            # Prepare prompt
-            prompt = f"""
+            if any(ord(c) < 128 for c in message):  # Check if contains ASCII (likely Banglish)
+                banglish_task = asyncio.create_task(
+                    asyncio.to_thread(self.banglish_service.correct_text, message)
+                )
+            
+            query_embedding = await self.embedding_service.create_embedding(
+                message, timeout=self.embedding_budget
+            )
+            
+            # As in _answer: history-dependent turns are neither reused nor stored for reuse
+            history = self.sessions.history(conversation_id)
+            cached = None if history else await self._find_cached_response(query_embedding)
+            if cached:
+                cache_id, similarity, cache_data = cached
+                self.sessions.record_turn(conversation_id, message, cache_data["response"])
+                yield {"event": "token", "text": cache_data["response"]}
+                yield {
+                    "event": "done",
+                    "conversation_id": conversation_id,
+                    "cache_name": cache_id,
+                    "used_cache": True,
+                    "response_from_cache": True,
+                    "cache_hit_similarity": similarity,
+                    "cache_hit_count": cache_data["hit_count"],
+                    "banglish_correction": await self._await_correction(banglish_task)
+                }
+                return
+            
+            prompt_message, similar_conversations = await self._build_prompt_message(
+                message, query_embedding
+            )
+            chunks = []
+            async for text in self._stream_gemini_response(prompt_message, history):
+                chunks.append(text)
+                yield {"event": "token", "text": text}
+            done = {
+                "event": "done",
+                "conversation_id": conversation_id,
+                "cache_name": None,
+                "cache_pending": False,
+                "used_cache": bool(similar_conversations),
+                "response_from_cache": False,
+                "cache_hit_similarity": similar_conversations[0][1] if similar_conversations else None
+            }
+            if chunks:
+                response = "".join(chunks)
+                self.sessions.record_turn(conversation_id, message, response)
+                cache_id = self.embedding_service.new_cache_id()
+                await self.write_back.submit(functools.partial(
+                    self._cache_turn, cache_id, conversation_id, message, response, query_embedding,
+                    reusable=not history
+                ))
+                done.update(cache_name=cache_id, cache_pending=True)
+            else:
+                # An empty answer is neither recorded nor cached
+                yield {"event": "token", "text": EMPTY_RESPONSE_MESSAGE}
+            done["banglish_correction"] = await self._await_correction(banglish_task)
+            yield done
+            
+        except AdmissionRejected as e:
+            yield {"event": "error", "text": ERROR_MESSAGE, "error": str(e),
+                   "retry_after": e.retry_after}
+        except Exception as e:
+            logger.error(f"Error in stream_response: {e}")
+            yield {"event": "error", "text": ERROR_MESSAGE, "error": str(e)}
+        finally:
+            # Also reached when the client disconnects mid-stream (aclose/cancellation)
+            if banglish_task and not banglish_task.done():
+                banglish_task.cancel()
+
+    async def _await_correction(self, banglish_task: Optional[asyncio.Task],
+                                deadline: Optional[Deadline] = None) -> Optional[str]:
+        if banglish_task is None:
+            return None
+        try:
+            return await asyncio.wait_for(banglish_task, deadline.timeout() if deadline else None)
+        except asyncio.TimeoutError:
+            logger.warning("Banglish correction missed the request deadline")
+            return None
+        except Exception as e:
+            logger.error(f"Error getting Banglish correction: {e}")
+            return None
+
+    async def _find_cached_response(self, query_embedding: Optional[List[float]]):
+        if not query_embedding or not self.response_cache_enabled:
+            return None
+        return await self.embedding_service.find_cached_response(
+            query_embedding, threshold=self.response_cache_threshold
+        )
+
+    async def _build_prompt_message(self, message: str,
+                                    query_embedding: Optional[List[float]]) -> Tuple[str, list]:
+        """Add the most similar cached conversation as context, if any"""
+        if not query_embedding:
+            return message, []
+        
+        # Find similar cached conversations; a few candidates, so a top hit that
+        # expires between the search and the lookup falls through to the next
+        similar_conversations = await self.embedding_service.find_similar_conversations(
+            query_embedding, threshold=self.context_threshold, limit=3
+        )
+        for i, (cache_id, _) in enumerate(similar_conversations):
+            cached_conv = await self.embedding_service.get_cached_conversation(cache_id)
+            if not cached_conv:
+                continue
+            
+            # Add cached conversation as context
+            context = f"""Previous relevant conversation:
+                        {cached_conv['text']}
+                        
+                        Current question: {message}
+                        """
+            return context, similar_conversations[i:]
+        return message, []
+
+    async def _cache_turn(self, cache_id: str, conversation_id: str, message: str,
+                          response: str, query_embedding: Optional[List[float]],
+                          reusable: bool = True) -> Optional[str]:
+        """Embed and cache a finished turn (runs after the reply has been sent).
+
+        `reusable` is False for turns answered from session history; those are
+        kept as context only, never served to other sessions.
+        """
+        # Format conversation text properly
+        conversation_text = f"User: {message}\nBot: {response}"
+        
+        # Create embedding for the conversation
+        conv_embedding = await self.embedding_service.create_embedding(
+            conversation_text, priority=PRIORITY_BACKGROUND
+        )
+        if not conv_embedding:
+            return None
+        
+        # Successful answers also keep the query embedding so they can be reused directly
+        reusable = reusable and response not in (ERROR_MESSAGE, EMPTY_RESPONSE_MESSAGE)
+        return await self.embedding_service.cache_conversation(
+            conversation_text,
+            embedding=conv_embedding,
+            display_name=f"Conversation_{conversation_id[:8]}",  # Use shorter ID in display name
+            query_embedding=query_embedding if reusable else None,
+            response=response if reusable else None,
+            cache_id=cache_id
+        )
+
+    def _format_prompt(self, message: str) -> str:
+        return f"""
             You are a helpful AI assistant who always responds in Bangla language.
             If the user writes in Banglish (Bengali written in English), understand it and respond in proper Bangla.
             If the user writes in Bangla, respond in Bangla.
             
             User message: {message}
             """
+
+    async def _get_gemini_response(self, message: str, history: Optional[List[dict]] = None) -> str:
+        try:
+            # Prepare prompt
+            prompt = self._format_prompt(message)
             
-            # Get response
-            response = self.chat.send_message(prompt)
+            async with self.limiter.slot():
+                text = await self.chat_backend.generate(prompt, history or [])
             
-            if not response or not response.text:
+            if not text:
                 logger.error("Empty response received")
-                return "দুঃখিত, কোনো উত্তর পাওয়া যায়নি। আবার চেষ্টা করুন।"
+                return EMPTY_RESPONSE_MESSAGE
             
-            return response.text
+            return text
             
+        except AdmissionRejected:
+            raise
         except Exception as e:
             logger.error(f"Error getting response: {e}")
-            return "দুঃখিত, একটি ত্রুটি ঘটেছে। আবার চেষ্টা করুন।"
+            return ERROR_MESSAGE
+
+    async def _stream_gemini_response(self, message: str,
+                                      history: Optional[List[dict]] = None) -> AsyncIterator[str]:
+        """Yield response text chunks as the chat backend generates them.
+
+        The stream holds one upstream slot until it ends; its latency sample
+        is the time to the first chunk.
+        """
+        prompt = self._format_prompt(message)
+        async with self.limiter.slot() as permit:
+            async for text in self.chat_backend.stream(prompt, history or []):
+                permit.mark()
+                if text:
+                    yield text
@@ -0,0 +1,141 @@
+import logging
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"BNGDICT1"
+# magic, source mtime_ns, source size, number of keys, distinct words, hash slots
+HEADER = struct.Struct("<8sqqIII")
+# Then uint32 key_offsets[n_keys + 1], key_words[n_keys], word_offsets[n_words + 1]
+# and slots[n_slots] (crc32 linear probing, key index + 1, 0 = empty), then the
+# UTF-8 key blob (keys sorted by bytes) and word blob
+
+
+class CompiledDictionary(Mapping):
+    """Read-only misspelling -> word mapping over a memory-mapped compiled file"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(f.fileno())
+        # (mtime_ns, size) of the file as mapped; a compile replaces the file,
+        # so a different signature at `path` means a newer version exists
+        self.file_signature: Tuple[int, int] = (stat.st_mtime_ns, stat.st_size)
+        try:
+            magic, mtime_ns, size, n_keys, n_words, n_slots = HEADER.unpack_from(self._mm, 0)
+            if magic != MAGIC or n_slots & (n_slots - 1) or n_slots <= n_keys:
+                raise ValueError("bad magic")
+            self.source_signature: Tuple[int, int] = (mtime_ns, size)
+            offset = HEADER.size
+            self._key_offsets = self._uint32_array(n_keys + 1, offset)
+            offset += 4 * (n_keys + 1)
+            self._key_words = self._uint32_array(n_keys, offset)
+            offset += 4 * n_keys
+            self._word_offsets = self._uint32_array(n_words + 1, offset)
+            offset += 4 * (n_words + 1)
+            self._slots = self._uint32_array(n_slots, offset)
+            offset += 4 * n_slots
+            self._keys_start = offset
+            self._words_start = offset + self._key_offsets[-1]
+            if self._words_start + self._word_offsets[-1] != len(self._mm):
+                raise ValueError("truncated or corrupt")
+        except (struct.error, ValueError) as e:
+            raise ValueError(f"Invalid compiled dictionary {self.path}: {e}")
+        self._n_keys = n_keys
+        self._n_words = n_words
+        self._slot_mask = n_slots - 1
+
+    def _uint32_array(self, count: int, offset: int) -> memoryview:
+        """uint32 array over the mapping, as a memoryview so hash probes index plain ints"""
+        array = np.frombuffer(self._mm, dtype='<u4', count=count, offset=offset)
+        # Zero-copy on little-endian hosts; elsewhere this byte-swaps into memory
+        return memoryview(array.astype('=u4', copy=False))
+
+    def _key(self, i: int) -> bytes:
+        return self._mm[self._keys_start + self._key_offsets[i]:self._keys_start + self._key_offsets[i + 1]]
+
+    def _word(self, j: int) -> str:
+        start = self._words_start + self._word_offsets[j]
+        return self._mm[start:self._words_start + self._word_offsets[j + 1]].decode('utf-8')
+
+    def _find(self, key: str) -> int:
+        target = key.encode('utf-8')
+        slot = zlib.crc32(target) & self._slot_mask
+        while True:
+            entry = self._slots[slot]
+            if not entry:
+                return -1
+            if self._key(entry - 1) == target:
+                return entry - 1
+            slot = (slot + 1) & self._slot_mask
+
+    def __getitem__(self, key: str) -> str:
+        i = self._find(key) if isinstance(key, str) else -1
+        if i < 0:
+            raise KeyError(key)
+        return self._word(self._key_words[i])
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self._find(key) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._n_keys):
+            yield self._key(i).decode('utf-8')
+
+    def __len__(self) -> int:
+        return self._n_keys
+
+    def words(self) -> List[str]:
+        """Distinct correct words, sorted"""
+        return [self._word(j) for j in range(self._n_words)]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._mm)
+
+
+def compile_dictionary(mapping: Dict[str, str], path: Path,
+                       source_signature: Optional[Tuple[int, int]] = None):
+    """Write `mapping` in CompiledDictionary format, atomically replacing `path`"""
+    path = Path(path)
+    keys = sorted((key.encode('utf-8'), value) for key, value in mapping.items())
+    words = sorted(set(mapping.values()))
+    word_id = {word: j for j, word in enumerate(words)}
+    word_bytes = [word.encode('utf-8') for word in words]
+
+    key_offsets = np.zeros(len(keys) + 1, dtype='<u4')
+    key_offsets[1:] = np.cumsum([len(key) for key, _ in keys], dtype=np.uint64)
+    key_words = np.array([word_id[value] for _, value in keys], dtype='<u4')
+    word_offsets = np.zeros(len(words) + 1, dtype='<u4')
+    word_offsets[1:] = np.cumsum([len(word) for word in word_bytes], dtype=np.uint64)
+    # At most half full, so probe sequences stay short
+    n_slots = 1 << max(len(keys) * 2, 1).bit_length()
+    slots = np.zeros(n_slots, dtype='<u4')
+    for i, (key, _) in enumerate(keys):
+        slot = zlib.crc32(key) & (n_slots - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (n_slots - 1)
+        slots[slot] = i + 1
+
+    mtime_ns, size = source_signature or (0, 0)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, mtime_ns, size, len(keys), len(words), n_slots))
+        f.write(key_offsets.tobytes())
+        f.write(key_words.tobytes())
+        f.write(word_offsets.tobytes())
+        f.write(slots.tobytes())
+        f.write(b"".join(key for key, _ in keys))
+        f.write(b"".join(word_bytes))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    logger.info(f"Compiled {len(keys)} corrections ({len(words)} words) to {path}")
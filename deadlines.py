@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's overall budget runs out before it is answered"""
+
+
+class Deadline:
+    """Absolute time budget for one request, split into per-stage timeouts"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, stage_budget: Optional[float] = None) -> float:
+        """Timeout for the next stage: its own budget, capped by what is left overall"""
+        remaining = self.remaining()
+        return remaining if stage_budget is None else min(stage_budget, remaining)
+
+
+class LatencyTracker:
+    """Rolling window of recent latencies (seconds) for percentile estimates"""
+
+    def __init__(self, window: int = 512, min_samples: int = 20):
+        self._samples = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, latency: float):
+        self._samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q-th percentile, or None until min_samples latencies were recorded"""
+        if len(self._samples) < self.min_samples:
+            return None
+        return float(np.percentile(np.fromiter(self._samples, dtype=np.float64), q))
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+
+async def hedged(fn: Callable[[], Awaitable[T]], delay: Optional[float],
+                 hedge_fn: Optional[Callable[[], Awaitable[T]]] = None) -> T:
+    """Await fn(); if it is still running after `delay` seconds, start a second
+    attempt (hedge_fn, defaulting to fn) and return whichever succeeds first.
+    Only for idempotent calls."""
+    first = asyncio.ensure_future(fn())
+    if delay is None:
+        return await first
+
+    attempts = {first}
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if not done:
+            attempts.add(asyncio.ensure_future((hedge_fn or fn)()))
+        while attempts:
+            done, attempts = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+            if not attempts:
+                raise done.pop().exception()
+    finally:
+        for task in attempts:
+            task.cancel()
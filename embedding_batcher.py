@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from admission import PRIORITY_INTERACTIVE, AdaptiveLimiter
+from backends import EmbeddingBackend
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent embedding requests into batched backend calls.
+
+    Requests are grouped per task type and priority. A group is flushed when it reaches
+    `max_batch_size` or `max_wait` seconds after its first request arrived,
+    whichever comes first. Duplicate texts within a batch are embedded once.
+    With a limiter, each batch call waits for an upstream slot at its priority.
+    """
+
+    def __init__(self, backend: EmbeddingBackend, max_batch_size: int = 32,
+                 max_wait: float = 0.005, limiter: Optional[AdaptiveLimiter] = None):
+        self.backend = backend
+        self.limiter = limiter
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._pending: Dict[Tuple[str, int], List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[Tuple[str, int], asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.batches = 0
+        self.embedded_texts = 0
+        self.max_observed_batch = 0
+        self.last_batch_latency = 0.0
+
+    async def embed(self, text: str, task_type: str,
+                    priority: int = PRIORITY_INTERACTIVE) -> List[float]:
+        """Embed one text; resolves when its batch comes back"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        group = (task_type, priority)
+        batch = self._pending.setdefault(group, [])
+        batch.append((text, future))
+        self.requests += 1
+
+        if len(batch) >= self.max_batch_size:
+            self._flush(group)
+        elif group not in self._timers:
+            self._timers[group] = loop.call_later(self.max_wait, self._flush, group)
+        return await future
+
+    def _flush(self, group: Tuple[str, int]):
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(group, [])
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self._run_batch(*group, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, task_type: str, priority: int,
+                         batch: List[Tuple[str, asyncio.Future]]):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batches += 1
+        self.embedded_texts += len(texts)
+        self.max_observed_batch = max(self.max_observed_batch, len(texts))
+
+        start = time.perf_counter()
+        try:
+            if self.limiter is None:
+                embeddings = await self.backend.embed_batch(texts, task_type)
+            else:
+                async with self.limiter.slot(priority):
+                    embeddings = await self.backend.embed_batch(texts, task_type)
+            if len(embeddings) != len(texts):
+                raise ValueError(f"backend returned {len(embeddings)} embeddings for {len(texts)} texts")
+        except Exception as e:
+            logger.error(f"Error embedding batch of {len(texts)}: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.last_batch_latency = time.perf_counter() - start
+
+        by_text = dict(zip(texts, embeddings))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "embedded_texts": self.embedded_texts,
+            "avg_batch_size": self.embedded_texts / self.batches if self.batches else 0.0,
+            "max_batch_size_seen": self.max_observed_batch,
+            "pending": sum(len(batch) for batch in self._pending.values()),
+            "last_batch_latency_ms": self.last_batch_latency * 1000
+        }
@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import sqlite3
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys: NFC, case-folded, single spaces"""
+    return " ".join(unicodedata.normalize("NFC", text).casefold().split())
+
+
+def embedding_cache_key(model: str, task_type: str, text: str) -> str:
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}|{task_type}|{digest}"
+
+
+class EmbeddingCache:
+    """Content-addressed memo for embeddings.
+
+    An in-memory LRU bounded by `max_entries` sits in front of an optional
+    SQLite tier at `disk_path`; disk hits are promoted into memory.
+    """
+
+    def __init__(self, max_entries: int = 10000, disk_path: Optional[Path] = None):
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._disk = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_path:
+            try:
+                Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+                self._disk = sqlite3.connect(str(disk_path), check_same_thread=False)
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+                )
+                self._disk.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Embedding cache disk tier disabled: {e}")
+                self._disk = None
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def _remember(self, key: str, vec: np.ndarray):
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model: str, task_type: str, text: str) -> Optional[List[float]]:
+        key = embedding_cache_key(model, task_type, text)
+        vec = self._memory.get(key)
+        if vec is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return vec.tolist()
+
+        if self._disk is not None:
+            try:
+                row = self._disk.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Error reading embedding cache: {e}")
+                row = None
+            if row:
+                vec = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, vec)
+                self.hits += 1
+                self.disk_hits += 1
+                return vec.tolist()
+
+        self.misses += 1
+        return None
+
+    def put(self, model: str, task_type: str, text: str, embedding: Sequence[float]):
+        key = embedding_cache_key(model, task_type, text)
+        vec = np.asarray(embedding, dtype=np.float32)
+        self._remember(key, vec)
+        if self._disk is not None:
+            try:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    (key, vec.tobytes())
+                )
+                self._disk.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Error writing embedding cache: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "disk_enabled": self._disk is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
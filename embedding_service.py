@@ -3,11 +3,25 @@ from dotenv import load_dotenv
 import os
 import logging
 import datetime
+import asyncio
 import numpy as np
 from typing import Dict, List, Optional, Tuple
+import base64
 import json
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from admission import PRIORITY_INTERACTIVE, AdaptiveLimiter, AdmissionRejected, limiter_from_env
+from async_executor import BlockingExecutor
+from backends import EmbeddingBackend, FakeEmbeddingBackend, GeminiEmbeddingBackend
+from deadlines import LatencyTracker, hedged
+from embedding_batcher import EmbeddingBatcher
+from embedding_cache import EmbeddingCache
+from embedding_store import EmbeddingStore
+from expiry import ExpiryScheduler
+from timeline import CreationTimeline, TimelineKey
+from vector_index import build_index
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -16,29 +30,154 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+def parse_conversation_messages(conversation_text: str,
+                                timestamp: Optional[str] = None) -> List[dict]:
+    """Split a "User: ...\nBot: ..." conversation into role/content messages"""
+    messages = []
+    for line in conversation_text.split("\n"):
+        if line.startswith("User: "):
+            messages.append({"role": "user", "content": line[6:]})
+        elif line.startswith("Bot: "):
+            messages.append({"role": "bot", "content": line[5:]})
+        else:
+            continue
+        if timestamp is not None:
+            messages[-1]["timestamp"] = timestamp
+    return messages
+
+
+def encode_cursor(key: TimelineKey) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> TimelineKey:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        created_at, cache_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(created_at), str(cache_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
 class EmbeddingService:
-    def __init__(self):
+    def __init__(self, search_mode: Optional[str] = None,
+                 embedding_backend: Optional[EmbeddingBackend] = None,
+                 executor: Optional[BlockingExecutor] = None,
+                 storage_dtype: Optional[str] = None,
+                 limiter: Optional[AdaptiveLimiter] = None):
         try:
+            # LLM_BACKEND=fake embeds offline, so no API key is needed
+            fake = os.getenv('LLM_BACKEND', 'gemini').lower() == 'fake'
             api_key = os.getenv('GOOGLE_API_KEY')
-            if not api_key:
+            if api_key:
+                genai.configure(api_key=api_key)
+            elif not (fake or embedding_backend):
                 raise ValueError("GOOGLE_API_KEY not found")
             
-            genai.configure(api_key=api_key)
-            
             self.embedding_model = "models/text-embedding-004"
             self.generation_model = "gemini-1.5-flash-001"
             
+            # Upstream calls run off the event loop (native async or thread pool)
+            self.executor = executor or BlockingExecutor(
+                max_workers=int(os.getenv('BLOCKING_POOL_SIZE', '16'))
+            )
+            
+            # Admission control for upstream calls (shared with ChatService when passed in)
+            self.limiter = limiter or limiter_from_env()
+            
+            if embedding_backend is None and fake:
+                embedding_backend = FakeEmbeddingBackend(
+                    latency=os.getenv('FAKE_EMBEDDING_LATENCY', 'lognormal:80:0.4')
+                )
+            
+            # Concurrent create_embedding calls are coalesced into batched requests
+            self.embedding_backend = embedding_backend or GeminiEmbeddingBackend(
+                self.embedding_model,
+                executor=self.executor,
+                native_async=os.getenv('GEMINI_ASYNC_MODE', 'native') == 'native'
+            )
+            self.batcher = EmbeddingBatcher(
+                self.embedding_backend,
+                max_batch_size=int(os.getenv('EMBEDDING_BATCH_SIZE', '32')),
+                max_wait=float(os.getenv('EMBEDDING_BATCH_WAIT_MS', '5')) / 1000,
+                limiter=self.limiter
+            )
+            
+            # Interactive embeddings send a hedged duplicate once they run past the
+            # observed p95 (EMBEDDING_HEDGE_DELAY_MS until enough samples exist)
+            self.hedge_enabled = os.getenv('EMBEDDING_HEDGE_ENABLED', 'true').lower() == 'true'
+            self.hedge_percentile = float(os.getenv('EMBEDDING_HEDGE_PERCENTILE', '95'))
+            self.hedge_default_delay = float(os.getenv('EMBEDDING_HEDGE_DELAY_MS', '500')) / 1000
+            self.embedding_latency = LatencyTracker()
+            self.hedges_sent = 0
+            self.embedding_timeouts = 0
+            
             # Create data directory if it doesn't exist
-            self.data_dir = Path("data")
-            self.data_dir.mkdir(exist_ok=True)
+            self.data_dir = Path(os.getenv('DATA_DIR', 'data'))
+            self.data_dir.mkdir(parents=True, exist_ok=True)
             
-            # File paths for persistent storage
+            # Legacy whole-file JSON storage, migrated into the store once
             self.cache_file = self.data_dir / "conversation_cache.json"
             self.embedding_file = self.data_dir / "embedding_cache.json"
             
+            # Append-only log + memory-mapped embedding rows; embedding_storage
+            # is a read-only view over the row file
+            self.store = EmbeddingStore(
+                self.data_dir / "embedding_store",
+                compact_min_records=int(os.getenv('EMBEDDING_STORE_COMPACT_MIN', '1000')),
+                fsync=os.getenv('EMBEDDING_STORE_FSYNC', 'false').lower() == 'true'
+            )
+            
+            # Memo of text -> embedding so repeated queries skip the API call
+            memo_disk = os.getenv('EMBEDDING_MEMO_DISK', 'false').lower() == 'true'
+            self.embedding_cache = EmbeddingCache(
+                max_entries=int(os.getenv('EMBEDDING_MEMO_SIZE', '10000')),
+                disk_path=self.data_dir / "embedding_memo.sqlite3" if memo_disk else None
+            )
+            
             # Load existing data or initialize empty
-            self.cache_storage = self._load_cache()
-            self.embedding_storage = self._load_embeddings()
+            needs_migration = not self.store.exists
+            self.cache_storage, self.embedding_storage = self.store.load()
+            if needs_migration:
+                self._migrate_legacy_json()
+            
+            # Numeric expiry deadlines; expired entries are skipped on read
+            # and evicted incrementally by evict_expired()
+            self.default_ttl = float(os.getenv('CACHE_TTL_SECONDS', str(24 * 3600)))
+            self.expiry = ExpiryScheduler()
+            for cache_id, cache_data in self.cache_storage.items():
+                self.expiry.schedule(cache_id, self._expire_timestamp(cache_data))
+            
+            # Newest-first listing order; messages are parsed once on write
+            # (older records are parsed here, and persisted by the next compaction)
+            self.timeline = CreationTimeline()
+            for cache_data in self.cache_storage.values():
+                if "messages" not in cache_data:
+                    cache_data["messages"] = parse_conversation_messages(cache_data.get("text", ""))
+            self.timeline.rebuild({
+                cache_id: self._create_timestamp(cache_data)
+                for cache_id, cache_data in self.cache_storage.items()
+            })
+            
+            # Similarity search index: "exact" (flat matrix) or
+            # "approximate" (IVF-flat, nprobe trades recall for latency)
+            self.search_mode = search_mode or os.getenv('EMBEDDING_SEARCH_MODE', 'exact')
+            # Index row storage: float32, float16 or int8 (per-vector scale)
+            self.storage_dtype = storage_dtype or os.getenv('EMBEDDING_STORAGE_DTYPE', 'float32')
+            index_options = {"dtype": self.storage_dtype}
+            self.index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-train")
+            if self.search_mode == "approximate":
+                index_options = {
+                    **index_options,
+                    "nprobe": int(os.getenv('EMBEDDING_IVF_NPROBE', '8')),
+                    "min_train_size": int(os.getenv('EMBEDDING_IVF_MIN_TRAIN_SIZE', '4096')),
+                    # Retraining runs off the event loop, on its own worker so it
+                    # never takes upstream slots from live requests
+                    "train_executor": self.index_executor
+                }
+            self.vector_index = build_index(self.search_mode, self.embedding_storage, **index_options)
+            # Embeddings of the user queries, used to reuse answers directly
+            self.query_index = build_index(self.search_mode, self.store.query_embeddings, **index_options)
             
             logger.info("EmbeddingService initialized successfully")
             
@@ -47,7 +186,7 @@ class EmbeddingService:
             raise
 
     def _load_cache(self) -> Dict[str, dict]:
-        """Load cache from file or return empty dict"""
+        """Load legacy JSON cache from file or return empty dict"""
         try:
             if self.cache_file.exists():
                 with open(self.cache_file, 'r', encoding='utf-8') as f:
@@ -58,7 +197,7 @@ class EmbeddingService:
             return {}
 
     def _load_embeddings(self) -> Dict[str, List[float]]:
-        """Load embeddings from file or return empty dict"""
+        """Load legacy JSON embeddings from file or return empty dict"""
         try:
             if self.embedding_file.exists():
                 with open(self.embedding_file, 'r', encoding='utf-8') as f:
@@ -68,31 +207,116 @@ class EmbeddingService:
             logger.error(f"Error loading embeddings: {e}")
             return {}
 
-    def _save_cache(self):
-        """Save cache to file"""
+    def _migrate_legacy_json(self):
+        """Import conversation_cache.json / embedding_cache.json into the store"""
+        if not (self.cache_file.exists() and self.embedding_file.exists()):
+            return
+        cache = self._load_cache()
+        embeddings = self._load_embeddings()
+        self.cache_storage, self.embedding_storage = self.store.compact(cache, embeddings)
+        for path in (self.cache_file, self.embedding_file):
+            path.rename(path.with_suffix(".json.migrated"))
+        logger.info(f"Migrated {len(self.cache_storage)} conversations from JSON to the store")
+
+    @staticmethod
+    def _create_timestamp(cache_data: dict) -> float:
+        """Creation as a Unix timestamp (older entries only have the ISO string)"""
+        if "create_ts" in cache_data:
+            return cache_data["create_ts"]
         try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache_storage, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"Error saving cache: {e}")
+            return datetime.datetime.fromisoformat(cache_data["create_time"]).timestamp()
+        except (KeyError, ValueError):
+            return 0.0
+
+    @staticmethod
+    def _expire_timestamp(cache_data: dict) -> float:
+        """Expiry as a Unix timestamp (legacy entries only have the ISO string)"""
+        if "expire_ts" in cache_data:
+            return cache_data["expire_ts"]
+        try:
+            return datetime.datetime.fromisoformat(cache_data["expire_time"]).timestamp()
+        except (KeyError, ValueError):
+            return 0.0
 
-    def _save_embeddings(self):
-        """Save embeddings to file"""
+    def _evict(self, cache_ids: List[str]):
+        """Drop entries from memory, the index, the scheduler and the store"""
+        cache_ids = [cache_id for cache_id in cache_ids if cache_id in self.cache_storage]
+        for cache_id in cache_ids:
+            del self.cache_storage[cache_id]
+            self.vector_index.remove(cache_id)
+            self.query_index.remove(cache_id)
+            self.expiry.discard(cache_id)
+            self.timeline.discard(cache_id)
+        if cache_ids:
+            self.store.delete(cache_ids)
+
+    def _compact_store(self):
+        """Rewrite the store without dead records"""
         try:
-            with open(self.embedding_file, 'w', encoding='utf-8') as f:
-                json.dump(self.embedding_storage, f, ensure_ascii=False, indent=2)
+            self.cache_storage, self.embedding_storage = self.store.compact(self.cache_storage)
         except Exception as e:
-            logger.error(f"Error saving embeddings: {e}")
+            logger.error(f"Error compacting store: {e}")
+
+    def hedge_delay(self) -> float:
+        observed = self.embedding_latency.percentile(self.hedge_percentile)
+        return self.hedge_default_delay if observed is None else observed
 
-    async def create_embedding(self, text: str) -> Optional[List[float]]:
-        """Create embedding for text"""
+    def hedge_stats(self) -> dict:
+        return {
+            "enabled": self.hedge_enabled,
+            "hedge_delay_ms": self.hedge_delay() * 1000,
+            "latency_samples": len(self.embedding_latency),
+            "hedges_sent": self.hedges_sent,
+            "timeouts": self.embedding_timeouts
+        }
+
+    async def create_embedding(self, text: str, task_type: str = "RETRIEVAL_DOCUMENT",
+                               priority: int = PRIORITY_INTERACTIVE,
+                               timeout: Optional[float] = None) -> Optional[List[float]]:
+        """Create embedding for text; None on failure or after `timeout` seconds.
+
+        Raises AdmissionRejected when upstream is saturated.
+        """
+        start = time.perf_counter()
         try:
-            result = genai.embed_content(
-                model=self.embedding_model,
-                content=text,
-                task_type="RETRIEVAL_DOCUMENT"
-            )
-            return result["embedding"]
+            cached = self.embedding_cache.get(self.embedding_model, task_type, text)
+            if cached is not None:
+                return cached
+            
+            def attempt():
+                return self.batcher.embed(text, task_type, priority)
+            
+            def hedge_attempt():
+                self.hedges_sent += 1
+                return attempt()
+            
+            delay = None
+            if self.hedge_enabled and priority == PRIORITY_INTERACTIVE:
+                delay = self.hedge_delay()
+            
+            try:
+                embedding = await asyncio.wait_for(
+                    hedged(attempt, delay, hedge_fn=hedge_attempt), timeout
+                )
+            except AdmissionRejected:
+                raise
+            except Exception:
+                # Failures and timeouts count too, or the hedge delay's p95 reads low
+                self.embedding_latency.record(time.perf_counter() - start)
+                raise
+            self.embedding_latency.record(time.perf_counter() - start)
+            self.embedding_cache.put(self.embedding_model, task_type, text, embedding)
+            return embedding
+        except AdmissionRejected:
+            raise
+        except asyncio.TimeoutError as e:
+            # Unless the budget ran out, this is the backend's own timeout (e.g. a socket's)
+            if timeout is None or time.perf_counter() - start < timeout:
+                logger.error(f"Error creating embedding: {e!r}")
+                return None
+            self.embedding_timeouts += 1
+            logger.warning(f"Embedding timed out after {timeout:.2f}s")
+            return None
         except Exception as e:
             logger.error(f"Error creating embedding: {e}")
             return None
@@ -108,40 +332,82 @@ class EmbeddingService:
             return 0.0
 
     async def find_similar_conversations(self, query_embedding: List[float], 
-                                      threshold: float = 0.8) -> List[Tuple[str, float]]:
+                                      threshold: float = 0.8,
+                                      limit: Optional[int] = None,
+                                      exact: bool = False) -> List[Tuple[str, float]]:
         """Find similar conversations based on embedding similarity"""
         try:
-            similar_conversations = []
-            for cache_id, embedding in self.embedding_storage.items():
-                similarity = self.compute_similarity(query_embedding, embedding)
-                if similarity > threshold:
-                    similar_conversations.append((cache_id, similarity))
-            
-            return sorted(similar_conversations, key=lambda x: x[1], reverse=True)
+            results = self.vector_index.search(query_embedding, threshold=threshold,
+                                               k=limit, exact=exact)
+            now = time.time()
+            expired = [cache_id for cache_id, _ in results if self.expiry.is_expired(cache_id, now)]
+            if expired:
+                self._evict(expired)
+                results = [item for item in results if item[0] not in expired]
+            return results
         except Exception as e:
             logger.error(f"Error finding similar conversations: {e}")
             return []
 
+    def new_cache_id(self) -> str:
+        """Unique cache ID, so callers can reserve one before the write happens"""
+        return f"cache_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+
+    async def find_cached_response(self, query_embedding: List[float],
+                                   threshold: float = 0.97) -> Optional[Tuple[str, float, dict]]:
+        """Find a past answer whose query is near-identical; counts it as a hit"""
+        try:
+            for cache_id, similarity in self.query_index.search(query_embedding, threshold=threshold, k=3):
+                if self.expiry.is_expired(cache_id):
+                    self._evict([cache_id])
+                    continue
+                cache_data = self.cache_storage.get(cache_id)
+                if not cache_data or "response" not in cache_data:
+                    continue
+                cache_data["hit_count"] = cache_data.get("hit_count", 0) + 1
+                self.store.record_hit(cache_id, cache_data["hit_count"])
+                return cache_id, similarity, cache_data
+            return None
+        except Exception as e:
+            logger.error(f"Error finding cached response: {e}")
+            return None
+
     async def cache_conversation(self, conversation_text: str, embedding: List[float], 
-                               display_name: str = None) -> Optional[str]:
-        """Cache conversation with its embedding"""
+                               display_name: str = None,
+                               ttl_seconds: Optional[float] = None,
+                               query_embedding: Optional[List[float]] = None,
+                               response: Optional[str] = None,
+                               cache_id: Optional[str] = None) -> Optional[str]:
+        """Cache conversation with its embedding (and the query's, for answer reuse)"""
         try:
-            cache_id = f"cache_{int(time.time())}_{len(self.cache_storage)}"
+            cache_id = cache_id or self.new_cache_id()
             
+            now = datetime.datetime.now()
+            expire_at = now + datetime.timedelta(seconds=ttl_seconds or self.default_ttl)
             cache_data = {
                 "text": conversation_text,
                 "display_name": display_name or f"Conversation_{cache_id}",
-                "create_time": datetime.datetime.now().isoformat(),
-                "expire_time": (datetime.datetime.now() + datetime.timedelta(hours=24)).isoformat()
+                "create_time": now.isoformat(),
+                "create_ts": now.timestamp(),
+                "expire_time": expire_at.isoformat(),
+                "expire_ts": expire_at.timestamp(),
+                "hit_count": 0,
+                "messages": parse_conversation_messages(conversation_text)
             }
+            if response is not None:
+                cache_data["response"] = response
             
-            # Store in memory and file
+            # Append to the store, then update memory and the index
+            embedding = np.asarray(embedding, dtype=np.float32)
+            self.store.put(cache_id, cache_data, embedding, query_embedding)
+            self.vector_index.add(cache_id, embedding)
+            if query_embedding is not None:
+                self.query_index.add(cache_id, query_embedding)
+            else:
+                self.query_index.remove(cache_id)
             self.cache_storage[cache_id] = cache_data
-            self.embedding_storage[cache_id] = embedding
-            
-            # Save to files
-            self._save_cache()
-            self._save_embeddings()
+            self.expiry.schedule(cache_id, cache_data["expire_ts"])
+            self.timeline.add(cache_id, cache_data["create_ts"])
             
             logger.info(f"Created and saved cache with ID: {cache_id}")
             return cache_id
@@ -153,6 +419,11 @@ class EmbeddingService:
     async def get_cached_conversation(self, cache_id: str) -> Optional[dict]:
         """Get cached conversation by ID"""
         try:
+            if self.expiry.is_expired(cache_id):
+                logger.info(f"Conversation expired: {cache_id}")
+                self._evict([cache_id])
+                return None
+            
             if cache_id in self.cache_storage:
                 logger.info(f"Found conversation in cache: {cache_id}")
                 return self.cache_storage[cache_id]
@@ -167,41 +438,79 @@ class EmbeddingService:
     async def list_caches(self) -> List[dict]:
         """List all cached conversations"""
         try:
+            now = time.time()
             return [
                 {
                     "name": cache_id,
                     "display_name": data["display_name"],
                     "create_time": data["create_time"],
                     "expire_time": data["expire_time"],
+                    "hit_count": data.get("hit_count", 0),
                     "in_memory": True
                 }
                 for cache_id, data in self.cache_storage.items()
+                if not self.expiry.is_expired(cache_id, now)
             ]
         except Exception as e:
             logger.error(f"Error listing caches: {e}")
             return []
 
-    async def cleanup_expired_caches(self):
-        """Clean up expired caches"""
+    async def list_conversations(self, limit: int = 50,
+                                 cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Newest-first page of live conversations with their parsed messages.
+
+        Returns (conversations, next_cursor); next_cursor is None on the last
+        page. Up to `limit` already-expired entries are evicted on the way;
+        any others are skipped here and left to the cleanup task. Raises
+        ValueError for a malformed cursor.
+        """
+        before = decode_cursor(cursor) if cursor else None
+        now = time.time()
+        self._evict(self.expiry.pop_expired(now, limit=limit))
+        cache_ids, next_key = self.timeline.page(
+            before, limit, skip=lambda cache_id: self.expiry.is_expired(cache_id, now)
+        )
+        conversations = []
+        for cache_id in cache_ids:
+            data = self.cache_storage[cache_id]
+            conversations.append({
+                "cache_id": cache_id,
+                "display_name": data["display_name"],
+                "created_at": data["create_time"],
+                "expires_at": data["expire_time"],
+                "messages": [{**message, "timestamp": data["create_time"]}
+                             for message in data["messages"]],
+                "has_embedding": cache_id in self.embedding_storage
+            })
+        return conversations, encode_cursor(next_key) if next_key else None
+
+    async def evict_expired(self, batch_size: int = 500) -> int:
+        """Evict at most batch_size expired entries; returns how many were evicted"""
         try:
-            current_time = datetime.datetime.now()
-            expired_ids = []
+            expired_ids = self.expiry.pop_expired(limit=batch_size)
+            self._evict(expired_ids)
+            return len(expired_ids)
+        except Exception as e:
+            logger.error(f"Error evicting expired caches: {e}")
+            return 0
+
+    async def cleanup_expired_caches(self, batch_size: int = 500):
+        """Clean up expired caches in small batches, yielding between them"""
+        try:
+            total = 0
+            while True:
+                evicted = await self.evict_expired(batch_size)
+                total += evicted
+                if evicted < batch_size:
+                    break
+                await asyncio.sleep(0)
             
-            for cache_id, cache_data in self.cache_storage.items():
-                expire_time = datetime.datetime.fromisoformat(cache_data["expire_time"])
-                if current_time > expire_time:
-                    expired_ids.append(cache_id)
-            
-            for cache_id in expired_ids:
-                del self.cache_storage[cache_id]
-                del self.embedding_storage[cache_id]
-            
-            # Save changes to files
-            if expired_ids:
-                self._save_cache()
-                self._save_embeddings()
+            # Reclaim store space once enough records are dead
+            if self.store.needs_compaction():
+                self._compact_store()
                 
-            logger.info(f"Cleaned up {len(expired_ids)} expired caches")
+            if total:
+                logger.info(f"Cleaned up {total} expired caches")
             
         except Exception as e:
-            logger.error(f"Error cleaning up caches: {e}")
\ No newline at end of file
+            logger.error(f"Error cleaning up caches: {e}")
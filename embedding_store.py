@@ -0,0 +1,286 @@
+import json
+import logging
+import os
+import numpy as np
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StoredEmbeddings(Mapping):
+    """Read-only id -> embedding view backed by the store's row file"""
+
+    def __init__(self, store: "EmbeddingStore", query: bool = False):
+        self._store = store
+        self._query = query
+
+    @property
+    def _rows(self) -> Dict[str, int]:
+        return self._store._query_row_of if self._query else self._store._row_of
+
+    def __getitem__(self, cache_id: str) -> np.ndarray:
+        vec = self._store.get_vector(cache_id, query=self._query)
+        if vec is None:
+            raise KeyError(cache_id)
+        return vec
+
+    def __contains__(self, cache_id) -> bool:
+        return cache_id in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._rows))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class EmbeddingStore:
+    """Append-only JSON log plus memory-mapped float32 embedding rows, switched by a manifest"""
+
+    def __init__(self, directory: Path, compact_min_records: int = 1000,
+                 compact_dead_ratio: float = 0.5, fsync: bool = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.manifest_file = self.directory / "MANIFEST.json"
+        self.compact_min_records = compact_min_records
+        self.compact_dead_ratio = compact_dead_ratio
+        self.fsync = fsync
+
+        self.generation = 0
+        self.dim: Optional[int] = None
+        self._log = None
+        self._vectors = None
+        self._rows = 0
+        self._records = 0
+        self._row_of: Dict[str, int] = {}
+        self._query_row_of: Dict[str, int] = {}
+        self._mapped: Optional[np.ndarray] = None
+        self.embeddings = StoredEmbeddings(self)
+        self.query_embeddings = StoredEmbeddings(self, query=True)
+
+    @property
+    def exists(self) -> bool:
+        return self.manifest_file.exists()
+
+    @property
+    def log_file(self) -> Path:
+        return self.directory / f"conversations.{self.generation}.log"
+
+    @property
+    def vector_file(self) -> Path:
+        return self.directory / f"embeddings.{self.generation}.f32"
+
+    @property
+    def dead_records(self) -> int:
+        return self._records - len(self._row_of)
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def disk_usage(self) -> int:
+        """Bytes used by the current generation"""
+        return sum(path.stat().st_size for path in (self.log_file, self.vector_file)
+                   if path.exists())
+
+    def _write_manifest(self):
+        tmp = self.manifest_file.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"generation": self.generation, "dim": self.dim}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.manifest_file)
+
+    def _sync(self, f):
+        f.flush()
+        if self.fsync:
+            os.fsync(f.fileno())
+
+    def _remove_stale_generations(self):
+        current = {self.log_file.name, self.vector_file.name}
+        for pattern in ("conversations.*.log", "embeddings.*.f32"):
+            for path in self.directory.glob(pattern):
+                if path.name not in current:
+                    try:
+                        path.unlink()
+                    except OSError as e:
+                        logger.warning(f"Could not remove stale store file {path}: {e}")
+
+    def _open_for_append(self):
+        self._log = open(self.log_file, 'ab')
+        self._vectors = open(self.vector_file, 'ab')
+
+    def close(self):
+        for f in (self._log, self._vectors):
+            if f is not None:
+                f.close()
+        self._log = self._vectors = None
+        self._mapped = None
+
+    def get_vector(self, cache_id: str, query: bool = False) -> Optional[np.ndarray]:
+        """Embedding row for cache_id (a read-only view of the memory map)"""
+        row = (self._query_row_of if query else self._row_of).get(cache_id)
+        if row is None:
+            return None
+        if self._mapped is None or row >= len(self._mapped):
+            self._mapped = np.memmap(self.vector_file, dtype=np.float32, mode='r',
+                                     shape=(self._rows, self.dim))
+        return self._mapped[row]
+
+    def _map_vectors(self) -> Optional[np.ndarray]:
+        """Truncate a torn trailing row and memory-map the complete rows"""
+        if self.dim is None or not self.vector_file.exists():
+            self._rows = 0
+            return None
+        row_bytes = self.dim * 4
+        size = self.vector_file.stat().st_size
+        if size % row_bytes:
+            logger.warning(f"Truncating partial embedding row in {self.vector_file}")
+            os.truncate(self.vector_file, size - size % row_bytes)
+        self._rows = size // row_bytes
+        if self._rows == 0:
+            return None
+        return np.memmap(self.vector_file, dtype=np.float32, mode='r',
+                         shape=(self._rows, self.dim))
+
+    def load(self) -> Tuple[Dict[str, dict], StoredEmbeddings]:
+        """Replay the log; returns (conversations, embeddings) for live records"""
+        self.close()
+        if self.exists:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.generation = manifest["generation"]
+            self.dim = manifest.get("dim")
+        else:
+            self._write_manifest()
+        self._remove_stale_generations()
+
+        self._mapped = self._map_vectors()
+        records: Dict[str, dict] = {}
+        rows: Dict[str, int] = {}
+        query_rows: Dict[str, int] = {}
+        self._records = 0
+
+        valid_end = 0
+        if self.log_file.exists():
+            with open(self.log_file, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("unterminated record")
+                        entry = json.loads(line)
+                        if entry["op"] == "put":
+                            if max(entry["row"], entry.get("qrow", -1)) >= self._rows:
+                                raise ValueError("record references a missing row")
+                            records[entry["id"]] = entry["data"]
+                            rows[entry["id"]] = entry["row"]
+                            query_rows.pop(entry["id"], None)
+                            if "qrow" in entry:
+                                query_rows[entry["id"]] = entry["qrow"]
+                        elif entry["op"] == "del":
+                            for cache_id in entry["ids"]:
+                                records.pop(cache_id, None)
+                                rows.pop(cache_id, None)
+                                query_rows.pop(cache_id, None)
+                        elif entry["op"] == "hit":
+                            if entry["id"] in records:
+                                records[entry["id"]]["hit_count"] = entry["count"]
+                        else:
+                            raise ValueError(f"unknown op {entry['op']}")
+                    except (ValueError, KeyError, TypeError) as e:
+                        logger.warning(f"Truncating store log at byte {valid_end}: {e}")
+                        break
+                    valid_end += len(line)
+                    self._records += 1
+            if valid_end < self.log_file.stat().st_size:
+                os.truncate(self.log_file, valid_end)
+
+        self._row_of = rows
+        self._query_row_of = query_rows
+        self._open_for_append()
+        logger.info(f"Loaded {len(records)} conversations from store generation {self.generation}")
+        return records, self.embeddings
+
+    def _append_vector(self, embedding: Sequence[float]) -> int:
+        vec = np.asarray(embedding, dtype=np.float32).ravel()
+        if self.dim is None:
+            self.dim = vec.shape[0]
+            self._write_manifest()
+        if vec.shape[0] != self.dim:
+            raise ValueError(f"expected dimension {self.dim}, got {vec.shape[0]}")
+        self._vectors.write(vec.tobytes())
+        self._sync(self._vectors)
+        row = self._rows
+        self._rows += 1
+        return row
+
+    def _append_record(self, entry: dict):
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n"
+        self._log.write(line.encode('utf-8'))
+        self._sync(self._log)
+        self._records += 1
+
+    def put(self, cache_id: str, data: dict, embedding: Sequence[float],
+            query_embedding: Optional[Sequence[float]] = None):
+        """Append a conversation and its embedding(s) (O(1) in the store size)"""
+        entry = {"op": "put", "id": cache_id, "row": self._append_vector(embedding)}
+        if query_embedding is not None:
+            entry["qrow"] = self._append_vector(query_embedding)
+        entry["data"] = data
+        self._append_record(entry)
+        self._row_of[cache_id] = entry["row"]
+        self._query_row_of.pop(cache_id, None)
+        if "qrow" in entry:
+            self._query_row_of[cache_id] = entry["qrow"]
+
+    def record_hit(self, cache_id: str, count: int):
+        """Append the new hit count for a cached conversation"""
+        self._append_record({"op": "hit", "id": cache_id, "count": count})
+
+    def delete(self, cache_ids: Iterable[str]):
+        """Append a tombstone for the given ids"""
+        cache_ids = list(cache_ids)
+        if not cache_ids:
+            return
+        self._append_record({"op": "del", "ids": cache_ids})
+        for cache_id in cache_ids:
+            self._row_of.pop(cache_id, None)
+            self._query_row_of.pop(cache_id, None)
+
+    def needs_compaction(self) -> bool:
+        dead = self.dead_records
+        return (dead >= self.compact_min_records
+                and dead >= self.compact_dead_ratio * max(1, self._records))
+
+    def compact(self, records: Dict[str, dict],
+                embeddings: Optional[Dict[str, Sequence[float]]] = None
+                ) -> Tuple[Dict[str, dict], StoredEmbeddings]:
+        """Rewrite the live set (embeddings copied unless given) as a new generation and reload it"""
+        if embeddings is None:
+            embeddings = {cache_id: self.get_vector(cache_id) for cache_id in self._row_of}
+        query_embeddings = {cache_id: self.get_vector(cache_id, query=True)
+                            for cache_id in self._query_row_of}
+        self.close()
+        previous = self.generation
+        self.generation = previous + 1
+        self._rows = self._records = 0
+        self._row_of, self._query_row_of = {}, {}
+        try:
+            self._open_for_append()
+            for cache_id, data in records.items():
+                if cache_id in embeddings:
+                    self.put(cache_id, data, embeddings[cache_id],
+                             query_embeddings.get(cache_id))
+            for f in (self._log, self._vectors):
+                f.flush()
+                os.fsync(f.fileno())
+            self._write_manifest()
+        except Exception:
+            self.close()
+            self.generation = previous
+            self.load()
+            raise
+        logger.info(f"Compacted store into generation {self.generation} "
+                    f"({self._records} live records)")
+        return self.load()
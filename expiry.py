@@ -0,0 +1,61 @@
+import heapq
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class ExpiryScheduler:
+    """Min-heap of (expire_at, id) with lazy invalidation.
+
+    Rescheduling or discarding an id leaves its old heap entry in place;
+    entries whose timestamp no longer matches `_deadlines` are skipped when
+    popped, and the heap is rebuilt once stale entries dominate.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._deadlines: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._deadlines
+
+    def schedule(self, item_id: str, expire_at: float):
+        self._deadlines[item_id] = expire_at
+        heapq.heappush(self._heap, (expire_at, item_id))
+        self._maybe_rebuild()
+
+    def discard(self, item_id: str):
+        self._deadlines.pop(item_id, None)
+        self._maybe_rebuild()
+
+    def expire_at(self, item_id: str) -> Optional[float]:
+        return self._deadlines.get(item_id)
+
+    def is_expired(self, item_id: str, now: Optional[float] = None) -> bool:
+        expire_at = self._deadlines.get(item_id)
+        return expire_at is not None and expire_at <= (now or time.time())
+
+    def next_expiry(self) -> Optional[float]:
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_expired(self, now: Optional[float] = None, limit: Optional[int] = None) -> List[str]:
+        """Remove and return up to `limit` ids whose deadline has passed"""
+        now = now or time.time()
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            if limit is not None and len(expired) >= limit:
+                break
+            expire_at, item_id = heapq.heappop(self._heap)
+            if self._deadlines.get(item_id) == expire_at:
+                del self._deadlines[item_id]
+                expired.append(item_id)
+        return expired
+
+    def _maybe_rebuild(self):
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._deadlines):
+            self._heap = [(expire_at, item_id) for item_id, expire_at in self._deadlines.items()]
+            heapq.heapify(self._heap)
@@ -1,44 +1,96 @@
-from fastapi import FastAPI, Request, Form, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Request, Form, Header, HTTPException, BackgroundTasks
+from typing import List, Optional
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from admission import AdmissionRejected
 from chat_service import ChatService
-from embedding_service import EmbeddingService
+from deadlines import DeadlineExceeded
+from metrics import MetricsRegistry, ServiceMetrics
+from profiler import ProfilerService
 import google.generativeai as genai
 import logging
 import asyncio
+import hmac
+import json
+import os
 
 app = FastAPI()
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 chat_service = ChatService()
-embedding_service = EmbeddingService()
+# Share one EmbeddingService: a single writer owns the append-only store
+embedding_service = chat_service.embedding_service
+
+# Stage timings are collected by wrapping service methods in place
+service_metrics = None
+if os.getenv('METRICS_ENABLED', 'true').lower() == 'true':
+    service_metrics = ServiceMetrics(chat_service).install()
+
+profiler_service = ProfilerService()
+
+MAX_CONVERSATIONS_PAGE = int(os.getenv('MAX_CONVERSATIONS_PAGE', '500'))
+MAX_BANGLISH_BULK_TEXTS = int(os.getenv('MAX_BANGLISH_BULK_TEXTS', '10000'))
 
 logger = logging.getLogger(__name__)
 
 async def cleanup_task():
-    """Periodic task to clean up expired caches"""
+    """Periodic task to evict expired caches in small batches"""
+    interval = float(os.getenv('CACHE_CLEANUP_INTERVAL', '60'))
     while True:
         await embedding_service.cleanup_expired_caches()
-        await asyncio.sleep(3600)  # Run every hour
+        await asyncio.sleep(interval)
 
 @app.on_event("startup")
 async def startup_event():
     """Start background tasks"""
     asyncio.create_task(cleanup_task())
+    if service_metrics:
+        service_metrics.loop_lag.start()
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Shed load quickly when the upstream wait queue is full"""
+    return JSONResponse(
+        status_code=429,
+        content={"status": "error", "message": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"status": "error", "message": str(exc)})
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.post("/chat")
-async def chat(message: str = Form(...)):
-    response = await chat_service.get_response(message)
+async def chat(message: str = Form(...), session_id: Optional[str] = Form(None)):
+    response = await chat_service.get_response(message, session_id=session_id)
     if "error" in response:
         raise HTTPException(status_code=500, detail=response["error"])
     return response
 
+@app.post("/chat/stream")
+async def chat_stream(message: str = Form(...), session_id: Optional[str] = Form(None)):
+    """Stream the answer as server-sent events: token events, then done (or error)"""
+    if chat_service.limiter.saturated:
+        raise AdmissionRejected(chat_service.limiter.retry_after())
+    
+    async def event_stream():
+        async for event in chat_service.stream_response(message, session_id=session_id):
+            name = event.pop("event")
+            yield f"event: {name}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/conversation/{cache_name}")
 async def get_conversation(cache_name: str):
     try:
@@ -54,7 +106,7 @@ async def test_cache():
         test_message = "Hello, how are you?"
         
         # Get initial response and cache
-        response1 = await chat_service.get_response(test_message)
+        response1 = await chat_service.get_response(test_message, background_cache=False)
         if "error" in response1:
             return {"status": "error", "message": "Failed to get initial response"}
             
@@ -105,14 +157,14 @@ async def test_page(request: Request):
     return templates.TemplateResponse("test_cache.html", {"request": request})
 
 @app.get("/similar-conversations/{message}")
-async def find_similar(message: str):
+async def find_similar(message: str, exact: bool = False):
     """Find similar conversations for a message"""
     try:
         embedding = await embedding_service.create_embedding(message)
         if not embedding:
             return {"status": "error", "message": "Failed to create embedding"}
             
-        similar = await embedding_service.find_similar_conversations(embedding)
+        similar = await embedding_service.find_similar_conversations(embedding, exact=exact)
         
         return {
             "status": "success",
@@ -125,6 +177,8 @@ async def find_similar(message: str):
                 for cache_id, similarity in similar
             ]
         }
+    except AdmissionRejected:
+        raise
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -134,7 +188,7 @@ async def test_caching():
     try:
         # Test 1: Create and cache a conversation
         test_message = "What is the weather today?"
-        response1 = await chat_service.get_response(test_message)
+        response1 = await chat_service.get_response(test_message, background_cache=False)
         
         if not response1.get("cache_name"):
             return {
@@ -145,7 +199,7 @@ async def test_caching():
             
         # Test 2: Try to find similar conversation
         similar_message = "How's the weather?"
-        response2 = await chat_service.get_response(similar_message)
+        response2 = await chat_service.get_response(similar_message, background_cache=False)
         
         # Test 3: Retrieve cache directly
         cached_conv = await embedding_service.get_cached_conversation(response1["cache_name"])
@@ -189,7 +243,12 @@ async def get_cache_stats():
             "stats": {
                 "total_caches": len(caches),
                 "memory_embeddings": len(embedding_service.embedding_storage),
+                "index_storage_dtype": embedding_service.storage_dtype,
+                "index_bytes": embedding_service.vector_index.nbytes,
                 "memory_conversations": len(embedding_service.cache_storage),
+                "embedding_memo": embedding_service.embedding_cache.stats(),
+                "banglish_memo": chat_service.banglish_service.token_memo.stats(),
+                "banglish_dictionary": chat_service.banglish_service.dictionary_stats(),
                 "cache_details": caches
             }
         }
@@ -213,7 +272,7 @@ async def test_conversation_cache():
         results = []
         for message in test_sequence:
             # Send message and get response
-            response = await chat_service.get_response(message)
+            response = await chat_service.get_response(message, background_cache=False)
             
             # Get cache details if available
             cache_details = None
@@ -233,7 +292,7 @@ async def test_conversation_cache():
         
         # Try to find similar conversations
         similar_query = "ঢাকা শহর সম্পর্কে জানতে চাই"  # I want to know about Dhaka city
-        similar_response = await chat_service.get_response(similar_query)
+        similar_response = await chat_service.get_response(similar_query, background_cache=False)
         
         return {
             "status": "success",
@@ -252,68 +311,102 @@ async def test_conversation_cache():
         }
 
 @app.get("/all-conversations")
-async def get_all_conversations():
-    """Get all cached conversations with full details"""
+async def get_all_conversations(limit: int = 50, cursor: Optional[str] = None):
+    """Get cached conversations with full details, newest first.
+
+    Paginated: pass the returned next_cursor to fetch the following page.
+    """
+    limit = max(1, min(limit, MAX_CONVERSATIONS_PAGE))
     try:
-        # Get all caches
-        caches = await embedding_service.list_caches()
-        logger.info(f"Found {len(caches)} caches")
-        
-        # Get full conversation details for each cache
-        conversations = []
-        for cache in caches:
-            cache_id = cache["name"]
-            logger.info(f"Processing cache: {cache_id}")
-            
-            conversation = await embedding_service.get_cached_conversation(cache_id)
-            
-            if conversation:
-                # Parse the conversation text to separate user and bot messages
-                conv_text = conversation.get("text", "")
-                logger.debug(f"Conversation text: {conv_text}")
-                
-                messages = []
-                for line in conv_text.split("\n"):
-                    if line.startswith("User: "):
-                        messages.append({
-                            "role": "user",
-                            "content": line[6:],
-                            "timestamp": conversation.get("create_time")
-                        })
-                    elif line.startswith("Bot: "):
-                        messages.append({
-                            "role": "bot",
-                            "content": line[5:],
-                            "timestamp": conversation.get("create_time")
-                        })
-                
-                conversations.append({
-                    "cache_id": cache_id,
-                    "display_name": cache["display_name"],
-                    "created_at": cache["create_time"],
-                    "expires_at": cache["expire_time"],
-                    "messages": messages,
-                    "has_embedding": cache_id in embedding_service.embedding_storage
-                })
-                logger.info(f"Added conversation with {len(messages)} messages")
-            else:
-                logger.warning(f"No conversation found for cache: {cache_id}")
-        
-        # Sort conversations by creation time (newest first)
-        conversations.sort(key=lambda x: x["created_at"], reverse=True)
-        
-        return {
-            "status": "success",
-            "total_conversations": len(conversations),
-            "conversations": conversations
-        }
-        
+        conversations, next_cursor = await embedding_service.list_conversations(limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Failed to get conversations: {e}")
         return {
             "status": "error",
             "message": f"Failed to get conversations: {str(e)}"
         }
+    
+    return {
+        "status": "success",
+        # Conversations not yet evicted; any expired ones past this request's
+        # eviction budget go with the next cleanup pass
+        "total_conversations": len(embedding_service.timeline),
+        "conversations": conversations,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor is not None
+    }
+
+@app.get("/runtime-stats")
+async def get_runtime_stats():
+    """Get upstream call queue depth, admission control, batching and coalescing statistics"""
+    return {
+        "status": "success",
+        "stats": {
+            "executor": chat_service.executor.stats(),
+            "upstream_limiter": chat_service.limiter.stats(),
+            "write_back": chat_service.write_back.stats(),
+            "chat_sessions": chat_service.sessions.stats(),
+            "single_flight": chat_service.single_flight.stats(),
+            "embedding_batcher": embedding_service.batcher.stats(),
+            "embedding_hedging": embedding_service.hedge_stats()
+        }
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text-format metrics: stage latencies, cache ratios, store sizes, upstream health"""
+    if service_metrics is None:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(service_metrics.render(), media_type=MetricsRegistry.CONTENT_TYPE)
+
+def require_admin(token: Optional[str]):
+    """Admin endpoints need X-Admin-Token to match ADMIN_TOKEN; without ADMIN_TOKEN they are off"""
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not hmac.compare_digest(token.encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/profile")
+async def admin_profile(seconds: float = 10, interval_ms: float = 5, mode: str = "all",
+                        tracemalloc: bool = False, top: int = 25,
+                        x_admin_token: Optional[str] = Header(None)):
+    """Sample threads and asyncio tasks for `seconds`; returns collapsed stacks.
+
+    mode is all, threads or tasks. With tracemalloc=true the response is JSON
+    with the collapsed stacks plus the largest live allocations of the stores.
+    """
+    require_admin(x_admin_token)
+    max_seconds = float(os.getenv('PROFILE_MAX_SECONDS', '60'))
+    if not 0 < seconds <= max_seconds:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {max_seconds:g}]")
+    if mode not in ("all", "threads", "tasks"):
+        raise HTTPException(status_code=400, detail="mode must be all, threads or tasks")
+    if profiler_service.busy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    
+    result = await profiler_service.profile(
+        seconds,
+        interval=interval_ms / 1000,
+        threads=mode in ("all", "threads"),
+        tasks=mode in ("all", "tasks"),
+        trace_allocations=tracemalloc,
+        top=top
+    )
+    if tracemalloc:
+        return result
+    return PlainTextResponse(result["collapsed"])
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush pending cache writes, then release the upstream and index thread pools"""
+    if service_metrics:
+        service_metrics.loop_lag.stop()
+    await chat_service.write_back.close()
+    chat_service.executor.shutdown(wait=False)
+    embedding_service.index_executor.shutdown(wait=False)
 
 @app.get("/conversation-history", response_class=HTMLResponse)
 async def conversation_history_page(request: Request):
@@ -340,3 +433,51 @@ async def check_banglish(text: str = Form(...)):
             "status": "error",
             "message": str(e)
         }
+
+class BanglishBulkRequest(BaseModel):
+    texts: List[str]
+
+@app.post("/check-banglish/bulk")
+async def check_banglish_bulk(request: BanglishBulkRequest):
+    """Correct many Banglish texts in one call.
+
+    corrections[i] is the corrected form of texts[i], or None if it needs none.
+    """
+    if len(request.texts) > MAX_BANGLISH_BULK_TEXTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_BANGLISH_BULK_TEXTS} texts per request"
+        )
+    try:
+        corrections = await asyncio.to_thread(
+            chat_service.banglish_service.correct_texts, request.texts
+        )
+        return {
+            "status": "success",
+            "corrections": corrections
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": str(e)
+        }
+
+@app.post("/admin/banglish/corrections")
+async def add_banglish_correction(misspelling: str = Form(...), correction: str = Form(...),
+                                  x_admin_token: Optional[str] = Header(None)):
+    """Teach the Banglish corrector a misspelling -> word mapping.
+
+    Takes effect immediately in this worker and within a reload check
+    interval in the others.
+    """
+    require_admin(x_admin_token)
+    try:
+        await asyncio.to_thread(
+            chat_service.banglish_service.add_correction, misspelling, correction
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "status": "success",
+        "dictionary": chat_service.banglish_service.dictionary_stats()
+    }
@@ -0,0 +1,343 @@
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set; observe() is thread-safe"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: LabelValues = ()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts, then +Inf, sum
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-1]!r}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter per label set"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: LabelValues = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels: LabelValues = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name}_total {self.help}", f"# TYPE {self.name}_total counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}_total{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+GaugeValue = Union[float, Dict[LabelValues, float]]
+
+
+class Gauge:
+    """Value read at scrape time from a callback (a number, or {labels: number}).
+
+    With cumulative=True the value is exposed as a counter (name_total), for
+    totals the services already keep.
+    """
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], GaugeValue],
+                 labelnames: Sequence[str] = (), cumulative: bool = False):
+        self.name = name + "_total" if cumulative else name
+        self.type = "counter" if cumulative else "gauge"
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.read = read
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.error(f"Error reading gauge {self.name}: {e}")
+            return lines
+        values = value if isinstance(value, dict) else {(): value}
+        for labels, number in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(number)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text format (0.0.4)"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, prefix: str = "smarteditor_"):
+        self.prefix = prefix
+        self._metrics: List[Union[Histogram, Counter, Gauge]] = []
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(self.prefix + name, help_text, labelnames, buckets))
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(self.prefix + name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], GaugeValue],
+              labelnames: Sequence[str] = (), cumulative: bool = False) -> Gauge:
+        return self._add(Gauge(self.prefix + name, help_text, read, labelnames, cumulative))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def instrument(obj, attr: str, histogram: Histogram, labels: LabelValues = (),
+               on_result: Optional[Callable[[object], None]] = None,
+               on_error: Optional[Callable[[Exception], None]] = None):
+    """Replace obj.attr with a wrapper that times each call into `histogram`.
+
+    Works for plain, coroutine and async-generator methods (an async
+    generator is timed until it is exhausted or closed). Call sites are
+    unchanged because the wrapper is set as an instance attribute.
+    """
+    original = getattr(obj, attr)
+    if getattr(original, "__instrumented__", False):
+        return
+
+    if inspect.isasyncgenfunction(original):
+        @functools.wraps(original)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                async for item in original(*args, **kwargs):
+                    yield item
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, labels)
+    elif inspect.iscoroutinefunction(original):
+        @functools.wraps(original)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = await original(*args, **kwargs)
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, labels)
+            if on_result:
+                on_result(result)
+            return result
+    else:
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = original(*args, **kwargs)
+            except Exception as e:
+                if on_error:
+                    on_error(e)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, labels)
+            if on_result:
+                on_result(result)
+            return result
+
+    wrapper.__instrumented__ = True
+    setattr(obj, attr, wrapper)
+
+
+class EventLoopLagMonitor:
+    """Measures how late a periodic sleep wakes up, i.e. event-loop blocking"""
+
+    def __init__(self, histogram: Histogram, interval: float = 0.5):
+        self.histogram = histogram
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(0.0, loop.time() - expected)
+            self.max_lag = max(self.max_lag, self.last_lag)
+            self.histogram.observe(self.last_lag)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class ServiceMetrics:
+    """Instruments a ChatService (and its embedding/Banglish services) in place.
+
+    Stage latencies of get_response are recorded by wrapping the methods
+    that implement each stage, so enabling metrics needs no call-site
+    changes. Sizes, ratios and queue depths are read at scrape time.
+    """
+
+    def __init__(self, chat_service, registry: Optional[MetricsRegistry] = None):
+        self.chat_service = chat_service
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.stage_seconds = r.histogram(
+            "stage_seconds", "Latency of each get_response stage", ["stage"])
+        self.upstream_errors = r.counter(
+            "upstream_errors", "Failed upstream (Gemini) calls", ["backend"])
+        self.response_cache = r.counter(
+            "response_cache_lookups", "Answer-reuse lookups by outcome", ["result"])
+        self.loop_lag_seconds = r.histogram(
+            "event_loop_lag_seconds", "Delay of event-loop wakeups past their deadline",
+            buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+        self.loop_lag = EventLoopLagMonitor(self.loop_lag_seconds)
+        self._register_gauges()
+
+    def install(self):
+        chat = self.chat_service
+        embedding = chat.embedding_service
+        stage = self.stage_seconds
+        instrument(chat, "get_response", stage, ("total",))
+        instrument(chat.banglish_service, "correct_text", stage, ("banglish_correction",))
+        instrument(embedding, "create_embedding", stage, ("embedding",))
+        instrument(embedding, "find_similar_conversations", stage, ("similarity_search",))
+        instrument(embedding, "find_cached_response", stage, ("response_cache_lookup",),
+                   on_result=lambda hit: self.response_cache.inc(("hit" if hit else "miss",)))
+        instrument(chat, "_get_gemini_response", stage, ("llm",))
+        instrument(chat, "_stream_gemini_response", stage, ("llm_stream",))
+        instrument(embedding, "cache_conversation", stage, ("persistence",))
+        instrument(embedding, "_compact_store", stage, ("compaction",))
+
+        instrument(embedding.embedding_backend, "embed_batch", stage, ("upstream_embedding",),
+                   on_error=lambda e: self.upstream_errors.inc(("embedding",)))
+        instrument(chat.chat_backend, "generate", stage, ("upstream_chat",),
+                   on_error=lambda e: self.upstream_errors.inc(("chat",)))
+        instrument(chat.chat_backend, "stream", stage, ("upstream_chat_stream",),
+                   on_error=lambda e: self.upstream_errors.inc(("chat",)))
+        logger.info("Metrics instrumentation installed")
+        return self
+
+    def _register_gauges(self):
+        r = self.registry
+        chat = self.chat_service
+        embedding = chat.embedding_service
+
+        def response_cache_ratio():
+            hits = self.response_cache.value(("hit",))
+            lookups = hits + self.response_cache.value(("miss",))
+            return hits / lookups if lookups else 0.0
+
+        def single_flight_ratio():
+            return chat.single_flight.stats()["coalesced_ratio"]
+
+        r.gauge("cache_hit_ratio", "Hit ratio of each cache", lambda: {
+            ("embedding_memo",): embedding.embedding_cache.stats()["hit_ratio"],
+            ("banglish_memo",): chat.banglish_service.token_memo.stats()["hit_ratio"],
+            ("response_cache",): response_cache_ratio(),
+            ("single_flight",): single_flight_ratio()
+        }, ["cache"])
+        r.gauge("store_entries", "Entries held by each store", lambda: {
+            ("conversations",): len(embedding.cache_storage),
+            ("conversation_index",): len(embedding.vector_index),
+            ("query_index",): len(embedding.query_index),
+            ("embedding_memo",): embedding.embedding_cache.stats()["entries"],
+            ("banglish_memo",): len(chat.banglish_service.token_memo),
+            ("chat_sessions",): len(chat.sessions)
+        }, ["store"])
+        r.gauge("store_bytes", "Bytes used by each store", lambda: {
+            ("embedding_store_disk",): embedding.store.disk_usage(),
+            ("conversation_index",): embedding.vector_index.nbytes,
+            ("query_index",): embedding.query_index.nbytes,
+            ("chat_sessions",): chat.sessions.total_bytes
+        }, ["store"])
+        r.gauge("upstream_in_flight", "Admitted upstream calls in flight",
+                lambda: chat.limiter.in_flight)
+        r.gauge("upstream_concurrency_limit", "Current adaptive concurrency limit",
+                lambda: int(chat.limiter.limit))
+        r.gauge("upstream_queue_depth", "Calls waiting for admission",
+                lambda: chat.limiter.stats()["waiting"])
+        r.gauge("upstream_rejected", "Calls rejected by admission control",
+                lambda: chat.limiter.rejected, cumulative=True)
+        r.gauge("embedding_timeouts", "Embeddings that missed their budget",
+                lambda: embedding.embedding_timeouts, cumulative=True)
+        r.gauge("embedding_hedges", "Hedged embedding requests sent",
+                lambda: embedding.hedges_sent, cumulative=True)
+        r.gauge("write_back_pending", "Queued post-response cache writes",
+                lambda: chat.write_back.stats()["pending"])
+        r.gauge("event_loop_lag_last_seconds", "Most recent event-loop lag sample",
+                lambda: self.loop_lag.last_lag)
+
+    def render(self) -> str:
+        return self.registry.render()
@@ -0,0 +1,160 @@
+import asyncio
+import linecache
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Allocation traces are attributed to the stores when one of their frames is in these files
+STORE_MODULES = ("embedding_service.py", "embedding_store.py", "vector_index.py",
+                 "embedding_cache.py", "session_manager.py")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _thread_stack(frame, max_depth: int) -> List[str]:
+    """Labels from outermost to innermost frame"""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _task_stack(task: asyncio.Task, max_depth: int) -> List[str]:
+    """Follow the task's await chain from its top-level coroutine down"""
+    labels = []
+    awaitable = task.get_coro()
+    while awaitable is not None and len(labels) < max_depth:
+        frame = (getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+                 or getattr(awaitable, "ag_frame", None))
+        if frame is not None:
+            labels.append(_frame_label(frame))
+        awaitable = (getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+                     or getattr(awaitable, "ag_await", None))
+    return labels
+
+
+class SamplingProfiler:
+    """Samples thread stacks and pending-task await chains into collapsed stacks (flamegraph input)"""
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = max(interval, 0.001)
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self.thread_samples = 0
+        self.task_samples = 0
+        self._stop = threading.Event()
+
+    def _sample_threads(self):
+        me = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.is_set():
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack = _thread_stack(frame, self.max_depth)
+                self.samples[";".join([f"thread:{names.get(ident, ident)}"] + stack)] += 1
+            self.thread_samples += 1
+            time.sleep(self.interval)
+
+    def _sample_tasks(self, loop: asyncio.AbstractEventLoop):
+        if self._stop.is_set():
+            return
+        current = asyncio.current_task(loop)
+        for task in asyncio.all_tasks(loop):
+            if task is current or task.done():
+                continue
+            stack = _task_stack(task, self.max_depth)
+            if stack:
+                root = f"task:{task.get_coro().__qualname__}"
+                self.samples[";".join([root] + stack)] += 1
+        self.task_samples += 1
+        loop.call_later(self.interval, self._sample_tasks, loop)
+
+    async def run(self, duration: float, threads: bool = True, tasks: bool = True) -> Counter:
+        """Sample for `duration` seconds and return {collapsed stack: count}"""
+        loop = asyncio.get_running_loop()
+        self._stop.clear()
+        sampler = None
+        if threads:
+            sampler = threading.Thread(target=self._sample_threads, name="profiler", daemon=True)
+            sampler.start()
+        if tasks:
+            loop.call_soon(self._sample_tasks, loop)
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            self._stop.set()
+            if sampler is not None:
+                await asyncio.to_thread(sampler.join)
+        return self.samples
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def store_allocations(snapshot: tracemalloc.Snapshot, top: int = 25,
+                      modules: Sequence[str] = STORE_MODULES) -> Dict:
+    """Live allocations whose traceback passes through the store modules"""
+    filters = [tracemalloc.Filter(True, f"*{name}", all_frames=True) for name in modules]
+    stats = snapshot.filter_traces(filters).statistics("traceback")
+    report = []
+    for stat in stats[:top]:
+        frames = [f"{os.path.basename(frame.filename)}:{frame.lineno} "
+                  f"{linecache.getline(frame.filename, frame.lineno).strip()}"
+                  for frame in stat.traceback]
+        report.append({"size_bytes": stat.size, "blocks": stat.count, "traceback": frames})
+    return {
+        "total_bytes": sum(stat.size for stat in stats),
+        "total_blocks": sum(stat.count for stat in stats),
+        "top": report
+    }
+
+
+class ProfilerService:
+    """Runs one profile at a time, optionally tracing allocations meanwhile"""
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self._lock.locked()
+
+    async def profile(self, duration: float, interval: float = 0.005, threads: bool = True,
+                      tasks: bool = True, trace_allocations: bool = False,
+                      top: int = 25) -> Dict:
+        async with self._lock:
+            # Traces from here on; PYTHONTRACEMALLOC=25 covers everything since startup
+            started_tracing = trace_allocations and not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(25)
+            try:
+                profiler = SamplingProfiler(interval=interval)
+                start = time.perf_counter()
+                await profiler.run(duration, threads=threads, tasks=tasks)
+                result = {
+                    "duration": time.perf_counter() - start,
+                    "thread_samples": profiler.thread_samples,
+                    "task_samples": profiler.task_samples,
+                    "collapsed": profiler.collapsed()
+                }
+                if trace_allocations:
+                    result["allocations"] = store_allocations(tracemalloc.take_snapshot(), top)
+                return result
+            finally:
+                if started_tracing:
+                    tracemalloc.stop()
@@ -0,0 +1,107 @@
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSessionState:
+    """Sliding window of one conversation's turns in Gemini history format"""
+
+    def __init__(self, max_messages: int):
+        self.messages: Deque[dict] = deque(maxlen=max_messages)
+        self.last_used = time.monotonic()
+        self.nbytes = 0
+
+    def add(self, role: str, text: str):
+        if len(self.messages) == self.messages.maxlen:
+            self.nbytes -= self._size(self.messages[0])
+        message = {"role": role, "parts": [text]}
+        self.messages.append(message)
+        self.nbytes += self._size(message)
+
+    @staticmethod
+    def _size(message: dict) -> int:
+        return sum(len(part.encode("utf-8")) for part in message["parts"])
+
+
+class SessionManager:
+    """Per-conversation chat histories in a memory-bounded LRU.
+
+    Each session keeps at most `max_turns` user/model exchanges. Sessions
+    idle for longer than `idle_ttl` seconds are dropped, and the least
+    recently used sessions are evicted whenever the session count or the
+    total history size exceeds its bound.
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_turns: int = 10,
+                 max_bytes: int = 32 * 1024 * 1024, idle_ttl: float = 1800):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, ChatSessionState]" = OrderedDict()
+        self.total_bytes = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def history(self, session_id: Optional[str]) -> List[dict]:
+        """Copy of the session's history window (empty for unknown sessions)"""
+        self.evict_idle()
+        session = self._sessions.get(session_id) if session_id else None
+        if session is None:
+            return []
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return list(session.messages)
+
+    def record_turn(self, session_id: str, user_text: str, model_text: str):
+        """Append one exchange to the session, creating it if needed"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = ChatSessionState(2 * self.max_turns)
+        before = session.nbytes
+        session.add("user", user_text)
+        session.add("model", model_text)
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        self.total_bytes += session.nbytes - before
+        self._enforce_bounds()
+
+    def _drop(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        self.total_bytes -= session.nbytes
+
+    def evict_idle(self):
+        """Drop sessions idle past idle_ttl (oldest are at the front of the LRU)"""
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used > cutoff:
+                break
+            self._drop(session_id)
+            self.evicted_idle += 1
+
+    def _enforce_bounds(self):
+        while self._sessions and (len(self._sessions) > self.max_sessions
+                                  or self.total_bytes > self.max_bytes):
+            self._drop(next(iter(self._sessions)))
+            self.evicted_lru += 1
+
+    def stats(self) -> dict:
+        return {
+            "live_sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "history_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "max_turns": self.max_turns,
+            "evicted_idle": self.evicted_idle,
+            "evicted_lru": self.evicted_lru
+        }
@@ -0,0 +1,68 @@
+from collections import defaultdict
+from typing import Dict, Iterable, Set
+
+
+class DeletionIndex:
+    """SymSpell-style candidate index for fuzzy word lookup.
+
+    Every dictionary word is filed under each string reachable by deleting up
+    to `max_distance` characters from its first `prefix_length` characters.
+    Any word within that edit distance of a query shares at least one such
+    key with it, so a lookup only generates the query's own deletions and
+    never scans the dictionary. Candidates are a superset to be re-ranked by
+    the caller; they are not filtered by exact distance.
+    """
+
+    def __init__(self, words: Iterable[str] = (), max_distance: int = 2, prefix_length: int = 7):
+        self.max_distance = max_distance
+        self.prefix_length = max(prefix_length, max_distance + 1)
+        self._deletes: Dict[str, Set[str]] = defaultdict(set)
+        self._words: Set[str] = set()
+        for word in words:
+            self.add(word)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._words
+
+    def _variants(self, word: str) -> Set[str]:
+        """The word's prefix and everything reachable from it by deletions"""
+        variants = {word[:self.prefix_length]}
+        frontier = variants
+        for _ in range(self.max_distance):
+            frontier = {
+                variant[:i] + variant[i + 1:]
+                for variant in frontier if len(variant) > 1
+                for i in range(len(variant))
+            } - variants
+            variants |= frontier
+        return variants
+
+    def add(self, word: str):
+        if word in self._words:
+            return
+        self._words.add(word)
+        for variant in self._variants(word):
+            self._deletes[variant].add(word)
+
+    def remove(self, word: str):
+        if word not in self._words:
+            return
+        self._words.discard(word)
+        for variant in self._variants(word):
+            bucket = self._deletes.get(variant)
+            if bucket is not None:
+                bucket.discard(word)
+                if not bucket:
+                    del self._deletes[variant]
+
+    def candidates(self, word: str) -> Set[str]:
+        """Dictionary words that may lie within max_distance edits of `word`"""
+        found: Set[str] = set()
+        for variant in self._variants(word):
+            bucket = self._deletes.get(variant)
+            if bucket:
+                found |= bucket
+        return found
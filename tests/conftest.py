@@ -0,0 +1,68 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# The service modules live at the repository root
+sys.path.insert(0, str(REPO_ROOT))
+
+
+@pytest.fixture(scope="module")
+def app_client(tmp_path_factory):
+    """The real app on fake backends.
+
+    main.py resolves static/, templates/ and data/ from the cwd, so it runs
+    from a scratch directory that links the first two.
+    """
+    from fastapi.testclient import TestClient
+
+    workdir = tmp_path_factory.mktemp("app")
+    for name in ("static", "templates"):
+        (workdir / name).symlink_to(REPO_ROOT / name)
+    previous_cwd = os.getcwd()
+    env = {
+        "LLM_BACKEND": "fake",
+        "DATA_DIR": str(workdir / "data"),
+        "FAKE_CHAT_LATENCY": "constant:0",
+        "FAKE_EMBEDDING_LATENCY": "constant:0",
+    }
+    saved = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    os.chdir(workdir)
+    try:
+        sys.modules.pop("main", None)
+        import main
+        yield main, TestClient(main.app)
+    finally:
+        os.chdir(previous_cwd)
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+@pytest.fixture
+def embedding_service(tmp_path, monkeypatch):
+    """An EmbeddingService on the fake backend, storing under tmp_path"""
+    monkeypatch.setenv("LLM_BACKEND", "fake")
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("FAKE_EMBEDDING_LATENCY", "constant:0")
+    from embedding_service import EmbeddingService
+    return EmbeddingService()
+
+
+@pytest.fixture
+def chat_service(tmp_path, monkeypatch):
+    """A ChatService on fake backends, run from tmp_path"""
+    # The Banglish dictionary lives under data/ in the cwd
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LLM_BACKEND", "fake")
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("FAKE_CHAT_LATENCY", "constant:0")
+    monkeypatch.setenv("FAKE_EMBEDDING_LATENCY", "constant:0")
+    from chat_service import ChatService
+    return ChatService()
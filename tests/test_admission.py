@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+import admission
+from admission import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, AdaptiveLimiter, AdmissionRejected
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the limiter's decrease window"""
+    now = [1000.0]
+    monkeypatch.setattr(admission.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_fast_calls_raise_the_limit_additively():
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=6, latency_target=1.0)
+    for _ in range(4):
+        limiter.in_flight += 1
+        limiter.release(0.01)
+    # +1/limit per call: about one step per limit's worth of calls
+    assert 4.9 < limiter.limit < 5.0
+    for _ in range(100):
+        limiter.in_flight += 1
+        limiter.release(0.01)
+    assert limiter.limit == 6
+
+
+def test_errors_and_slow_calls_cut_the_limit_once_per_window(clock):
+    limiter = AdaptiveLimiter(initial_limit=10, min_limit=2, latency_target=1.0, backoff=0.5)
+    limiter.in_flight = 3
+    limiter.release(0.1, failed=True)
+    assert limiter.limit == 5
+    # Within the same latency_target window a second signal does not cut again
+    limiter.release(2.0)
+    assert limiter.limit == 5
+    clock[0] += 1.0
+    limiter.release(2.0)
+    assert limiter.limit == 2.5
+    assert (limiter.errors, limiter.slow_calls) == (1, 2)
+    clock[0] += 1.0
+    limiter.in_flight = 1
+    limiter.release(0.1, failed=True)
+    assert limiter.limit == 2  # never below min_limit
+
+
+def test_cancelled_calls_do_not_adapt_the_limit():
+    limiter = AdaptiveLimiter(initial_limit=3)
+    limiter.in_flight = 1
+    limiter.release(None)
+    assert limiter.limit == 3 and limiter.in_flight == 0
+
+
+def test_waiters_are_admitted_by_priority_and_overflow_is_rejected():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=1, max_limit=1, max_queue=2, latency_target=1.0)
+        await limiter.acquire()
+        order = []
+
+        async def wait(name, priority):
+            await limiter.acquire(priority)
+            order.append(name)
+
+        background = asyncio.create_task(wait("background", PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(wait("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        assert limiter.saturated
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire()
+        assert rejected.value.retry_after >= 1
+        assert limiter.rejected == 1
+
+        limiter.release(0.01)
+        await interactive
+        assert order == ["interactive"] and not background.done()
+        limiter.release(0.01)
+        await background
+        assert order == ["interactive", "background"]
+        assert limiter.stats()["waiting"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=1, max_queue=4)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert limiter.stats()["waiting"] == 0
+        limiter.release(0.01)
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_slot_reports_failures_and_releases():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=4, latency_target=1.0, backoff=0.5)
+        with pytest.raises(RuntimeError):
+            async with limiter.slot():
+                raise RuntimeError("upstream 500")
+        assert limiter.in_flight == 0
+        assert limiter.errors == 1 and limiter.limit == 2
+
+    asyncio.run(scenario())
+
+
+def test_saturated_limiter_answers_429_with_retry_after(app_client, monkeypatch):
+    main, client = app_client
+    limiter = main.chat_service.limiter
+    monkeypatch.setattr(limiter, "max_queue", 0)
+
+    response = client.post("/chat/stream", data={"message": "hello"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.json()["status"] == "error"
+
+    # Every slot busy and no room to queue: the embedding call is shed
+    monkeypatch.setattr(limiter, "in_flight", int(limiter.limit))
+    response = client.post("/chat", data={"message": "a question nobody asked yet"})
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
@@ -0,0 +1,50 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from backends import FakeChatBackend, FakeEmbeddingBackend, LatencyDistribution
+
+
+def test_latency_specs_parse_to_seconds():
+    assert LatencyDistribution.parse("constant:50").sample() == 0.05
+    assert LatencyDistribution.parse(0.2).sample() == pytest.approx(0.2)
+    uniform = LatencyDistribution.parse("uniform:20:80")
+    assert all(0.02 <= uniform.sample() <= 0.08 for _ in range(100))
+    assert repr(uniform) == "uniform:20:80"
+    assert not LatencyDistribution.parse("constant:0")
+    with pytest.raises(ValueError):
+        LatencyDistribution.parse("gamma:1:2")
+
+
+def test_lognormal_latency_has_the_given_median_and_is_reproducible():
+    samples = [LatencyDistribution.parse("lognormal:100:0.5", seed=1).sample() for _ in range(3)]
+    assert samples[0] == samples[1] == samples[2]
+    dist = LatencyDistribution.parse("lognormal:100:0.5")
+    values = np.array([dist.sample() for _ in range(4000)])
+    assert np.median(values) == pytest.approx(0.1, rel=0.1)
+    assert np.percentile(values, 99) > 2.5 * np.median(values)  # the long right tail
+
+
+def test_fake_embeddings_are_deterministic_and_word_sensitive():
+    backend = FakeEmbeddingBackend(dim=64, latency=0)
+    vectors = asyncio.run(backend.embed_batch(
+        ["how are you", "  How ARE you", "how are you today", "weather in dhaka"], "RETRIEVAL_QUERY"))
+    a, same, near, far = (np.asarray(vec) for vec in vectors)
+    assert np.allclose(a, same) and np.linalg.norm(a) == pytest.approx(1.0, abs=1e-6)
+    assert a @ near > 0.7 > a @ far
+    assert backend.calls == 1 and backend.batch_sizes == [4]
+
+
+def test_fake_chat_streams_the_same_reply_it_generates():
+    backend = FakeChatBackend(latency=0, chunks=4)
+
+    async def scenario():
+        reply = await backend.generate("hello", [])
+        chunks = [chunk async for chunk in backend.stream("hello", [])]
+        return reply, chunks
+
+    reply, chunks = asyncio.run(scenario())
+    assert "".join(chunks) == reply and len(chunks) == 4
+    assert reply == FakeChatBackend(latency=0).reply_for("hello") != backend.reply_for("bye")
+    assert backend.calls == 2
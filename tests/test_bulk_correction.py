@@ -0,0 +1,77 @@
+import json
+import random
+
+import pytest
+
+from banglish_service import CORRECTION_THRESHOLD, SUGGESTION_THRESHOLD, BanglishService
+
+SYLLABLES = ["ba", "bha", "cha", "da", "ga", "ha", "ja", "ka", "kho", "la", "ma", "na",
+             "pa", "ra", "sha", "ta", "tho", "bo", "ko", "no", "i", "u", "e"]
+
+
+@pytest.fixture(scope="module")
+def banglish(tmp_path_factory):
+    rng = random.Random(0)
+    words = sorted({"".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+                    for _ in range(1500)})
+    mapping = {word[:-1] + "x": word for word in words}
+    path = tmp_path_factory.mktemp("banglish") / "banglish_mapping.json"
+    path.write_text(json.dumps(mapping), encoding="utf-8")
+    service = BanglishService(path)
+    tokens = [word[:i] + word[i + 1:] for word in rng.sample(words, 150)
+              for i in (rng.randrange(len(word)),)]
+    # Typos of one word share most candidates, so they are scored together with cdist
+    for word in rng.sample(words, 40):
+        tokens += [word + "o", word[:-1] + "a" + word[-1], word + word[-1]]
+    return service, words, tokens
+
+
+@pytest.mark.parametrize("cdist_cells", [1, 2000, 262144])
+@pytest.mark.parametrize("threshold,limit", [(CORRECTION_THRESHOLD, 1), (SUGGESTION_THRESHOLD, 3)])
+def test_batched_matches_equal_one_token_at_a_time(banglish, monkeypatch, cdist_cells, threshold, limit):
+    service, _, tokens = banglish
+    monkeypatch.setattr(service, "cdist_cells", cdist_cells)
+    batched = service._match_tokens(tokens, threshold, limit)
+    one_by_one = {}
+    for token in tokens:
+        one_by_one.update(service._match_tokens([token], threshold, limit))
+    assert batched.keys() == one_by_one.keys() and batched
+    for token in batched:
+        assert [word for word, _ in batched[token]] == [word for word, _ in one_by_one[token]]
+        assert [score for _, score in batched[token]] == pytest.approx(
+            [score for _, score in one_by_one[token]])
+
+
+@pytest.mark.parametrize("cdist_cells", [50, 5000])
+def test_chunks_stay_within_the_cell_budget(banglish, monkeypatch, cdist_cells):
+    service, _, tokens = banglish
+    monkeypatch.setattr(service, "cdist_cells", cdist_cells)
+    distinct = list(dict.fromkeys(tokens))
+    chunks = list(service._candidate_chunks(distinct, service.correction_index))
+    assert [token for chunk, _, _ in chunks for token in chunk] == [
+        token for token in distinct if service.correction_index.candidates(token)]
+    assert any(len(chunk) > 1 for chunk, _, _ in chunks)
+    for chunk, choices, columns in chunks:
+        if len(chunk) > 1:
+            assert len(chunk) * len(choices) <= cdist_cells
+            assert choices == sorted(choices)
+            for token, cols in zip(chunk, columns):
+                assert {choices[col] for col in cols} == service.correction_index.candidates(token)
+
+
+def test_bulk_correction_matches_per_text_correction(banglish):
+    service, words, tokens = banglish
+    texts = [" ".join(tokens[i:i + 5]) for i in range(0, len(tokens), 5)]
+    texts += [words[0][:-1] + "x", "", words[1]]
+    assert service.correct_texts(texts) == [service.correct_text(text) for text in texts]
+    assert service.correct_text(words[0][:-1] + "x") == words[0]
+
+
+def test_bulk_endpoint_caps_the_number_of_texts(app_client, monkeypatch):
+    main, client = app_client
+    monkeypatch.setattr(main, "MAX_BANGLISH_BULK_TEXTS", 2)
+    response = client.post("/check-banglish/bulk", json={"texts": ["ame", "valo", "kemon"]})
+    assert response.status_code == 413
+    response = client.post("/check-banglish/bulk", json={"texts": ["ame valo", "ami"]})
+    assert response.status_code == 200
+    assert len(response.json()["corrections"]) == 2
@@ -0,0 +1,27 @@
+import asyncio
+import time
+
+import numpy as np
+
+
+def test_an_expired_top_hit_falls_through_to_the_next_live_one(chat_service):
+    chat_service.context_threshold = 0.5
+    embeddings = chat_service.embedding_service
+    query = np.ones(16)
+    near = query.copy()
+    near[0] = 0.5
+
+    async def scenario():
+        best = await embeddings.cache_conversation("User: best\nBot: one", query.tolist())
+        runner_up = await embeddings.cache_conversation("User: runner up\nBot: two", near.tolist())
+        # The best match expires after the index was built, before any sweep
+        embeddings.expiry.schedule(best, time.time() - 1)
+
+        prompt, similar = await chat_service._build_prompt_message("question", query.tolist())
+        assert [cache_id for cache_id, _ in similar] == [runner_up]
+        assert "runner up" in prompt and "question" in prompt
+
+        embeddings.expiry.schedule(runner_up, time.time() - 1)
+        assert await chat_service._build_prompt_message("question", query.tolist()) == ("question", [])
+
+    asyncio.run(scenario())
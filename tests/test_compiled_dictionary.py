@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+
+import pytest
+
+from banglish_service import BanglishService
+from compiled_dictionary import CompiledDictionary, compile_dictionary
+
+MAPPING = {"ame": "ami", "valo": "bhalo", "balo": "bhalo", "ভাল": "ভালো"}
+
+
+@pytest.fixture
+def mapping_file(tmp_path, monkeypatch):
+    monkeypatch.setenv("BANGLISH_RELOAD_CHECK_INTERVAL", "0")
+    path = tmp_path / "banglish_mapping.json"
+    path.write_text(json.dumps(MAPPING, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def edit_mapping(path, **changes):
+    mapping = json.loads(path.read_text(encoding="utf-8"))
+    mapping.update(changes)
+    path.write_text(json.dumps(mapping, ensure_ascii=False), encoding="utf-8")
+
+
+def test_compiled_dictionary_round_trip(tmp_path):
+    path = tmp_path / "dict.bin"
+    compile_dictionary(MAPPING, path, source_signature=(123, 45))
+    compiled = CompiledDictionary(path)
+    assert dict(compiled) == MAPPING
+    assert len(compiled) == 4 and "valo" in compiled and "missing" not in compiled
+    assert compiled["ভাল"] == "ভালো"
+    with pytest.raises(KeyError):
+        compiled["missing"]
+    assert compiled.words() == sorted(set(MAPPING.values()))
+    assert compiled.source_signature == (123, 45)
+    assert not list(tmp_path.glob("*.tmp"))
+
+    compile_dictionary({}, path)
+    empty = CompiledDictionary(path)
+    assert len(empty) == 0 and "ame" not in empty and empty.words() == []
+
+
+@pytest.mark.parametrize("damage", ["truncate", "magic", "empty"])
+def test_corrupt_file_is_rejected(tmp_path, damage):
+    path = tmp_path / "dict.bin"
+    compile_dictionary(MAPPING, path)
+    data = path.read_bytes()
+    path.write_bytes({"truncate": data[:-3], "magic": b"NOTADICT" + data[8:], "empty": b""}[damage])
+    with pytest.raises(ValueError):
+        CompiledDictionary(path)
+
+
+def test_service_compiles_once_and_rebuilds_stale_or_corrupt_files(mapping_file):
+    service = BanglishService(mapping_file)
+    compiled_file = service.compiled_file
+    assert compiled_file.exists()
+    signature = service.spelling_corrections.compiled.file_signature
+
+    # Unchanged JSON: the next worker maps the same file
+    again = BanglishService(mapping_file)
+    assert again.spelling_corrections.compiled.file_signature == signature
+
+    # Stale: the JSON changed while nothing was running
+    edit_mapping(mapping_file, foo="bhalo")
+    assert BanglishService(mapping_file).correct_text("foo") == "bhalo"
+
+    # Corrupt: rebuilt from the JSON instead of failing
+    compiled_file.write_bytes(compiled_file.read_bytes()[:20])
+    rebuilt = BanglishService(mapping_file)
+    assert rebuilt.correct_text("ame valo foo") == "ami bhalo bhalo"
+
+
+def test_running_service_hot_reloads_json_changes(mapping_file):
+    service = BanglishService(mapping_file)
+    assert service.correct_text("zzz") is None
+    edit_mapping(mapping_file, zzz="ami")
+    # The lookup that notices the change starts the rebuild without waiting for it
+    service.correct_text("zzz")
+    service.wait_for_reload()
+    assert service.correct_text("zzz") == "ami"
+    assert service.reloads == 1
+
+
+def test_lookups_do_not_wait_for_a_reload(mapping_file, monkeypatch):
+    service = BanglishService(mapping_file)
+    load = service._load_dictionary
+
+    def slow_load():
+        time.sleep(0.5)
+        return load()
+
+    monkeypatch.setattr(service, "_load_dictionary", slow_load)
+    edit_mapping(mapping_file, zzz="ami")
+    started = time.monotonic()
+    assert service.correct_text("ame zzz") == "ami zzz"  # still the old snapshot
+    assert service.correct_text("ame") == "ami"
+    assert time.monotonic() - started < 0.25
+    service.wait_for_reload()
+    assert service.correct_text("zzz") == "ami"
+
+
+def test_concurrent_lookups_reload_once(mapping_file):
+    service = BanglishService(mapping_file)
+    edit_mapping(mapping_file, foo="bhalo")
+    barrier = threading.Barrier(8)
+
+    def lookup():
+        barrier.wait()
+        service.correct_text("foo")
+
+    threads = [threading.Thread(target=lookup) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    service.wait_for_reload()
+    assert service.reloads == 1
+
+
+def test_learned_corrections_apply_now_and_replay_elsewhere(mapping_file):
+    service = BanglishService(mapping_file)
+    other = BanglishService(mapping_file)
+    assert service.correct_text("brsti") is None  # memoized as uncorrected
+
+    service.add_correction("Brsti", "brishti")
+    assert service.correct_text("brsti") == "brishti"
+    # The new word is in the fuzzy index straight away
+    assert service.correct_text("brishtii") == "brishti"
+    assert service.dictionary_stats()["learned"] == 1
+
+    # Another worker picks it up from the log
+    assert other.correct_text("brsti") == "brishti"
+    # and a fresh one replays it on start, also after a JSON reload
+    edit_mapping(mapping_file, foo="bhalo")
+    fresh = BanglishService(mapping_file)
+    assert fresh.correct_text("brsti foo") == "brishti bhalo"
+    service.correct_text("foo")
+    service.wait_for_reload()
+    assert service.correct_text("brsti foo") == "brishti bhalo"
+
+
+def test_learned_log_replay_skips_torn_and_invalid_lines(mapping_file):
+    service = BanglishService(mapping_file)
+    with open(service.learned_file, "a", encoding="utf-8") as f:
+        f.write('{"misspelling": "qq", "correction": "ami"}\n')
+        f.write('not json\n')
+        f.write('{"misspelling": "ww", "correction": "bhalo"}\n')
+        f.write('{"misspelling": "ee", "corr')  # still being appended
+    replayed = BanglishService(mapping_file)
+    assert replayed.correct_text("qq ww ee") == "ami bhalo ee"
+
+    with open(service.learned_file, "a", encoding="utf-8") as f:
+        f.write('ection": "ki"}\n')
+    assert replayed.correct_text("ee") == "ki"
+
+
+@pytest.mark.parametrize("misspelling, correction", [("two words", "ami"), ("ami", "ami"), ("", "ami")])
+def test_add_correction_rejects_non_word_pairs(mapping_file, misspelling, correction):
+    service = BanglishService(mapping_file)
+    with pytest.raises(ValueError):
+        service.add_correction(misspelling, correction)
+    assert not service.learned_file.exists()
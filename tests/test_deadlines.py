@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from backends import LatencyDistribution
+from deadlines import Deadline, DeadlineExceeded, LatencyTracker, hedged
+
+
+def test_stage_timeouts_are_capped_by_the_remaining_budget():
+    deadline = Deadline(0.5)
+    assert deadline.timeout(0.1) == 0.1
+    assert 0.4 < deadline.timeout(5.0) <= 0.5
+    assert not deadline.expired
+    assert Deadline(0).expired and Deadline(0).timeout(1.0) == 0.0
+
+
+def test_percentiles_need_enough_samples():
+    tracker = LatencyTracker(window=100, min_samples=10)
+    for i in range(9):
+        tracker.record(i / 100)
+    assert tracker.percentile(95) is None
+    tracker.record(1.0)
+    assert tracker.percentile(50) == pytest.approx(0.045)
+    assert tracker.percentile(100) == 1.0
+
+
+def run_hedged(first_delay, hedge_delay, delay, fail_first=False):
+    calls = []
+
+    async def attempt(name, seconds, fail=False):
+        calls.append(name)
+        await asyncio.sleep(seconds)
+        if fail:
+            raise RuntimeError(name)
+        return name
+
+    async def scenario():
+        result = await hedged(lambda: attempt("first", first_delay, fail_first), delay,
+                              hedge_fn=lambda: attempt("hedge", hedge_delay))
+        # The loser is cancelled, not left running
+        await asyncio.sleep(0)
+        assert len(asyncio.all_tasks()) == 1
+        return result
+
+    return asyncio.run(scenario()), calls
+
+
+def test_a_fast_call_never_sends_the_hedge():
+    assert run_hedged(0.0, 0.0, delay=0.2) == ("first", ["first"])
+
+
+def test_a_slow_call_is_overtaken_by_its_hedge():
+    assert run_hedged(1.0, 0.0, delay=0.01) == ("hedge", ["first", "hedge"])
+
+
+def test_a_failed_first_attempt_falls_back_to_the_hedge():
+    assert run_hedged(0.05, 0.1, delay=0.01, fail_first=True) == ("hedge", ["first", "hedge"])
+
+
+def test_without_a_delay_there_is_no_hedging():
+    assert run_hedged(0.01, 0.0, delay=None) == ("first", ["first"])
+
+
+def test_slow_embeddings_time_out_and_send_hedges(embedding_service):
+    service = embedding_service
+    service.embedding_backend.latency = LatencyDistribution.parse("constant:300")
+    service.hedge_default_delay = 0.02
+
+    async def scenario():
+        assert await service.create_embedding("slow text", timeout=0.1) is None
+        stats = service.hedge_stats()
+        assert stats["timeouts"] == 1 and stats["hedges_sent"] == 1
+        # The timed-out call still counts towards the latency percentiles
+        assert stats["latency_samples"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_an_answer_past_the_request_budget_raises(chat_service):
+    chat_service.chat_backend.latency = LatencyDistribution.parse("constant:500")
+
+    async def scenario():
+        with pytest.raises(DeadlineExceeded):
+            await chat_service.get_response("hello", deadline=Deadline(0.1), background_cache=False)
+
+    asyncio.run(scenario())
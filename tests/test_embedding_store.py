@@ -0,0 +1,145 @@
+import json
+
+import numpy as np
+import pytest
+
+from embedding_store import EmbeddingStore
+
+DIM = 4
+
+
+def vector(seed: float) -> np.ndarray:
+    return np.arange(DIM, dtype=np.float32) + seed
+
+
+def reopen(store: EmbeddingStore):
+    store.close()
+    reopened = EmbeddingStore(store.directory)
+    records, embeddings = reopened.load()
+    return reopened, records, embeddings
+
+
+def test_put_delete_and_hits_survive_reopen(tmp_path):
+    store = EmbeddingStore(tmp_path)
+    store.load()
+    store.put("a", {"text": "A", "hit_count": 0}, vector(1), query_embedding=vector(10))
+    store.put("b", {"text": "B", "hit_count": 0}, vector(2))
+    store.put("c", {"text": "C", "hit_count": 0}, vector(3))
+    store.record_hit("a", 5)
+    store.delete(["b"])
+
+    store, records, embeddings = reopen(store)
+    assert set(records) == {"a", "c"}
+    assert records["a"]["hit_count"] == 5
+    np.testing.assert_array_equal(embeddings["c"], vector(3))
+    np.testing.assert_array_equal(store.query_embeddings["a"], vector(10))
+    assert "c" not in store.query_embeddings
+    assert store.dead_records == 3  # b's put, the hit and the tombstone
+    store.close()
+
+
+def test_torn_tail_is_truncated_and_appends_continue(tmp_path):
+    store = EmbeddingStore(tmp_path)
+    store.load()
+    store.put("a", {"text": "A"}, vector(1))
+    store.put("b", {"text": "B"}, vector(2))
+    store.close()
+    # A crash mid-write: half an embedding row and an unterminated record
+    with open(store.vector_file, 'ab') as f:
+        f.write(vector(3).tobytes()[:6])
+    with open(store.log_file, 'ab') as f:
+        f.write(b'{"op":"put","id":"c","row":2,"da')
+    log_size = store.log_file.stat().st_size
+
+    store, records, embeddings = reopen(store)
+    assert set(records) == {"a", "b"}
+    assert store.vector_file.stat().st_size == 2 * DIM * 4
+    assert store.log_file.stat().st_size < log_size
+    assert store.log_file.read_bytes().endswith(b"\n")
+
+    store.put("c", {"text": "C"}, vector(3))
+    store, records, embeddings = reopen(store)
+    assert set(records) == {"a", "b", "c"}
+    np.testing.assert_array_equal(embeddings["c"], vector(3))
+    store.close()
+
+
+def test_record_referencing_a_missing_row_ends_the_log(tmp_path):
+    store = EmbeddingStore(tmp_path)
+    store.load()
+    store.put("a", {"text": "A"}, vector(1))
+    store.put("b", {"text": "B"}, vector(2))
+    store.close()
+    # The row of b is lost (e.g. never reached the disk) but its record did
+    with open(store.vector_file, 'r+b') as f:
+        f.truncate(DIM * 4)
+
+    store, records, _ = reopen(store)
+    assert set(records) == {"a"}
+    assert len(store.log_file.read_bytes().splitlines()) == 1
+    store.close()
+
+
+def test_compaction_writes_the_live_set_as_a_new_generation(tmp_path):
+    store = EmbeddingStore(tmp_path, compact_min_records=2, compact_dead_ratio=0.5)
+    records, _ = store.load()
+    for i in range(4):
+        store.put(f"id{i}", {"text": str(i)}, vector(i), query_embedding=vector(i + 10))
+    store.delete(["id0", "id1"])
+    assert store.needs_compaction()
+    old_files = {store.log_file, store.vector_file}
+
+    live = {f"id{i}": {"text": str(i)} for i in (2, 3)}
+    records, embeddings = store.compact(live)
+    assert store.generation == 1
+    assert store.dead_records == 0 and not store.needs_compaction()
+    assert not any(path.exists() for path in old_files)
+    assert json.loads(store.manifest_file.read_text())["generation"] == 1
+    np.testing.assert_array_equal(embeddings["id3"], vector(3))
+    np.testing.assert_array_equal(store.query_embeddings["id2"], vector(12))
+
+    store, records, embeddings = reopen(store)
+    assert store.generation == 1
+    assert set(records) == {"id2", "id3"}
+    np.testing.assert_array_equal(embeddings["id2"], vector(2))
+    store.close()
+
+
+def test_failed_compaction_keeps_the_previous_generation(tmp_path, monkeypatch):
+    store = EmbeddingStore(tmp_path)
+    store.load()
+    store.put("a", {"text": "A"}, vector(1))
+    store.put("b", {"text": "B"}, vector(2))
+
+    def fail():
+        raise OSError("disk full")
+
+    # Dies after writing generation 1 but before the manifest points at it
+    monkeypatch.setattr(store, "_write_manifest", fail)
+    with pytest.raises(OSError):
+        store.compact({"a": {"text": "A"}})
+    monkeypatch.undo()
+
+    assert store.generation == 0
+    assert not (tmp_path / "embeddings.1.f32").exists()
+    store, records, embeddings = reopen(store)
+    assert store.generation == 0
+    assert set(records) == {"a", "b"}
+    np.testing.assert_array_equal(embeddings["b"], vector(2))
+    store.close()
+
+
+def test_unreferenced_next_generation_is_removed_on_load(tmp_path):
+    store = EmbeddingStore(tmp_path)
+    store.load()
+    store.put("a", {"text": "A"}, vector(1))
+    store.close()
+    # Leftovers of a compaction that crashed before the manifest switch
+    (tmp_path / "conversations.1.log").write_bytes(b'{"op":"put"')
+    (tmp_path / "embeddings.1.f32").write_bytes(b"\0" * 8)
+
+    store, records, _ = reopen(store)
+    assert store.generation == 0 and set(records) == {"a"}
+    assert not (tmp_path / "conversations.1.log").exists()
+    assert not (tmp_path / "embeddings.1.f32").exists()
+    store.close()
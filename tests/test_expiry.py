@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import numpy as np
+
+from expiry import ExpiryScheduler
+
+
+def test_pops_in_deadline_order_up_to_the_limit():
+    expiry = ExpiryScheduler()
+    for i, expire_at in enumerate([30, 10, 20, 50]):
+        expiry.schedule(f"c{i}", expire_at)
+    assert expiry.next_expiry() == 10
+    assert expiry.pop_expired(now=40, limit=2) == ["c1", "c2"]
+    assert expiry.pop_expired(now=40) == ["c0"]
+    assert expiry.pop_expired(now=40) == []
+    assert len(expiry) == 1 and "c3" in expiry
+
+
+def test_rescheduled_and_discarded_ids_skip_their_stale_entries():
+    expiry = ExpiryScheduler()
+    expiry.schedule("a", 10)
+    expiry.schedule("b", 11)
+    expiry.schedule("a", 100)  # extended
+    expiry.discard("b")
+    assert expiry.next_expiry() == 100
+    assert expiry.pop_expired(now=50) == []
+    assert expiry.is_expired("a", now=100) and not expiry.is_expired("a", now=99)
+    assert not expiry.is_expired("b", now=1000)
+
+
+def test_stale_entries_are_compacted():
+    expiry = ExpiryScheduler()
+    for round_no in range(10):
+        for i in range(20):
+            expiry.schedule(f"c{i}", 1000 + round_no)
+    assert len(expiry) == 20
+    assert len(expiry._heap) <= 2 * len(expiry) + 64
+    assert sorted(expiry.pop_expired(now=2000)) == sorted(f"c{i}" for i in range(20))
+
+
+def test_cleanup_evicts_expired_entries_in_batches(embedding_service):
+    service = embedding_service
+    rng = np.random.default_rng(0)
+
+    async def scenario():
+        ids = [await service.cache_conversation(f"User: q{i}\nBot: a{i}", rng.standard_normal(8).tolist())
+               for i in range(7)]
+        for cache_id in ids[:5]:
+            service.expiry.schedule(cache_id, time.time() - 1)
+        assert await service.evict_expired(batch_size=2) == 2
+        await service.cleanup_expired_caches(batch_size=2)
+        assert set(service.cache_storage) == set(ids[5:])
+        assert len(service.vector_index) == 2 and len(service.timeline) == 2
+        assert service.expiry.next_expiry() > time.time()
+
+    asyncio.run(scenario())
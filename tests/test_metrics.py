@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from metrics import Histogram, MetricsRegistry, ServiceMetrics, instrument
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry(prefix="t_")
+    histogram = registry.histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, ("db",))
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP t_latency_seconds Latency", "# TYPE t_latency_seconds histogram"]
+    assert 't_latency_seconds_bucket{stage="db",le="0.1"} 2' in lines
+    assert 't_latency_seconds_bucket{stage="db",le="1.0"} 3' in lines
+    assert 't_latency_seconds_bucket{stage="db",le="+Inf"} 4' in lines
+    assert 't_latency_seconds_sum{stage="db"} 3.65' in lines
+    assert 't_latency_seconds_count{stage="db"} 4' in lines
+
+
+def test_counters_and_gauges_render_their_current_values():
+    registry = MetricsRegistry(prefix="t_")
+    errors = registry.counter("errors", "Errors", ["backend"])
+    errors.inc(("chat",))
+    errors.inc(("chat",), 2)
+    depth = [3]
+    registry.gauge("queue_depth", "Depth", lambda: depth[0])
+    registry.gauge("sent", "Sent", lambda: 7, cumulative=True)
+    registry.gauge("broken", "Fails to read", lambda: 1 / 0)
+    depth[0] = 5
+    text = registry.render()
+    assert 't_errors_total{backend="chat"} 3' in text
+    assert "t_queue_depth 5" in text
+    assert "# TYPE t_sent_total counter\nt_sent_total 7" in text
+    assert "# TYPE t_broken gauge" in text  # a failing read drops only its samples
+
+
+def test_instrument_times_sync_async_and_streaming_calls():
+    histogram = Histogram("h", "h", ["stage"])
+    errors = []
+
+    class Service:
+        def plain(self):
+            return 1
+
+        async def coro(self, fail=False):
+            if fail:
+                raise RuntimeError("down")
+            return 2
+
+        async def stream(self):
+            yield 3
+            yield 4
+
+    service = Service()
+    for name in ("plain", "coro", "stream"):
+        instrument(service, name, histogram, (name,), on_error=errors.append)
+    instrument(service, "plain", histogram, ("again",))  # already wrapped: no-op
+
+    async def scenario():
+        assert service.plain() == 1
+        assert await service.coro() == 2
+        with pytest.raises(RuntimeError):
+            await service.coro(fail=True)
+        assert [item async for item in service.stream()] == [3, 4]
+
+    asyncio.run(scenario())
+    counts = {labels: sum(series[:-1]) for labels, series in histogram._series.items()}
+    assert counts == {("plain",): 1, ("coro",): 2, ("stream",): 1}
+    assert len(errors) == 1 and str(errors[0]) == "down"
+
+
+def test_service_metrics_cover_each_stage_of_a_request(chat_service):
+    service_metrics = ServiceMetrics(chat_service).install()
+
+    async def scenario():
+        await chat_service.get_response("what is python", background_cache=False)
+        await chat_service.get_response("what is python", background_cache=False)
+        await chat_service.write_back.close()
+
+    asyncio.run(scenario())
+    text = service_metrics.render()
+    for stage in ("total", "embedding", "response_cache_lookup", "similarity_search", "llm",
+                  "upstream_chat", "upstream_embedding", "persistence"):
+        assert f'smarteditor_stage_seconds_count{{stage="{stage}"}}' in text
+    assert 'smarteditor_response_cache_lookups_total{result="hit"} 1' in text
+    assert 'smarteditor_response_cache_lookups_total{result="miss"} 1' in text
+    assert 'smarteditor_cache_hit_ratio{cache="response_cache"} 0.5' in text
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from timeline import CreationTimeline
+
+
+def make_timeline(count):
+    timeline = CreationTimeline()
+    for i in range(count):
+        timeline.add(f"c{i}", 1000.0 + i)
+    return timeline
+
+
+def test_pages_chain_newest_first_without_gaps_or_repeats():
+    timeline = make_timeline(7)
+    seen, cursor = [], None
+    while True:
+        ids, cursor = timeline.page(cursor, limit=3)
+        seen.extend(ids)
+        if cursor is None:
+            break
+    assert seen == [f"c{i}" for i in reversed(range(7))]
+
+
+def test_out_of_order_adds_and_discards_keep_the_order():
+    timeline = make_timeline(4)
+    timeline.add("late", 1001.5)
+    timeline.discard("c2")
+    timeline.add("c0", 1010.0)  # re-added with a newer timestamp
+    assert timeline.page(limit=10) == (["c0", "c3", "late", "c1"], None)
+
+
+def test_no_cursor_when_only_skipped_entries_remain():
+    timeline = make_timeline(5)
+    expired = {"c0", "c1"}
+    ids, cursor = timeline.page(limit=3, skip=expired.__contains__)
+    assert ids == ["c4", "c3", "c2"] and cursor is None
+    # A live entry below the page still yields a cursor
+    ids, cursor = timeline.page(limit=2, skip=expired.__contains__)
+    assert ids == ["c4", "c3"] and cursor == (1003.0, "c3")
+
+
+def test_list_conversations_skips_expired_and_bounds_eviction(embedding_service):
+    service = embedding_service
+    rng = np.random.default_rng(0)
+
+    async def scenario():
+        ids = []
+        for i in range(8):
+            ids.append(await service.cache_conversation(
+                f"User: question {i}\nAssistant: answer {i}", rng.standard_normal(8).tolist()))
+        # Expire the five oldest
+        for cache_id in ids[:5]:
+            service.expiry.schedule(cache_id, time.time() - 1)
+
+        page, cursor = await service.list_conversations(limit=2)
+        assert [c["cache_id"] for c in page] == ids[:-3:-1]
+        assert page[0]["messages"][0]["content"] == "question 7"
+        # Only one page worth of expired entries is evicted per call
+        assert len(service.timeline) == 6
+        page, cursor = await service.list_conversations(limit=2, cursor=cursor)
+        assert [c["cache_id"] for c in page] == [ids[5]] and cursor is None
+        assert len(service.timeline) == 4
+
+        with pytest.raises(ValueError):
+            await service.list_conversations(cursor="not-a-cursor")
+
+    asyncio.run(scenario())
+
+
+def test_bad_cursor_is_a_400_with_detail(app_client):
+    _, client = app_client
+    response = client.get("/all-conversations", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"]
+    response = client.get("/all-conversations", params={"limit": 5})
+    assert response.status_code == 200
+    assert response.json()["status"] == "success"
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+import session_manager
+from session_manager import SessionManager
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for idle expiry"""
+    now = [1000.0]
+    monkeypatch.setattr(session_manager.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_history_keeps_the_last_turns_in_gemini_format():
+    sessions = SessionManager(max_turns=2)
+    for i in range(3):
+        sessions.record_turn("s1", f"q{i}", f"a{i}")
+    assert sessions.history("s1") == [
+        {"role": "user", "parts": ["q1"]}, {"role": "model", "parts": ["a1"]},
+        {"role": "user", "parts": ["q2"]}, {"role": "model", "parts": ["a2"]},
+    ]
+    assert sessions.total_bytes == len("q1a1q2a2")
+    assert sessions.history("unknown") == [] and sessions.history(None) == []
+
+
+def test_least_recently_used_sessions_go_first():
+    sessions = SessionManager(max_sessions=2)
+    sessions.record_turn("a", "q", "a")
+    sessions.record_turn("b", "q", "a")
+    sessions.history("a")  # "b" is now the least recently used
+    sessions.record_turn("c", "q", "a")
+    assert "a" in sessions and "b" not in sessions and "c" in sessions
+    assert sessions.evicted_lru == 1
+
+
+def test_the_byte_bound_evicts_whole_sessions():
+    sessions = SessionManager(max_bytes=100)
+    sessions.record_turn("a", "x" * 45, "y" * 45)
+    sessions.record_turn("b", "x" * 10, "y" * 10)
+    assert "a" not in sessions and "b" in sessions
+    assert sessions.total_bytes == 20
+
+
+def test_idle_sessions_expire(clock):
+    sessions = SessionManager(idle_ttl=60)
+    sessions.record_turn("old", "q", "a")
+    clock[0] += 30
+    sessions.record_turn("recent", "q", "a")
+    clock[0] += 45
+    assert sessions.history("recent")
+    assert "old" not in sessions and sessions.evicted_idle == 1
+
+
+def test_answers_that_depend_on_history_are_neither_reused_nor_shared(chat_service):
+    service = chat_service
+    embeddings = service.embedding_service
+
+    async def scenario():
+        first = await service.get_response("what is python", session_id="s1", background_cache=False)
+        assert not first["response_from_cache"]
+        # Another session without history gets the stored answer back directly
+        other = await service.get_response("what is python", session_id="s2", background_cache=False)
+        assert other["response_from_cache"] and other["cache_name"] == first["cache_name"]
+
+        # s1 has history now, so the same question goes upstream again...
+        calls = service.chat_backend.calls
+        follow_up = await service.get_response("what is python", session_id="s1", background_cache=False)
+        assert not follow_up["response_from_cache"]
+        assert service.chat_backend.calls == calls + 1
+        # ...and its answer is kept as context only, never served to others
+        stored = embeddings.cache_storage[follow_up["cache_name"]]
+        assert "response" not in stored and follow_up["cache_name"] not in embeddings.query_index
+        assert len(service.sessions.history("s1")) == 4
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        asyncio.run(service.write_back.close())
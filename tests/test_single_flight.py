@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_identical_calls_share_one_computation():
+    async def scenario():
+        flight = SingleFlight()
+        runs = []
+        release = asyncio.Event()
+
+        async def compute():
+            runs.append(1)
+            await release.wait()
+            return "answer"
+
+        callers = [asyncio.create_task(flight.do("key", compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*callers)
+        assert len(runs) == 1
+        assert [result for result, _ in results] == ["answer"] * 5
+        assert [shared for _, shared in results] == [False, True, True, True, True]
+        assert flight.stats()["coalesced"] == 4 and flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_different_keys_and_later_calls_compute_again():
+    async def scenario():
+        flight = SingleFlight()
+        runs = []
+
+        async def compute(value):
+            runs.append(value)
+            await asyncio.sleep(0)
+            return value
+
+        results = await asyncio.gather(flight.do("a", lambda: compute("a")),
+                                       flight.do("b", lambda: compute("b")))
+        assert results == [("a", False), ("b", False)]
+        # The first flight is over, so the same key starts a new one
+        assert await flight.do("a", lambda: compute("a2")) == ("a2", False)
+        assert runs == ["a", "b", "a2"]
+
+    asyncio.run(scenario())
+
+
+def test_errors_reach_every_caller():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail),
+                                       return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert flight.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_a_departing_caller_does_not_cancel_the_others():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "answer"
+
+        leader = asyncio.create_task(flight.do("key", compute))
+        follower = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await follower == ("answer", True)
+
+    asyncio.run(scenario())
+
+
+def test_chat_service_collapses_concurrent_identical_messages(tmp_path, monkeypatch):
+    # The Banglish dictionary lives under data/ in the cwd
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LLM_BACKEND", "fake")
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("FAKE_CHAT_LATENCY", "constant:50")
+    monkeypatch.setenv("FAKE_EMBEDDING_LATENCY", "constant:0")
+    from chat_service import ChatService
+
+    async def scenario():
+        service = ChatService()
+        try:
+            results = await asyncio.gather(*(
+                service.get_response("same question", background_cache=False)
+                for _ in range(4)
+            ))
+            assert service.chat_backend.calls == 1
+            assert sorted(result["coalesced"] for result in results) == [False, True, True, True]
+            assert len({result["response"] for result in results}) == 1
+            # Each caller still gets its own conversation
+            assert len({result["conversation_id"] for result in results}) == 4
+
+            # Sessions with history are answered separately
+            for session in ("s1", "s2"):
+                service.sessions.record_turn(session, "hi", "hello")
+            calls = service.chat_backend.calls
+            results = await asyncio.gather(*(
+                service.get_response("follow up", session_id=session, background_cache=False)
+                for session in ("s1", "s2")
+            ))
+            assert service.chat_backend.calls == calls + 2
+            assert not any(result["coalesced"] for result in results)
+        finally:
+            await service.write_back.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+
+def test_stream_writes_back_a_full_answer(chat_service):
+    async def scenario():
+        try:
+            events = [event async for event in chat_service.stream_response("hello there", "s1")]
+            done = events[-1]
+            assert done["event"] == "done" and done["cache_pending"]
+            await chat_service.write_back.close()
+            assert done["cache_name"] in chat_service.embedding_service.cache_storage
+            assert "s1" in chat_service.sessions
+        finally:
+            await chat_service.write_back.close()
+
+    asyncio.run(scenario())
+
+
+def test_empty_stream_is_neither_recorded_nor_cached(chat_service, monkeypatch):
+    from chat_service import EMPTY_RESPONSE_MESSAGE
+
+    async def nothing(prompt, history):
+        return
+        yield
+
+    monkeypatch.setattr(chat_service.chat_backend, "stream", nothing)
+    submitted = []
+    monkeypatch.setattr(chat_service.write_back, "submit", lambda job: submitted.append(job))
+
+    async def scenario():
+        events = [event async for event in chat_service.stream_response("hello there", "s1")]
+        assert [event["event"] for event in events] == ["token", "done"]
+        assert events[0]["text"] == EMPTY_RESPONSE_MESSAGE
+        assert events[1]["cache_name"] is None and not events[1]["cache_pending"]
+        assert not submitted and "s1" not in chat_service.sessions
+
+    asyncio.run(scenario())
+
+
+def test_disconnect_cancels_the_banglish_correction(chat_service, monkeypatch):
+    release = threading.Event()
+
+    def slow_correction(text):
+        release.wait(5)
+        return text
+
+    monkeypatch.setattr(chat_service.banglish_service, "correct_text", slow_correction)
+    tasks = []
+    create_task = asyncio.create_task
+
+    def recording_create_task(coro, **kwargs):
+        task = create_task(coro, **kwargs)
+        tasks.append(task)
+        return task
+
+    async def scenario():
+        monkeypatch.setattr(asyncio, "create_task", recording_create_task)
+        stream = chat_service.stream_response("ami bhalo achi", "s1")
+        first = await stream.__anext__()
+        assert first["event"] == "token"
+        # The client goes away mid-answer
+        await stream.aclose()
+        monkeypatch.undo()
+        await asyncio.sleep(0)
+        try:
+            assert tasks and all(task.cancelled() for task in tasks)
+        finally:
+            release.set()
+            await chat_service.write_back.close()
+
+    asyncio.run(scenario())
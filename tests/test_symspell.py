@@ -0,0 +1,55 @@
+import random
+import string
+
+from rapidfuzz.distance import Levenshtein
+
+from symspell import DeletionIndex
+
+
+def random_words(count, rng):
+    return {"".join(rng.choice("abcdehiklmnoprstu") for _ in range(rng.randint(3, 12)))
+            for _ in range(count)}
+
+
+def mutate(word, edits, rng):
+    for _ in range(edits):
+        i = rng.randrange(len(word) + 1)
+        op = rng.choice(("insert", "delete", "replace"))
+        if op == "insert" or len(word) < 2:
+            word = word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+        elif op == "delete":
+            word = word[:i] + word[i + 1:]
+        else:
+            word = word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+    return word
+
+
+def test_candidates_include_every_word_within_the_distance():
+    rng = random.Random(0)
+    words = random_words(2000, rng)
+    index = DeletionIndex(words, max_distance=2, prefix_length=7)
+    queries = [mutate(rng.choice(sorted(words)), rng.randint(0, 2), rng) for _ in range(300)]
+    # The empty string is never a key, so the guarantee needs words longer than the distance
+    for query in (query for query in queries if len(query) > 2):
+        expected = {word for word in words if Levenshtein.distance(query, word) <= 2}
+        candidates = index.candidates(query)
+        assert expected <= candidates, query
+        # A pre-filter, not a scan of the dictionary
+        assert len(candidates) < len(words) // 4
+
+
+def test_long_words_match_through_their_prefix():
+    index = DeletionIndex(["bhalobasha", "bhalo"], prefix_length=5)
+    assert "bhalobasha" in index.candidates("bhalobasa")
+    assert "bhalobasha" in index.candidates("valobasha")
+
+
+def test_removed_words_are_no_longer_candidates():
+    index = DeletionIndex(["kemon", "keno"])
+    index.add("kemon")
+    assert len(index) == 2 and "kemon" in index
+    index.remove("kemon")
+    index.remove("missing")
+    assert "kemon" not in index.candidates("kemon") and "keno" in index.candidates("kemon")
+    index.remove("keno")
+    assert not index._deletes
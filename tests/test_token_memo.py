@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+import pytest
+
+from banglish_service import BanglishService
+from token_memo import TokenMemo
+
+
+def test_lru_eviction_and_counters():
+    memo = TokenMemo(max_entries=2)
+    memo.put("a", 1)
+    memo.put("b", 2)
+    assert memo.get("a") == 1  # "a" becomes the most recent
+    memo.put("c", 3)
+    assert memo.get("b") is None and memo.get("a") == 1 and memo.get("c") == 3
+    assert memo.stats()["hits"] == 3 and memo.stats()["misses"] == 1
+
+
+def test_values_computed_before_an_invalidation_are_dropped():
+    memo = TokenMemo()
+    generation = memo.generation
+    memo.discard("other")
+    memo.put("a", 1, generation)
+    assert memo.get("a") is None
+    memo.put("a", 1, memo.generation)
+    memo.clear()
+    assert len(memo) == 0 and memo.stats()["invalidations"] == 1
+
+
+def test_rejected_entries_count_as_misses():
+    memo = TokenMemo()
+    memo.put("a", (None, 0, None))
+    assert memo.get("a", lambda entry: entry[2] is not None) is None
+    assert memo.get("a") == (None, 0, None)
+    assert (memo.hits, memo.misses) == (1, 1)
+
+
+@pytest.fixture
+def banglish(tmp_path, monkeypatch):
+    monkeypatch.setenv("BANGLISH_RELOAD_CHECK_INTERVAL", "0")
+    path = tmp_path / "banglish_mapping.json"
+    path.write_text(json.dumps({"valo": "bhalo", "ame": "ami"}), encoding="utf-8")
+    return BanglishService(path)
+
+
+def test_suggestion_lookups_miss_on_correction_only_entries(banglish):
+    memo = banglish.token_memo
+    assert banglish.correct_text("ame valo") == "ami bhalo"
+    assert (memo.hits, memo.misses) == (0, 2)
+    # The memoized entries carry no suggestions, so these are misses too
+    assert asyncio.run(banglish.get_suggestions("ame valo"))
+    assert (memo.hits, memo.misses) == (0, 4)
+    # Now they do, and serve both kinds of lookup
+    asyncio.run(banglish.get_suggestions("ame valo"))
+    assert banglish.correct_text("ame valo") == "ami bhalo"
+    assert (memo.hits, memo.misses) == (4, 4)
+
+
+def test_learning_invalidates_only_what_it_changes(banglish):
+    memo = banglish.token_memo
+    banglish.correct_text("ame valo kemon valoo")
+    # A misspelling of a word the dictionary already knows: only its entry goes
+    banglish.add_correction("valoo", "bhalo")
+    assert len(memo) == 3 and memo.stats()["invalidations"] == 0
+    assert banglish.correct_text("valoo") == "bhalo"
+    banglish.add_correction("valo", "bhaalo")
+    assert len(memo) == 0 and memo.stats()["invalidations"] == 1
+    assert banglish.correct_text("valo") == "bhaalo"
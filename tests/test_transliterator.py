@@ -0,0 +1,17 @@
+from app.services.transliterator import Transliterator
+
+
+def test_long_a_is_a_single_vowel():
+    transliterator = Transliterator(known_words={})
+    assert transliterator.transliterate("aami") == "আমি"
+    assert transliterator.transliterate("baari") == "বারি"
+
+
+def test_known_words_win_over_phonetic_spelling():
+    assert Transliterator().transliterate("ami kemon") == "আমি কেমন"
+
+
+def test_conjuncts_final_o_and_digits():
+    transliterator = Transliterator(known_words={})
+    assert transliterator.transliterate("bolo") == "বলো"
+    assert transliterator.transliterate("bondhu 12") == "বন্ধু ১২"
@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+
+from vector_index import IVFIndex, VectorIndex
+
+DIM = 8
+
+
+class ManualExecutor:
+    """Holds submitted jobs until the test runs them"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        self.jobs.append((fn, args))
+
+    def run_all(self):
+        jobs, self.jobs = self.jobs, []
+        for fn, args in jobs:
+            fn(*args)
+
+
+def vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIM)).astype(np.float32)
+
+
+def assert_consistent(index: IVFIndex):
+    assert sum(len(cell) for cell in index._cells) == len(index)
+    for item_id, cell in index._assignment.items():
+        assert item_id in index._cells[cell]
+
+
+def test_training_runs_on_the_executor_and_swaps_in(tmp_path):
+    executor = ManualExecutor()
+    index = IVFIndex(min_train_size=64, train_executor=executor)
+    data = vectors(64)
+    for i, vec in enumerate(data):
+        index.add(f"id{i}", vec)
+    # Due, but only submitted: the flat partition keeps serving meanwhile
+    assert len(executor.jobs) == 1 and index.training and not index.trained
+    assert index.search(data[5], k=1)[0][0] == "id5"
+
+    executor.run_all()
+    assert index.trained and not index.training
+    assert len(index._cells) == 8  # sqrt(64)
+    assert index._centroids.shape == (8, DIM)
+    assert_consistent(index)
+    assert index.search(data[5], k=1, exact=True)[0][0] == "id5"
+
+
+def test_changes_during_training_are_replayed_into_the_new_partitions():
+    executor = ManualExecutor()
+    index = IVFIndex(min_train_size=64, train_executor=executor)
+    data = vectors(100)
+    for i in range(64):
+        index.add(f"id{i}", data[i])
+    assert index.training
+
+    for i in range(64, 100):
+        index.add(f"id{i}", data[i])        # added while training
+    for i in range(10):
+        index.remove(f"id{i}")              # removed while training
+    index.add("id20", data[99])             # replaced while training
+    index.remove("id30")
+    index.add("id30", data[98])             # removed, then added back
+    assert executor.jobs and len(index._changed_during_training) == 48
+
+    executor.run_all()
+    assert not index.training
+    assert set(index.ids()) == {f"id{i}" for i in range(10, 100)}
+    assert_consistent(index)
+    flat = VectorIndex()
+    for i in range(10, 100):
+        flat.add(f"id{i}", data[i])
+    flat.add("id20", data[99])
+    flat.add("id30", data[98])
+    for query in (data[99], data[98], data[50], data[70]):
+        expected = dict(flat.search(query, k=3))
+        assert dict(index.search(query, k=3, exact=True)) == pytest.approx(expected, abs=1e-5)
+    np.testing.assert_allclose(index._cells[index._assignment["id20"]].vector("id20"),
+                               data[99] / np.linalg.norm(data[99]), rtol=1e-6)
+
+
+def test_retraining_swaps_centroids_once_the_index_has_grown():
+    executor = ManualExecutor()
+    index = IVFIndex(min_train_size=64, retrain_factor=2.0, train_executor=executor)
+    data = vectors(200, seed=1)
+    for i in range(64):
+        index.add(f"id{i}", data[i])
+    executor.run_all()
+    first = index._centroids
+    for i in range(64, 127):
+        index.add(f"id{i}", data[i])
+    assert not executor.jobs  # not grown by retrain_factor yet
+    index.add("id127", data[127])
+    assert len(executor.jobs) == 1
+    # The old centroids keep routing adds and searches until the swap
+    index.add("id128", data[128])
+    assert index._centroids is first
+    assert index.search(data[128], k=1, exact=True)[0][0] == "id128"
+
+    executor.run_all()
+    assert index._centroids is not first
+    assert len(index._cells) == int(np.sqrt(128))
+    assert index._trained_size == 129
+    assert_consistent(index)
+
+
+def test_failed_training_keeps_the_current_partitions(monkeypatch):
+    executor = ManualExecutor()
+    index = IVFIndex(min_train_size=64, train_executor=executor)
+    for i, vec in enumerate(vectors(64)):
+        index.add(f"id{i}", vec)
+
+    def fail(ids, data):
+        raise MemoryError("no room")
+
+    monkeypatch.setattr(index, "_build", fail)
+    executor.run_all()
+    assert not index.training and not index.trained
+    assert len(index) == 64 and len(index._cells[0]) == 64
+
+
+def test_without_an_executor_training_is_synchronous():
+    index = IVFIndex(min_train_size=64)
+    for i, vec in enumerate(vectors(64)):
+        index.add(f"id{i}", vec)
+    assert index.trained and not index.training
+    assert_consistent(index)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_from_arrays_matches_row_by_row_adds(dtype):
+    data = vectors(50, seed=2) * 3
+    ids = [f"id{i}" for i in range(50)]
+    bulk = VectorIndex.from_arrays(ids, data, dtype=dtype)
+    rows = VectorIndex(dtype=dtype)
+    for item_id, vec in zip(ids, data):
+        rows.add(item_id, vec)
+    np.testing.assert_allclose(bulk.vectors(), rows.vectors(), atol=1e-6)
+    assert bulk.ids() == rows.ids()
+    assert bulk.search(data[7], k=1)[0][0] == "id7"
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_scores_stay_within_cosine_range(dtype):
+    data = vectors(200, seed=3)
+    index = VectorIndex.from_arrays([f"id{i}" for i in range(200)], data, dtype=dtype)
+    for vec in data:
+        scores = [score for _, score in index.search(vec, k=3)]
+        scores += [score for _, score in index.search(-vec, k=3)]
+        assert all(-1.0 <= score <= 1.0 for score in scores)
@@ -0,0 +1,65 @@
+import bisect
+from typing import Callable, Dict, List, Optional, Tuple
+
+TimelineKey = Tuple[float, str]
+
+
+class CreationTimeline:
+    """Ids kept sorted by (creation timestamp, id) for newest-first cursor paging.
+
+    New conversations arrive in time order, so adds are usually appends;
+    out-of-order adds and removals bisect into the sorted list.
+    """
+
+    def __init__(self):
+        self._keys: List[TimelineKey] = []
+        self._created: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._created
+
+    def rebuild(self, created: Dict[str, float]):
+        """Replace the contents with {id: created_at} in one sort"""
+        self._created = dict(created)
+        self._keys = sorted((created_at, item_id) for item_id, created_at in self._created.items())
+
+    def add(self, item_id: str, created_at: float):
+        if item_id in self._created:
+            self.discard(item_id)
+        key = (created_at, item_id)
+        self._created[item_id] = created_at
+        if not self._keys or key > self._keys[-1]:
+            self._keys.append(key)
+        else:
+            bisect.insort(self._keys, key)
+
+    def discard(self, item_id: str):
+        created_at = self._created.pop(item_id, None)
+        if created_at is None:
+            return
+        key = (created_at, item_id)
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            del self._keys[index]
+
+    def page(self, before: Optional[TimelineKey] = None, limit: int = 50,
+             skip: Optional[Callable[[str], bool]] = None) -> Tuple[List[str], Optional[TimelineKey]]:
+        """Up to `limit` ids older than `before` (newest first), and the cursor
+        key for the next page (None when nothing older remains)"""
+        index = len(self._keys) if before is None else bisect.bisect_left(self._keys, before)
+        ids = []
+        last_key = None
+        while index > 0 and len(ids) < limit:
+            index -= 1
+            key = self._keys[index]
+            if skip is not None and skip(key[1]):
+                continue
+            ids.append(key[1])
+            last_key = key
+        # Only hand out a cursor if a live entry is left below this page
+        while index > 0 and skip is not None and skip(self._keys[index - 1][1]):
+            index -= 1
+        return ids, (last_key if index > 0 else None)
@@ -0,0 +1,69 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Generic, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+class TokenMemo(Generic[V]):
+    """Thread-safe LRU memo bounded by `max_entries`, with hit/miss counters.
+
+    `clear()` drops every entry (e.g. when the data behind them changes) and
+    counts as an invalidation; `discard()` drops one. Both advance
+    `generation`: a value computed before either can be discarded by passing
+    the generation read at the start of the computation to `put`.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, V]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, accept: Optional[Callable[[V], bool]] = None) -> Optional[V]:
+        """The memoized value, or None; an entry `accept` rejects is a miss"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None or (accept is not None and not accept(value)):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: V, generation: Optional[int] = None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+            self.generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+            self.generation += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,442 @@
+import logging
+import math
+import threading
+import numpy as np
+from concurrent.futures import Executor
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_vector(embedding: Sequence[float]) -> np.ndarray:
+    """Return embedding as a unit-length float32 vector (zero vectors stay zero)"""
+    vec = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vec)
+    if norm > 0:
+        vec = vec / norm
+    return vec
+
+
+STORAGE_DTYPES = {
+    "float32": np.float32,
+    "float16": np.float16,
+    "int8": np.int8,
+}
+
+
+class VectorIndex:
+    """Exact cosine-similarity index over one contiguous matrix of float32, float16 or int8 rows"""
+
+    score_chunk = 4096
+
+    def __init__(self, dim: Optional[int] = None, initial_capacity: int = 1024,
+                 dtype: str = "float32"):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown storage dtype: {dtype}")
+        self.dim = dim
+        self.dtype = dtype
+        self._capacity = max(1, initial_capacity)
+        self._size = 0
+        self._matrix = np.empty((self._capacity, dim or 0), dtype=STORAGE_DTYPES[dtype])
+        self._scales = np.ones(self._capacity, dtype=np.float32)
+        self._ids = np.empty(self._capacity, dtype=object)
+        self._positions: Dict[str, int] = {}
+
+    @classmethod
+    def from_embeddings(cls, embeddings: Dict[str, Sequence[float]],
+                        dtype: str = "float32") -> "VectorIndex":
+        """Build an index from an id -> embedding mapping, skipping bad entries"""
+        index = cls(initial_capacity=max(1024, len(embeddings)), dtype=dtype)
+        for item_id, embedding in embeddings.items():
+            try:
+                index.add(item_id, embedding)
+            except ValueError as e:
+                logger.warning(f"Skipping embedding {item_id}: {e}")
+        return index
+
+    @classmethod
+    def from_arrays(cls, ids: Sequence[str], vectors: np.ndarray,
+                    dtype: str = "float32") -> "VectorIndex":
+        """Build an index from aligned ids and rows in one vectorized pass"""
+        index = cls(dim=vectors.shape[1], initial_capacity=max(16, 2 * len(ids)), dtype=dtype)
+        size = len(ids)
+        rows = vectors.astype(np.float32)
+        norms = np.linalg.norm(rows, axis=1, keepdims=True)
+        np.divide(rows, norms, out=rows, where=norms > 0)
+        if dtype == "int8":
+            peaks = np.abs(rows).max(axis=1) if size else np.empty(0, dtype=np.float32)
+            scales = np.where(peaks > 0, peaks / 127, 1.0).astype(np.float32)
+            index._matrix[:size] = np.round(rows / scales[:, None]).astype(np.int8)
+            index._scales[:size] = scales
+        else:
+            index._matrix[:size] = rows
+        index._ids[:size] = ids
+        index._positions = dict(zip(ids, range(size)))
+        index._size = size
+        return index
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._positions
+
+    def vector(self, item_id: str) -> Optional[np.ndarray]:
+        """The stored (normalized float32) row for item_id, or None"""
+        position = self._positions.get(item_id)
+        return None if position is None else self._decode(position, position + 1)[0]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the embedding matrix (allocated capacity)"""
+        scale_bytes = self._scales.nbytes if self.dtype == "int8" else 0
+        return self._matrix.nbytes + scale_bytes
+
+    def ids(self) -> List[str]:
+        return list(self._ids[:self._size])
+
+    def _decode(self, start: int, stop: int) -> np.ndarray:
+        block = self._matrix[start:stop]
+        if self.dtype == "float32":
+            return block
+        block = block.astype(np.float32)
+        if self.dtype == "int8":
+            block *= self._scales[start:stop, None]
+        return block
+
+    def vectors(self) -> np.ndarray:
+        """Normalized float32 rows, aligned with ids()"""
+        return self._decode(0, self._size)
+
+    def _encode(self, position: int, vec: np.ndarray):
+        if self.dtype == "int8":
+            peak = float(np.abs(vec).max())
+            scale = peak / 127 if peak > 0 else 1.0
+            self._matrix[position] = np.round(vec / scale).astype(np.int8)
+            self._scales[position] = scale
+        else:
+            self._matrix[position] = vec
+
+    def _grow(self, min_capacity: int):
+        capacity = self._capacity
+        while capacity < min_capacity:
+            capacity *= 2
+        matrix = np.empty((capacity, self.dim), dtype=self._matrix.dtype)
+        matrix[:self._size] = self._matrix[:self._size]
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[:self._size] = self._scales[:self._size]
+        ids = np.empty(capacity, dtype=object)
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._scales, self._ids, self._capacity = matrix, scales, ids, capacity
+
+    def add(self, item_id: str, embedding: Sequence[float]):
+        """Insert or replace the embedding stored under item_id"""
+        vec = normalize_vector(embedding)
+        if self.dim is None:
+            self.dim = vec.shape[0]
+            self._matrix = np.empty((self._capacity, self.dim), dtype=self._matrix.dtype)
+        if vec.shape[0] != self.dim:
+            raise ValueError(f"expected dimension {self.dim}, got {vec.shape[0]}")
+
+        position = self._positions.get(item_id)
+        if position is None:
+            if self._size == self._capacity:
+                self._grow(self._size + 1)
+            position = self._size
+            self._size += 1
+            self._ids[position] = item_id
+            self._positions[item_id] = position
+        self._encode(position, vec)
+
+    def remove(self, item_id: str) -> bool:
+        """Remove item_id from the index; returns False if it was not present"""
+        position = self._positions.pop(item_id, None)
+        if position is None:
+            return False
+        last = self._size - 1
+        if position != last:
+            moved_id = self._ids[last]
+            self._matrix[position] = self._matrix[last]
+            self._scales[position] = self._scales[last]
+            self._ids[position] = moved_id
+            self._positions[moved_id] = position
+        self._ids[last] = None
+        self._size = last
+        return True
+
+    def remove_many(self, item_ids: Iterable[str]) -> int:
+        return sum(1 for item_id in item_ids if self.remove(item_id))
+
+    def _scores(self, q: np.ndarray) -> np.ndarray:
+        if self.dtype == "float32":
+            return self._matrix[:self._size] @ q
+        scores = np.empty(self._size, dtype=np.float32)
+        for start in range(0, self._size, self.score_chunk):
+            stop = min(start + self.score_chunk, self._size)
+            scores[start:stop] = self._decode(start, stop) @ q
+        return scores
+
+    def search(self, query: Sequence[float], threshold: float = -1.0,
+               k: Optional[int] = None, exact: bool = True) -> List[Tuple[str, float]]:
+        """Return (id, cosine similarity) pairs above threshold, best first (always exact)"""
+        if self._size == 0 or (k is not None and k <= 0):
+            return []
+        q = normalize_vector(query)
+        if q.shape[0] != self.dim:
+            raise ValueError(f"expected dimension {self.dim}, got {q.shape[0]}")
+
+        scores = self._scores(q)
+        candidates = np.flatnonzero(scores > threshold)
+        if k is not None and len(candidates) > k:
+            top = np.argpartition(scores[candidates], -k)[-k:]
+            candidates = candidates[top]
+        order = candidates[np.argsort(scores[candidates])[::-1]]
+        # Rounding in float16/int8 rows can push a near-duplicate just past 1.0
+        return [(self._ids[i], score)
+                for i, score in zip(order, np.clip(scores[order], -1.0, 1.0).tolist())]
+
+
+def _spherical_kmeans(data: np.ndarray, nlist: int, iterations: int,
+                      rng: np.random.Generator) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity and return unit centroids"""
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        counts = np.bincount(assignment, minlength=nlist)
+        order = np.argsort(assignment, kind="stable")
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[nonempty]
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        centroids[nonempty] = sums
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.maximum(norms, 1e-12)
+    return centroids
+
+
+class IVFIndex:
+    """Approximate (IVF-flat) cosine index: VectorIndex partitions around k-means centroids"""
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8,
+                 min_train_size: int = 4096, retrain_factor: float = 4.0,
+                 kmeans_iterations: int = 10, max_train_sample: int = 65536,
+                 dtype: str = "float32", seed: int = 0,
+                 train_executor: Optional[Executor] = None):
+        self.nlist = nlist
+        self.dtype = dtype
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self.kmeans_iterations = kmeans_iterations
+        self.max_train_sample = max_train_sample
+        self._rng = np.random.default_rng(seed)
+        self._centroids: Optional[np.ndarray] = None
+        self._cells: List[VectorIndex] = [VectorIndex(dtype=dtype)]
+        self._assignment: Dict[str, int] = {}
+        self._trained_size = 0
+        self.train_executor = train_executor
+        # Guards the partitions against the background trainer's swap
+        self._lock = threading.RLock()
+        # Ids added or removed while a background training runs; None when idle
+        self._changed_during_training: Optional[Set[str]] = None
+
+    @classmethod
+    def from_embeddings(cls, embeddings: Dict[str, Sequence[float]], **kwargs) -> "IVFIndex":
+        """Build an index from an id -> embedding mapping, skipping bad entries"""
+        index = cls(**kwargs)
+        for item_id, embedding in embeddings.items():
+            try:
+                index.add(item_id, embedding, retrain=False)
+            except ValueError as e:
+                logger.warning(f"Skipping embedding {item_id}: {e}")
+        index._maybe_train(background=False)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._assignment)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._assignment
+
+    @property
+    def dim(self) -> Optional[int]:
+        return next((cell.dim for cell in self._cells if cell.dim is not None), None)
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    @property
+    def nbytes(self) -> int:
+        centroid_bytes = self._centroids.nbytes if self.trained else 0
+        return centroid_bytes + sum(cell.nbytes for cell in self._cells)
+
+    def ids(self) -> List[str]:
+        return list(self._assignment)
+
+    def _nearest_cell(self, vec: np.ndarray) -> int:
+        return int(np.argmax(self._centroids @ vec))
+
+    def add(self, item_id: str, embedding: Sequence[float], retrain: bool = True):
+        """Insert or replace the embedding stored under item_id"""
+        vec = normalize_vector(embedding)
+        with self._lock:
+            dim = self.dim
+            if dim is not None and vec.shape[0] != dim:
+                raise ValueError(f"expected dimension {dim}, got {vec.shape[0]}")
+
+            self._insert(item_id, vec)
+            if self._changed_during_training is not None:
+                self._changed_during_training.add(item_id)
+            if retrain:
+                self._maybe_train()
+
+    def _insert(self, item_id: str, vec: np.ndarray):
+        cell = self._nearest_cell(vec) if self.trained else 0
+        previous = self._assignment.get(item_id)
+        if previous is not None and previous != cell:
+            self._cells[previous].remove(item_id)
+        self._cells[cell].add(item_id, vec)
+        self._assignment[item_id] = cell
+
+    def remove(self, item_id: str) -> bool:
+        """Remove item_id from the index; returns False if it was not present"""
+        with self._lock:
+            cell = self._assignment.pop(item_id, None)
+            if cell is None:
+                return False
+            if self._changed_during_training is not None:
+                self._changed_during_training.add(item_id)
+            return self._cells[cell].remove(item_id)
+
+    def remove_many(self, item_ids: Iterable[str]) -> int:
+        return sum(1 for item_id in item_ids if self.remove(item_id))
+
+    @property
+    def training(self) -> bool:
+        """True while a background training is running"""
+        return self._changed_during_training is not None
+
+    def _maybe_train(self, background: bool = True):
+        size = len(self)
+        if size < self.min_train_size or self.training:
+            return
+        if self.trained and size < self._trained_size * self.retrain_factor:
+            return
+        if not background or self.train_executor is None:
+            self.train()
+            return
+        ids, data = self._snapshot()
+        self._changed_during_training = set()
+        try:
+            self.train_executor.submit(self._train_in_background, ids, data)
+        except Exception as e:
+            self._changed_during_training = None
+            logger.error(f"Could not start IVF training: {e}")
+
+    def _snapshot(self) -> Tuple[List[str], np.ndarray]:
+        ids: List[str] = []
+        blocks = []
+        for cell in self._cells:
+            ids.extend(cell.ids())
+            blocks.append(cell.vectors())
+        return ids, np.concatenate(blocks)
+
+    def _build(self, ids: List[str], data: np.ndarray) -> Tuple[np.ndarray, List[VectorIndex], Dict[str, int]]:
+        """Centroids, partitions and id -> partition for the given rows"""
+        nlist = self.nlist or max(1, int(math.sqrt(len(ids))))
+        nlist = min(nlist, len(ids))
+
+        sample = data
+        if len(data) > self.max_train_sample:
+            sample = data[self._rng.choice(len(data), self.max_train_sample, replace=False)]
+        centroids = _spherical_kmeans(sample, nlist, self.kmeans_iterations, self._rng)
+        assignment = np.argmax(data @ centroids.T, axis=1)
+
+        # Rows grouped by partition, so each one is built from a single slice
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=nlist))))
+        ordered_ids = np.asarray(ids, dtype=object)[order]
+        ordered_data = data[order]
+        cells = [
+            VectorIndex.from_arrays(ordered_ids[start:stop], ordered_data[start:stop], dtype=self.dtype)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        return centroids, cells, dict(zip(ids, assignment.tolist()))
+
+    def _swap(self, centroids: np.ndarray, cells: List[VectorIndex], assignment: Dict[str, int]):
+        with self._lock:
+            self._centroids = centroids
+            self._cells = cells
+            self._assignment = assignment
+            self._trained_size = len(assignment)
+        logger.info(f"Trained IVF index: {len(assignment)} vectors in {len(cells)} lists")
+
+    def train(self):
+        """(Re)build the partitions from every vector currently indexed"""
+        with self._lock:
+            ids, data = self._snapshot()
+            if ids:
+                self._swap(*self._build(ids, data))
+
+    def _train_in_background(self, ids: List[str], data: np.ndarray):
+        try:
+            centroids, cells, assignment = self._build(ids, data)
+            with self._lock:
+                # Replay what changed meanwhile against the live partitions
+                for item_id in self._changed_during_training:
+                    cell = assignment.pop(item_id, None)
+                    if cell is not None:
+                        cells[cell].remove(item_id)
+                    current = self._assignment.get(item_id)
+                    if current is None:
+                        continue
+                    vec = self._cells[current].vector(item_id)
+                    cell = int(np.argmax(centroids @ vec))
+                    cells[cell].add(item_id, vec)
+                    assignment[item_id] = cell
+                self._swap(centroids, cells, assignment)
+        except Exception as e:
+            logger.error(f"Background IVF training failed: {e}")
+        finally:
+            with self._lock:
+                self._changed_during_training = None
+
+    def search(self, query: Sequence[float], threshold: float = -1.0,
+               k: Optional[int] = None, exact: bool = False,
+               nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Return (id, cosine similarity) pairs above threshold, best first"""
+        with self._lock:
+            return self._search(query, threshold, k, exact, nprobe)
+
+    def _search(self, query: Sequence[float], threshold: float, k: Optional[int],
+                exact: bool, nprobe: Optional[int]) -> List[Tuple[str, float]]:
+        if not self.trained:
+            return self._cells[0].search(query, threshold=threshold, k=k)
+
+        q = normalize_vector(query)
+        if exact:
+            probe = np.arange(len(self._cells))
+        else:
+            nprobe = min(nprobe or self.nprobe, len(self._cells))
+            centroid_scores = self._centroids @ q
+            probe = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+
+        results: List[Tuple[str, float]] = []
+        for cell_no in probe:
+            results.extend(self._cells[cell_no].search(q, threshold=threshold, k=k))
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results if k is None else results[:k]
+
+
+def build_index(mode: str = "exact", embeddings: Optional[Dict[str, Sequence[float]]] = None,
+                **kwargs):
+    """Create a VectorIndex ("exact") or IVFIndex ("approximate")"""
+    embeddings = embeddings or {}
+    if mode == "exact":
+        return VectorIndex.from_embeddings(embeddings, dtype=kwargs.get("dtype", "float32"))
+    if mode == "approximate":
+        return IVFIndex.from_embeddings(embeddings, **kwargs)
+    raise ValueError(f"Unknown search mode: {mode}")
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBackQueue:
+    """Bounded queue of post-response jobs run by background workers.
+
+    `submit` waits for space when the queue is full, so producers slow down
+    instead of letting pending work grow without bound. Workers start on the
+    first submission (they need a running event loop).
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 256):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.blocked_submits = 0
+        self.running = 0
+
+    def _start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def submit(self, job: Callable[[], Awaitable]):
+        """Queue a job; blocks while the queue is full (backpressure)"""
+        if self._queue is None:
+            self._start()
+        if self._queue.full():
+            self.blocked_submits += 1
+        await self._queue.put(job)
+        self.submitted += 1
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self.running += 1
+            try:
+                await job()
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Write-back job failed: {e}")
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+
+    async def drain(self, timeout: Optional[float] = None):
+        """Wait until every queued job has finished"""
+        if self._queue is not None:
+            await asyncio.wait_for(self._queue.join(), timeout)
+
+    async def close(self, timeout: Optional[float] = 10.0):
+        """Finish pending jobs (up to timeout), then stop the workers"""
+        try:
+            await self.drain(timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self._queue.qsize()} pending write-back jobs")
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._queue = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self._queue.qsize() if self._queue else 0,
+            "max_pending": self.max_pending,
+            "running": self.running,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "blocked_submits": self.blocked_submits
+        }